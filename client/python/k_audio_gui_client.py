@@ -215,6 +215,7 @@ class KAudioClientApp(ctk.CTk):
 
         # --- Tag 配置 ---
         self.transcript_textbox.tag_config("error", foreground="red")
+        self.transcript_textbox.tag_config("partial", foreground="gray")
         self.translation_textbox.tag_config("error", foreground="red")
 
         # Initial state based on checkboxes
@@ -554,13 +555,33 @@ class KAudioClientApp(ctk.CTk):
         finally:
             self.after(100, self.process_gui_queue)
 
+    def clear_partial_transcript(self):
+        """移除轉錄框末尾尚未被 final 取代的中間結果 (需在 state="normal" 時調用)"""
+        ranges = self.transcript_textbox.tag_ranges("partial")
+        if ranges:
+            self.transcript_textbox.delete(ranges[0], ranges[-1])
+
+    def show_partial_transcript(self, message):
+        """在轉錄框末尾原地更新中間結果"""
+        self.transcript_textbox.configure(state="normal")
+        self.clear_partial_transcript()
+        text = message.get("text", "")
+        if text:
+            self.transcript_textbox.insert("end", f"... {text}\n", "partial")
+        self.transcript_textbox.configure(state="disabled")
+        self.transcript_textbox.see("end")
+
     def process_standard_message(self, message):
         msg_type = message.get("type")
         text = None
+        if msg_type == "partial":
+            self.show_partial_transcript(message)
+            return
         if msg_type == "final":
             text = message.get("text", "")
             lang = message.get("language", "unk")
             self.transcript_textbox.configure(state="normal")
+            self.clear_partial_transcript()
             self.transcript_textbox.insert("end", f"[{lang}] {text}\n")
             self.transcript_textbox.configure(state="disabled")
             self.transcript_textbox.see("end")
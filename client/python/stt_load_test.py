@@ -0,0 +1,294 @@
+"""
+多會話 WebSocket 串流轉錄壓力測試。
+
+以 stt_stream_client.py 相同的協議 (30 ms 的 16 kHz 16-bit PCM 二進位幀，結束時發送文本 "STREAM_END")
+在 N 個並行會話中重播 WAV 檔，按 1x (或 --speed 指定的倍速) 即時節奏發送，最後以 JSON 輸出:
+
+- 語音結束到 final 的延遲 p50/p95/p99: 從客戶端送出 final 的 `end` 時間點所在的音訊幀，
+  到收到該 final 的時間 (包含 VAD 判定靜音所需的等待，即使用者感受到的延遲)
+- 吞吐量: 每秒處理的音訊秒數、每秒 final 數
+- 丟幀: 發送進度落後排程超過 --max-send-lag-ms 時 (伺服器或網路跟不上)，
+  像實際麥克風的有界緩衝一樣丟棄過時的幀以追上進度
+- 錯誤率: 連接失敗、伺服器錯誤消息、異常關閉或等待結果逾時的會話比例
+
+用法:
+    python stt_load_test.py ws://<server_ip>:8000/v1/audio/transcriptions/ws ../../assets/test_audio_chinese.wav -c 8
+    python stt_load_test.py ws://localhost:8000/v1/audio/transcriptions/ws clips/ -c 32 --speed 2 -n 3 -o result.json
+
+WAV 檔會被轉成 16 kHz 單聲道 (需要時以線性插值重採樣)；也可以傳入目錄，使用其中所有 .wav 檔。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import time
+import wave
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List
+from urllib.parse import urlencode
+
+import numpy as np
+import websockets
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s [%(levelname)s] %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# --- 音訊參數 (與 stt_stream_client.py 相同，必須與伺服器設置匹配) ---
+SAMPLE_RATE = 16000
+MS_PER_FRAME = 30
+SAMPLES_PER_FRAME = int(SAMPLE_RATE * MS_PER_FRAME / 1000)
+FRAME_SEC = SAMPLES_PER_FRAME / SAMPLE_RATE
+
+
+def load_wav(path: Path) -> np.ndarray:
+    """讀取 PCM WAV 並轉為 16 kHz 單聲道 int16"""
+    with wave.open(str(path), "rb") as wav:
+        channels, sample_width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+    if sample_width == 2:
+        audio = np.frombuffer(raw, dtype=np.int16).astype(np.float32)
+    elif sample_width == 4:
+        audio = np.frombuffer(raw, dtype=np.int32).astype(np.float32) / 65536
+    elif sample_width == 1:
+        audio = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) * 256
+    else:
+        raise ValueError(f"{path}: unsupported sample width {sample_width * 8} bits")
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    if rate != SAMPLE_RATE:
+        target_length = int(len(audio) * SAMPLE_RATE / rate)
+        audio = np.interp(np.linspace(0, len(audio) - 1, target_length), np.arange(len(audio)), audio)
+    return np.clip(audio, -32768, 32767).astype(np.int16)
+
+
+def collect_wav_files(paths: List[str]) -> List[Path]:
+    files: List[Path] = []
+    for value in paths:
+        path = Path(value)
+        files.extend(sorted(path.glob("*.wav")) if path.is_dir() else [path])
+    if not files:
+        raise SystemExit("No WAV files found.")
+    return files
+
+
+@dataclass
+class Clip:
+    name: str
+    frames: List[bytes]
+
+    @property
+    def duration_sec(self) -> float:
+        return len(self.frames) * FRAME_SEC
+
+
+def prepare_clip(path: Path) -> Clip:
+    audio = load_wav(path)
+    padding = (-len(audio)) % SAMPLES_PER_FRAME
+    audio = np.concatenate([audio, np.zeros(padding, dtype=np.int16)])
+    return Clip(path.name, [frame.tobytes() for frame in audio.reshape(-1, SAMPLES_PER_FRAME)])
+
+
+@dataclass
+class SessionResult:
+    clip: str
+    audio_sec: float = 0.0 # 實際送出的音訊
+    frames_sent: int = 0
+    frames_dropped: int = 0
+    frames_late: int = 0 # 晚於排程一幀以上才送出 (但未被丟棄) 的幀
+    final_latencies_ms: List[float] = field(default_factory=list)
+    messages: Counter = field(default_factory=Counter)
+    error: str | None = None
+    wall_sec: float = 0.0
+
+
+def percentile(values: List[float], q: float) -> float | None:
+    return round(float(np.percentile(values, q)), 1) if values else None
+
+
+async def run_session(url: str, clip: Clip, speed: float, max_send_lag_sec: float, result_timeout: float) -> SessionResult:
+    """以一個 WebSocket 會話重播一段音訊並收集延遲與消息統計"""
+    result = SessionResult(clip.name)
+    sent_at: List[float] = [] # 每個已送出幀的送出時刻 (按伺服器收到的順序，即伺服器的音訊時間軸)
+    session_started_at = time.perf_counter()
+
+    async def send_audio(websocket):
+        started_at = time.perf_counter()
+        for index, frame in enumerate(clip.frames):
+            if speed > 0:
+                scheduled_at = started_at + index * FRAME_SEC / speed
+                delay = scheduled_at - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                elif max_send_lag_sec > 0 and -delay > max_send_lag_sec:
+                    result.frames_dropped += 1 # 落後太多: 像有界的麥克風緩衝一樣丟棄舊幀
+                    continue
+                elif -delay > FRAME_SEC:
+                    result.frames_late += 1
+            await websocket.send(frame)
+            sent_at.append(time.perf_counter())
+        result.frames_sent = len(sent_at)
+        result.audio_sec = len(sent_at) * FRAME_SEC
+        await websocket.send("STREAM_END")
+
+    async def receive_results(websocket):
+        async for message in websocket:
+            received_at = time.perf_counter()
+            try:
+                data = json.loads(message)
+            except (TypeError, json.JSONDecodeError):
+                result.messages["non_json"] += 1
+                continue
+            msg_type = data.get("type", "unknown")
+            result.messages[msg_type] += 1
+            if msg_type == "final" and sent_at:
+                # final 的 end 是伺服器音訊時間軸上的秒數，對應到送出該位置音訊的時刻
+                frame_index = min(max(math.ceil(float(data.get("end", 0.0)) / FRAME_SEC) - 1, 0), len(sent_at) - 1)
+                result.final_latencies_ms.append((received_at - sent_at[frame_index]) * 1000)
+            elif msg_type == "error" and result.error is None:
+                result.error = f"server error: {data.get('message', '')}"
+
+    try:
+        async with websockets.connect(url, open_timeout=30, max_size=None) as websocket:
+            receiver = asyncio.create_task(receive_results(websocket))
+            try:
+                await send_audio(websocket)
+                # STREAM_END 之後伺服器轉錄完剩餘音訊並關閉連接
+                await asyncio.wait_for(asyncio.shield(receiver), timeout=result_timeout)
+            except asyncio.TimeoutError:
+                result.error = f"timed out waiting {result_timeout:g}s for results after STREAM_END"
+            finally:
+                if not receiver.done():
+                    receiver.cancel()
+                    await asyncio.gather(receiver, return_exceptions=True)
+                elif receiver.exception() is not None:
+                    raise receiver.exception()
+    except websockets.exceptions.ConnectionClosedOK:
+        result.error = result.error or "connection closed by server before STREAM_END"
+    except websockets.exceptions.ConnectionClosedError as e:
+        result.error = result.error or f"connection closed abnormally: {e}"
+    except (OSError, websockets.exceptions.WebSocketException, asyncio.TimeoutError) as e:
+        result.error = result.error or f"connection failed: {type(e).__name__}: {e}"
+    result.wall_sec = time.perf_counter() - session_started_at
+    return result
+
+
+async def run_worker(worker_id: int, url: str, clips: List[Clip], args, results: List[SessionResult]):
+    await asyncio.sleep(worker_id * args.ramp_up / max(args.concurrency, 1)) # 錯開各會話的開始時間
+    for iteration in range(args.iterations):
+        clip = clips[(worker_id + iteration * args.concurrency) % len(clips)]
+        result = await run_session(url, clip, args.speed, args.max_send_lag_ms / 1000, args.result_timeout)
+        if result.error:
+            logger.warning(f"[worker {worker_id}] {clip.name}: {result.error}")
+        else:
+            logger.info(f"[worker {worker_id}] {clip.name}: {result.messages['final']} finals, "
+                        f"{result.frames_dropped} dropped frames, {result.wall_sec:.1f}s")
+        results.append(result)
+
+
+def summarize(results: List[SessionResult], wall_sec: float, args) -> Dict[str, Any]:
+    latencies = [latency for result in results for latency in result.final_latencies_ms]
+    failed = [result for result in results if result.error]
+    audio_sec = sum(result.audio_sec for result in results)
+    finals = sum(result.messages["final"] for result in results)
+    frames_sent = sum(result.frames_sent for result in results)
+    frames_dropped = sum(result.frames_dropped for result in results)
+    messages = Counter()
+    for result in results:
+        messages.update(result.messages)
+    return {
+        "label": args.label,
+        "started_at": args.started_at,
+        "client_host": platform.node(),
+        "config": {"url": args.server_url, "concurrency": args.concurrency, "iterations": args.iterations,
+                   "speed": args.speed, "ramp_up_sec": args.ramp_up, "max_send_lag_ms": args.max_send_lag_ms,
+                   "files": [Path(path).name for path in args.files]},
+        "sessions": {"total": len(results), "failed": len(failed),
+                     "error_rate": round(len(failed) / len(results), 4) if results else None},
+        "wall_sec": round(wall_sec, 2),
+        "throughput": {
+            "audio_sec": round(audio_sec, 2),
+            "audio_sec_per_sec": round(audio_sec / wall_sec, 3) if wall_sec else None,
+            "finals": finals,
+            "finals_per_sec": round(finals / wall_sec, 3) if wall_sec else None,
+        },
+        "end_of_speech_to_final_ms": {
+            "count": len(latencies),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "mean": round(float(np.mean(latencies)), 1) if latencies else None,
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+        "frames": {
+            "sent": frames_sent,
+            "dropped": frames_dropped,
+            "drop_rate": round(frames_dropped / (frames_sent + frames_dropped), 4) if frames_sent + frames_dropped else None,
+            "late": sum(result.frames_late for result in results),
+        },
+        "server_messages": dict(messages),
+        "errors": dict(Counter(result.error.split(":")[0] for result in failed)),
+    }
+
+
+async def main(args):
+    files = collect_wav_files(args.files)
+    clips = [prepare_clip(path) for path in files]
+    logger.info(f"Loaded {len(clips)} clip(s), {sum(clip.duration_sec for clip in clips):.1f}s of audio in total.")
+
+    query = {key: value for key, value in (("language", args.language), ("model", args.model)) if value}
+    if args.translate:
+        query.update({"translate": "true", "target_lang": args.target_lang})
+    url = args.server_url + ("?" + urlencode(query) if query else "")
+    logger.info(f"Starting {args.concurrency} concurrent session(s) x {args.iterations} iteration(s) against {url} at {args.speed:g}x speed")
+
+    args.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    results: List[SessionResult] = []
+    started_at = time.perf_counter()
+    await asyncio.gather(*(run_worker(worker_id, url, clips, args, results) for worker_id in range(args.concurrency)))
+    report = summarize(results, time.perf_counter() - started_at, args)
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+        logger.info(f"Report saved to: {args.output}")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Multi-session load test for the streaming STT WebSocket endpoint")
+    parser.add_argument("server_url", help="WebSocket server URL (e.g., ws://<your_server_ip>:8000/v1/audio/transcriptions/ws)")
+    parser.add_argument("files", nargs="+", help="WAV files or directories containing WAV files to replay.")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Number of concurrent sessions. Default: 4.")
+    parser.add_argument("-n", "--iterations", type=int, default=1, help="Sessions each worker runs back to back. Default: 1.")
+    parser.add_argument("-s", "--speed", type=float, default=1.0,
+                        help="Playback speed relative to real time (e.g., 2 = twice as fast, 0 = send as fast as possible). Default: 1.")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds over which session start times are spread. Default: 0.")
+    parser.add_argument("--max-send-lag-ms", type=float, default=1000.0,
+                        help="Drop frames once sending falls this far behind schedule, like a live microphone (0 = never drop). Default: 1000.")
+    parser.add_argument("--result-timeout", type=float, default=120.0,
+                        help="Seconds to wait for the server to finish after STREAM_END. Default: 120.")
+    parser.add_argument("-l", "--language", type=str, default=None, help="Language code (e.g., 'zh', 'en'). Default: auto-detect.")
+    parser.add_argument("-m", "--model", type=str, default=None, help="Server-side STT model name. Default: server default.")
+    parser.add_argument("--translate", action="store_true", help="Enable real-time translation (adds LLM load).")
+    parser.add_argument("--target-lang", type=str, default=None, help="Target language code for translation. Required if --translate is set.")
+    parser.add_argument("--label", type=str, default=None, help="Free-form label stored in the report (e.g., build or hardware).")
+    parser.add_argument("-o", "--output", type=str, default=None, help="Also write the JSON report to this file.")
+
+    args = parser.parse_args()
+    if args.translate and not args.target_lang:
+        parser.error("--target-lang is required when --translate is enabled")
+    if args.concurrency < 1 or args.iterations < 1:
+        parser.error("--concurrency and --iterations must be at least 1")
+
+    try:
+        asyncio.run(main(args))
+    except KeyboardInterrupt:
+        logger.info("KeyboardInterrupt received. Exiting...")
@@ -10,6 +10,7 @@ from pathlib import Path
 from datetime import datetime
 from rich.console import Console # <--- 導入 Rich Console
 from rich.text import Text      # <--- 導入 Rich Text (可選，用於更精確控制樣式)
+from rich.markup import escape
 
 # --- 基本設定 ---
 logging.basicConfig(
@@ -36,6 +37,8 @@ audio_queue = asyncio.Queue()
 stop_event = asyncio.Event()
 # 用於累積文字稿的列表
 transcript_parts = []
+# 目前終端上是否有一行尚未被 final 取代的中間結果
+partial_line_active = False
 # 保存文字稿的文件路徑
 # transcript_file_path: Path | None = None
 
@@ -105,6 +108,25 @@ async def sender(websocket):
          logger.info("Sender task finished.")
 
 
+# --- 中間結果的原地顯示 ---
+def render_partial(stable: str, unstable: str):
+    """在同一行原地重繪中間結果 (穩定部分正常顯示，不穩定尾巴以灰色顯示)"""
+    global partial_line_active
+    console.file.write("\r\033[K") # 回到行首並清除該行
+    console.print(f"[grey50]...[/grey50] {escape(stable)} [grey50]{escape(unstable)}[/grey50]", end="", highlight=False)
+    console.file.flush()
+    partial_line_active = True
+
+
+def clear_partial():
+    """清除中間結果行，讓後續輸出 (final 等) 從乾淨的行開始"""
+    global partial_line_active
+    if partial_line_active:
+        console.file.write("\r\033[K")
+        console.file.flush()
+        partial_line_active = False
+
+
 # --- 異步任務：接收伺服器訊息 ---
 async def receiver(websocket):
     """接收伺服器訊息，打印並累積最終文字稿"""
@@ -120,6 +142,12 @@ async def receiver(websocket):
 
                 msg_type = data.get("type")
 
+                if msg_type == "partial":
+                    # 中間結果原地更新，不累積到文字稿
+                    render_partial(data.get("stable_text", ""), data.get("unstable_text", ""))
+                    continue
+
+                clear_partial()
                 if msg_type == "final":
                     text = data.get("text", "")
                     lang = data.get("language", "unk")
@@ -0,0 +1,127 @@
+from fastapi import APIRouter, HTTPException, status, Body, Depends, Header
+from fastapi.responses import Response
+from pydantic import BaseModel, Field
+from typing import Literal
+import logging
+import secrets
+import time
+
+from ...services.stt_service import model_registry, start_stt_model_swap, UnknownModelError
+from ...services.loop_monitor import loop_monitor
+from ...services.profiler import ProfilerBusyError, capture_cpu_profile, capture_memory_profile
+from ...core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin_key(x_admin_key: str | None = Header(None)):
+    """
+    管理端點需要在 X-Admin-Key 標頭中提供 ADMIN_API_KEY 的值。
+    未設置 ADMIN_API_KEY 時管理 API 停用 (所有請求返回 403)，而不是對所有人開放。
+    """
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled. Set ADMIN_API_KEY to enable it.")
+    if x_admin_key is None or not secrets.compare_digest(x_admin_key.encode(), settings.admin_api_key.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or missing admin key.")
+
+
+router = APIRouter(
+    prefix="/v1/admin", # 管理端點前綴
+    tags=["Admin"],     # API 文件中的標籤
+    dependencies=[Depends(require_admin_key)],
+)
+
+# 剖析與阻塞記錄端點會影響整個服務的 CPU / 記憶體並暴露調用棧，在路由上再次聲明密鑰驗證，
+# 即使日後移到其他路由器下也不會失去保護 (同一請求內依賴結果會被緩存，不會重複執行)
+ADMIN_ONLY = [Depends(require_admin_key)]
+
+# --- 定義請求體模型 ---
+class ModelSwapRequest(BaseModel):
+    model_path: str = Field(..., description="新模型在伺服器上的路徑。", min_length=1)
+    compute_type: str | None = Field(None, description="新模型的計算精度 (例如 'int8_float16')，不指定則使用 STT_COMPUTE_TYPE。")
+    model: str | None = Field(None, description="要替換的模型名稱，不指定則替換默認模型。")
+
+
+class CPUProfileRequest(BaseModel):
+    seconds: float = Field(10.0, gt=0, le=settings.admin_profile_max_sec, description="採集秒數，請求在採集結束後才返回。")
+    sort: Literal["cumulative", "tottime", "calls", "ncalls", "time"] = Field("cumulative", description="函數排序方式。")
+    limit: int = Field(50, ge=1, le=1000, description="返回的函數數量。")
+    format: Literal["json", "pstats"] = Field("json", description="'pstats' 時返回可用 pstats / snakeviz 打開的原始 .prof 文件。")
+
+
+class MemoryProfileRequest(BaseModel):
+    seconds: float = Field(10.0, gt=0, le=settings.admin_profile_max_sec, description="採集秒數，請求在採集結束後才返回。")
+    key_type: Literal["lineno", "filename", "traceback"] = Field("lineno", description="統計分組方式。")
+    limit: int = Field(30, ge=1, le=500, description="返回的位置數量。")
+    frames: int = Field(1, ge=1, le=64, description="每次分配記錄的調用棧幀數 (僅在 tracemalloc 尚未啟用時生效)。")
+
+
+@router.post(
+    "/stt/model",
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Hot-swap STT Model",
+    description="在背景載入新的 STT 模型並在載入完成後原子地替換，進行中的片段在舊模型上完成。"
+)
+async def swap_stt_model(request: ModelSwapRequest = Body(...)):
+    logger.info(f"Received STT model swap request: model='{request.model}', path='{request.model_path}', compute_type='{request.compute_type}'")
+    try:
+        return start_stt_model_swap(request.model_path, request.compute_type, request.model)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except UnknownModelError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown model '{request.model}'.")
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+
+
+@router.get(
+    "/stt/model",
+    summary="STT Model Status",
+    description="返回已載入 / 正在釋放的模型、熱替換進度與進程記憶體使用。"
+)
+async def get_stt_model_status():
+    return model_registry.stats()
+
+
+@router.get(
+    "/loop/stalls",
+    dependencies=ADMIN_ONLY,
+    summary="Event Loop Stalls",
+    description="返回事件循環阻塞監測的統計與最近的阻塞記錄 (含阻塞當時事件循環線程的調用棧與任務)。"
+)
+async def get_loop_stalls():
+    return {**loop_monitor.stats(), "recent": loop_monitor.recent_stalls()}
+
+
+@router.post(
+    "/profile/cpu",
+    dependencies=ADMIN_ONLY,
+    summary="Capture CPU Profile",
+    description="在運行中的服務上以 cProfile 採集指定秒數，結束後返回最耗時的函數。同一時間只允許一個採集，需要 ADMIN_API_KEY。"
+)
+async def profile_cpu(request: CPUProfileRequest = Body(...)):
+    logger.info(f"Received CPU profile request: {request.seconds:g}s, sort={request.sort}, limit={request.limit}")
+    try:
+        result = await capture_cpu_profile(request.seconds, request.sort, request.limit)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    raw = result.pop("pstats")
+    if request.format == "pstats":
+        filename = f"kaudio-{time.strftime('%Y%m%d-%H%M%S')}.prof"
+        return Response(content=raw, media_type="application/octet-stream",
+                        headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+    return result
+
+
+@router.post(
+    "/profile/memory",
+    dependencies=ADMIN_ONLY,
+    summary="Capture Memory Profile",
+    description="以 tracemalloc 採集指定秒數，返回期間記憶體增長最多的程式碼位置。同一時間只允許一個採集，需要 ADMIN_API_KEY。"
+)
+async def profile_memory(request: MemoryProfileRequest = Body(...)):
+    logger.info(f"Received memory profile request: {request.seconds:g}s, key_type={request.key_type}, limit={request.limit}")
+    try:
+        return await capture_memory_profile(request.seconds, request.key_type, request.limit, request.frames)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
@@ -1,20 +1,31 @@
 import asyncio
+import time
 from fastapi import (
     APIRouter, UploadFile, File, Form, HTTPException,
     Depends, Request, WebSocket, WebSocketDisconnect, Query
 )
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import srt
+import json
 import logging
-from typing import Literal, Dict, Any
+from typing import Literal, Dict, Any, Iterable, Iterator, List
 from datetime import timedelta
 import numpy as np
 
 # 導入流式處理類和非流式函數
 from ...services.stt_service import (
-    transcribe_audio_file,
+    transcribe_audio_array,
+    stream_transcription,
     AudioTranscriptionStreamer,
+    model_registry,
+    UnknownModelError,
 )
+from ...services.audio_decode import AudioDecodeError, decode_audio_to_float32
+from ...services.stt_long_audio import transcribe_long_audio
+from ...services.stt_jobs import job_manager
+from ...services.stt_result_cache import compute_cache_key, result_cache
+from ...services.stt_stream_pipeline import StreamingSessionPipeline, get_detached_session
+from ...services.stt_executor import stt_executor, STTQueueFullError
 # --- 導入翻譯服務 ---
 from ...services import summary_service # 現在包含翻譯函數
 from ...core.config import settings
@@ -34,6 +45,35 @@ def format_timestamp(seconds: float) -> str:
     milliseconds = delta.microseconds // 1000
     return f"{hours:02}:{minutes:02}:{seconds:02}.{milliseconds:03d}"
 
+def format_srt_cue(index: int, segment: Dict[str, Any]) -> str:
+    """單個 SRT 字幕塊 (與 create_srt 中 srt.compose 的輸出一致)"""
+    return srt.Subtitle(
+        index=index,
+        start=timedelta(seconds=segment['start']),
+        end=timedelta(seconds=segment['end']),
+        content=segment['text']
+    ).to_srt()
+
+def iter_srt_cues(segments: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """逐塊產生 SRT 內容，可用於任意 (包括惰性的) 片段序列；空文本片段被跳過"""
+    index = 0
+    for segment in segments:
+        if segment['text'].strip():
+            index += 1
+            yield format_srt_cue(index, segment)
+
+VTT_HEADER = "WEBVTT\n"
+
+def format_vtt_cue(segment: Dict[str, Any]) -> str:
+    """單個 VTT 字幕塊 (VTT_HEADER 之後依序拼接即為 create_vtt 的輸出)"""
+    return f"\n{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}\n{segment['text']}\n"
+
+def iter_vtt_cues(segments: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    """逐塊產生 VTT 內容 (先是文件頭)，可用於任意 (包括惰性的) 片段序列"""
+    yield VTT_HEADER
+    for segment in segments:
+        yield format_vtt_cue(segment)
+
 def create_srt(segments: list) -> str:
     """根據 segments 生成 SRT 格式內容"""
     subs = []
@@ -47,42 +87,221 @@ def create_srt(segments: list) -> str:
 
 def create_vtt(segments: list) -> str:
     """根據 segments 生成 VTT 格式內容"""
-    lines = ["WEBVTT", ""]
-    for segment in segments:
-        start = format_timestamp(segment['start'])
-        end = format_timestamp(segment['end'])
-        lines.append(f"{start} --> {end}")
-        lines.append(segment['text'])
-        lines.append("")
-    return "\n".join(lines)
+    return "".join(iter_vtt_cues(segments))
+
+
+def encode_stream_event(event: Dict[str, Any], stream_format: str) -> str:
+    """將一個事件編碼為 NDJSON 行或 Server-Sent Event"""
+    payload = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {payload}\n\n"
+    return payload + "\n"
+
+
+def format_transcription_response(full_text: str, segments: list, info: Dict[str, Any], response_format: str):
+    """根據 response_format 格式化轉錄結果 (同步端點與任務結果端點共用)"""
+    if response_format == "json":
+        return {"text": full_text}
+    elif response_format == "verbose_json":
+        return {
+            "task": "transcribe", # OpenAI 格式
+            "language": info["language"],
+            "duration": info["duration"],
+            "text": full_text,
+            "segments": segments,
+            "processing_time": info.get("processing_sec"),
+            "real_time_factor": info.get("real_time_factor"), # 處理耗時 / 音訊時長
+            "chunks": info.get("chunks", 1),
+            "cached": info.get("cached", False), # 結果是否來自轉錄結果緩存
+        }
+    elif response_format == "text":
+        return PlainTextResponse(full_text)
+    elif response_format == "srt":
+        # 需要 srt 庫: pip install srt
+        # 確保 transcribe_audio 返回的 segments 包含 start, end, text
+        srt_content = create_srt(segments)
+        return PlainTextResponse(srt_content, media_type="text/plain") # 或者 application/x-subrip
+    elif response_format == "vtt":
+        vtt_content = create_vtt(segments)
+        return PlainTextResponse(vtt_content, media_type="text/vtt")
+    else:
+        # 理論上不會到這裡，因為有 Literal 約束
+        raise HTTPException(status_code=400, detail="Invalid response format")
+
+
+async def create_streaming_transcription(file: UploadFile, model: str, language: str | None, prompt: str | None,
+                                         response_format: str, stream_format: str) -> StreamingResponse:
+    """
+    stream=true: 解碼上傳內容後立即開始回應，每解碼出一段就送出。
+    srt / vtt 直接逐塊輸出字幕文本；其他格式輸出 NDJSON 或 SSE 事件:
+    info (語言/時長) -> segment ... -> done (統計) ，出錯時為 error。
+    與非流式請求共用結果緩存: 命中時以相同的事件順序重放緩存的結果，完整轉錄結束後寫入緩存。
+    為寫入緩存，伺服器會保留已送出的片段 (只含時間戳與文本)，但最多 STT_RESULT_CACHE_STREAM_MAX_SEGMENTS 個:
+    超過時丟棄並不寫入緩存，很長的文件因此不會在整個請求期間佔用與片段數成正比的記憶體。
+    """
+    stt_model = None
+    try:
+        stt_model = await model_registry.acquire(model)
+        audio_np = await stt_executor.run(decode_audio_to_float32, file.file, admission=True)
+        cache_key = await asyncio.to_thread(compute_cache_key, audio_np, model_registry.identity(stt_model), language, prompt)
+        cached = await result_cache.get(cache_key)
+    except Exception as e:
+        if stt_model is not None:
+            model_registry.release(stt_model)
+        if isinstance(e, UnknownModelError):
+            raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available models: {', '.join(model_registry.model_paths)}")
+        if isinstance(e, AudioDecodeError):
+            raise HTTPException(status_code=400, detail=str(e))
+        if isinstance(e, STTQueueFullError):
+            raise HTTPException(status_code=429, detail="STT service is busy. Please retry later.", headers={"Retry-After": str(e.retry_after)})
+        logger.error(f"Streaming transcription setup failed: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Internal server error during transcription: {e}")
+    finally:
+        await file.close()
+
+    async def events():
+        if cached is not None:
+            _, cached_segments, cached_info = cached
+            yield {"type": "info", **cached_info, "cached": True}
+            for segment in cached_segments:
+                yield {"type": "segment", **segment}
+            return
+        info: Dict[str, Any] = {}
+        max_segments = settings.stt_result_cache_stream_max_segments
+        segments: List[Dict[str, Any]] | None = [] if max_segments > 0 else None
+        async for event in stream_transcription(audio_np, language, prompt, stt_model):
+            if event["type"] == "info":
+                info = {key: value for key, value in event.items() if key != "type"}
+                yield {**event, "cached": False}
+                continue
+            if segments is not None:
+                if len(segments) < max_segments:
+                    segments.append({"start": event["start"], "end": event["end"], "text": event["text"]})
+                else:
+                    segments = None # 片段太多，不再保留也不寫入緩存
+            yield event
+        if segments is None:
+            return
+        # 只有完整轉錄 (客戶端未提前斷開、未出錯) 時才寫入緩存
+        await result_cache.put(cache_key, (" ".join(segment["text"] for segment in segments), segments, info))
+
+    async def body():
+        started_at = time.perf_counter()
+        segment_count = 0
+        info: Dict[str, Any] = {}
+        try:
+            if response_format == "vtt":
+                yield VTT_HEADER
+            async for event in events():
+                if event["type"] == "info":
+                    info = event
+                    if response_format in ("json", "verbose_json", "text"):
+                        yield encode_stream_event(event, stream_format)
+                    continue
+                if response_format == "srt":
+                    if event["text"]:
+                        segment_count += 1
+                        yield format_srt_cue(segment_count, event)
+                elif response_format == "vtt":
+                    segment_count += 1
+                    yield format_vtt_cue(event)
+                else:
+                    segment_count += 1
+                    yield encode_stream_event(event, stream_format)
+
+            processing_sec = time.perf_counter() - started_at
+            duration = info.get("duration") or 0.0
+            logger.info(f"Streamed {segment_count} segments for {duration:.1f}s of audio in {processing_sec:.2f}s (cached: {info.get('cached', False)}).")
+            if response_format in ("json", "verbose_json", "text"):
+                yield encode_stream_event({
+                    "type": "done",
+                    "segments": segment_count,
+                    "duration": duration,
+                    "processing_time": round(processing_sec, 3),
+                    "real_time_factor": round(processing_sec / duration, 4) if duration > 0 else None,
+                }, stream_format)
+        except Exception as e:
+            logger.error(f"Streaming transcription failed: {e}", exc_info=True)
+            if response_format in ("json", "verbose_json", "text"):
+                yield encode_stream_event({"type": "error", "message": str(e)}, stream_format)
+        finally:
+            model_registry.release(stt_model)
+
+    if response_format == "srt":
+        media_type = "text/plain"
+    elif response_format == "vtt":
+        media_type = "text/vtt"
+    else:
+        media_type = "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @router.post("/transcriptions", name="create_transcription")
 async def create_transcription_endpoint(
     request: Request,
     file: UploadFile = File(...),
-    model: str = Form("whisper-1"), # 忽略
+    model: str = Form("whisper-1"), # "whisper-1" 使用默認模型，其他值需在 STT_MODELS 中配置
     language: str | None = Form(None),
     prompt: str | None = Form(None),
     response_format: Literal["json", "text", "srt", "vtt", "verbose_json"] = Form("json"),
-    temperature: float = Form(0.0) # 忽略
+    temperature: float = Form(0.0), # 忽略
+    stream: bool = Form(False), # 逐段流式返回結果
+    stream_format: Literal["ndjson", "sse"] = Form("ndjson") # stream=true 且非 srt/vtt 時的事件格式
 ):
     model_loaded = getattr(request.app.state, 'stt_model_loaded', False)
     if not model_loaded:
         logger.error("Transcription endpoint called but STT model is not loaded (checked via app.state).")
         raise HTTPException(status_code=503, detail="STT service is not available. Model not loaded.")
 
-    logger.info(f"Received non-streaming request: filename='{file.filename}'...")
+    if stream:
+        logger.info(f"Received streaming file request: filename='{file.filename}', model='{model}', format='{response_format}'...")
+        return await create_streaming_transcription(file, model, language, prompt, response_format, stream_format)
 
+    logger.info(f"Received non-streaming request: filename='{file.filename}', model='{model}'...")
+
+    stt_model = None
     try:
-        # *** 修改點: 調用非流式函數 ***
-        loop = asyncio.get_running_loop()
-        full_text, segments, info = await loop.run_in_executor(
-            None,
-            transcribe_audio_file, # <--- 調用這個函數
-            file.file,
-            language,
-            prompt
+        # 按名稱取得模型 (首次使用時才載入)
+        stt_model = await model_registry.acquire(model)
+        # 在 STT 專用執行引擎中解碼上傳內容，隊列已滿時直接拒絕
+        audio_np = await stt_executor.run(decode_audio_to_float32, file.file, admission=True)
+        started_at = time.perf_counter()
+        # 先查結果緩存 (鍵包含解碼後的音訊，與上傳文件的容器格式無關)
+        cache_key = await asyncio.to_thread(compute_cache_key, audio_np, model_registry.identity(stt_model), language, prompt)
+        cached = await result_cache.get(cache_key)
+        if cached is not None:
+            full_text, segments, info = cached
+            info = {**info, "cached": True}
+        else:
+            threshold_sec = settings.stt_long_audio_threshold_sec
+            if threshold_sec > 0 and len(audio_np) / 16000 > threshold_sec:
+                # 長文件: 在靜音處切塊並行轉錄
+                full_text, segments, info = await transcribe_long_audio(audio_np, language, prompt, stt_model)
+            else:
+                full_text, segments, info = await stt_executor.run(
+                    transcribe_audio_array,
+                    audio_np,
+                    language,
+                    prompt,
+                    stt_model,
+                )
+            await result_cache.put(cache_key, (full_text, segments, info))
+            info = {**info, "cached": False}
+        del audio_np
+        processing_sec = time.perf_counter() - started_at
+        audio_sec = info["duration"] or 0.0
+        info["processing_sec"] = round(processing_sec, 3)
+        info["real_time_factor"] = round(processing_sec / audio_sec, 4) if audio_sec > 0 else None
+        logger.info(f"Transcribed {audio_sec:.1f}s of audio in {processing_sec:.2f}s (RTF {info['real_time_factor']}, cached: {info['cached']}).")
+    except UnknownModelError:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available models: {', '.join(model_registry.model_paths)}")
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except STTQueueFullError as e:
+        raise HTTPException(
+            status_code=429,
+            detail="STT service is busy. Please retry later.",
+            headers={"Retry-After": str(e.retry_after)}
         )
     except ValueError as e:
          # Handle cases like model not loaded error from service layer
@@ -92,35 +311,74 @@ async def create_transcription_endpoint(
         logger.error(f"Transcription failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Internal server error during transcription: {e}")
     finally:
-        # 確保文件被關閉 (FastAPI 通常會處理，但明確關閉更好)
+         if stt_model is not None:
+             model_registry.release(stt_model)
+         # 確保文件被關閉 (FastAPI 通常會處理，但明確關閉更好)
          await file.close()
          logger.info(f"Closed uploaded file: {file.filename}")
 
 
-    # 根據 response_format 格式化輸出
-    if response_format == "json":
-        return {"text": full_text}
-    elif response_format == "verbose_json":
-        return {
-            "task": "transcribe", # OpenAI 格式
-            "language": info["language"],
-            "duration": info["duration"],
-            "text": full_text,
-            "segments": segments,
-        }
-    elif response_format == "text":
-        return PlainTextResponse(full_text)
-    elif response_format == "srt":
-        # 需要 srt 庫: pip install srt
-        # 確保 transcribe_audio 返回的 segments 包含 start, end, text
-        srt_content = create_srt(segments)
-        return PlainTextResponse(srt_content, media_type="text/plain") # 或者 application/x-subrip
-    elif response_format == "vtt":
-        vtt_content = create_vtt(segments)
-        return PlainTextResponse(vtt_content, media_type="text/vtt")
-    else:
-        # 理論上不會到這裡，因為有 Literal 約束
-        raise HTTPException(status_code=400, detail="Invalid response format")
+    return format_transcription_response(full_text, segments, info, response_format)
+
+
+# --- 非同步轉錄任務 ---
+@router.post("/transcriptions/jobs", name="create_transcription_job", status_code=202)
+async def create_transcription_job_endpoint(
+    request: Request,
+    file: UploadFile = File(...),
+    model: str = Form("whisper-1"),
+    language: str | None = Form(None),
+    prompt: str | None = Form(None),
+):
+    """將上傳內容暫存到磁碟並加入任務隊列，立即返回任務 ID；結果可稍後以任意 response_format 取得"""
+    try:
+        model_name = model_registry.resolve_name(model)
+    except UnknownModelError:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'. Available models: {', '.join(model_registry.model_paths)}")
+    try:
+        job = await job_manager.submit(file.file, file.filename, model_name, language, prompt)
+    except Exception as e:
+        logger.error(f"Failed to queue transcription job: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Failed to queue transcription job: {e}")
+    finally:
+        await file.close()
+    if not getattr(request.app.state, 'stt_model_loaded', False):
+        job["detail"] = "STT model is not ready yet; the job will start once it is."
+    return job
+
+
+@router.get("/transcriptions/jobs/{job_id}", name="get_transcription_job")
+async def get_transcription_job_endpoint(job_id: str):
+    """返回任務狀態與進度 (0-1)"""
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
+
+@router.get("/transcriptions/jobs/{job_id}/result", name="get_transcription_job_result")
+async def get_transcription_job_result_endpoint(
+    job_id: str,
+    response_format: Literal["json", "text", "srt", "vtt", "verbose_json"] = Query("json"),
+):
+    """以指定格式返回已完成任務的結果，未完成時返回 409"""
+    job = job_manager.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    result = job_manager.result(job_id)
+    if result is None:
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is {job['status']}, no result available.")
+    return format_transcription_response(result["text"], result["segments"], result["info"], response_format)
+
+
+@router.post("/transcriptions/jobs/{job_id}/cancel", name="cancel_transcription_job")
+async def cancel_transcription_job_endpoint(job_id: str):
+    """取消排隊中或執行中的任務 (執行中的任務在當前片段之後停止)"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return job
+
 
 # --- 新增: WebSocket 流式端點 ---
 @router.websocket("/transcriptions/ws")
@@ -128,14 +386,26 @@ async def websocket_transcription_endpoint(
     websocket: WebSocket,
     language: str | None = None, # 可以通過查詢參數傳遞配置
     prompt: str | None = None,
+    model: str | None = Query(None, description="使用的 STT 模型名稱 (未指定時使用默認模型)。"),
     # --- 新增：翻譯相關參數 ---
     translate: bool = Query(False, description="是否啟用即時翻譯功能。"),
     target_lang: str | None = Query(None, description="目標翻譯語言代碼 (例如 'en', 'ja')。啟用翻譯時必需。"),
-    source_lang: str | None = Query(None, description="源語言代碼 (可選，若不指定則使用 Whisper 檢測結果)。")
+    source_lang: str | None = Query(None, description="源語言代碼 (可選，若不指定則使用 Whisper 檢測結果)。"),
+    session_id: str | None = Query(None, description="斷線後在寬限期內重新連接的會話 ID (其餘參數沿用原會話)。")
 ):
     await websocket.accept()
     logger.info(f"WebSocket connection accepted from {websocket.client.host}:{websocket.client.port}")
-    logger.info(f"Connection options: language='{language}', prompt='{prompt}', translate={translate}, target_lang='{target_lang}', source_lang='{source_lang}'")
+
+    # 重新連接: 接回仍在寬限期內的會話 (模型綁定、翻譯設置與排隊中的結果都保留在原會話中)
+    if session_id:
+        session = get_detached_session(session_id)
+        if session is None:
+            logger.warning(f"Reconnection to unknown or expired session '{session_id}'.")
+            await websocket.close(code=1008, reason="Unknown or expired session")
+            return
+        await session.attach(websocket)
+        return
+    logger.info(f"Connection options: model='{model}', language='{language}', prompt='{prompt}', translate={translate}, target_lang='{target_lang}', source_lang='{source_lang}'")
 
     # 檢查模型是否加載
     model_loaded = getattr(websocket.app.state, 'stt_model_loaded', False)
@@ -150,6 +420,18 @@ async def websocket_transcription_endpoint(
         logger.error("Translation enabled but target_lang not specified.")
         await websocket.close(code=1008, reason="target_lang is required when translate=true") # 1008 = Policy Violation
         return
+
+    # 綁定會話使用的模型 (首次使用時才載入)，會話結束時解除
+    try:
+        session_model_name = await model_registry.pin(model)
+    except UnknownModelError:
+        logger.error(f"WebSocket requested unknown model '{model}'.")
+        await websocket.close(code=1008, reason=f"Unknown model '{model}'")
+        return
+    except Exception as e:
+        logger.error(f"Failed to load STT model '{model}': {e}", exc_info=True)
+        await websocket.close(code=1011, reason="STT model could not be loaded")
+        return
     
 
     # --- 新增：異步輔助函數，用於執行翻譯並發送結果 ---
@@ -163,88 +445,47 @@ async def websocket_transcription_endpoint(
         translation = await summary_service.get_translation_from_llm(text, lang_to_use, target_lang)
 
         if translation:
-            try:
-                await websocket.send_json({
-                    "type": "translation",
-                    "original_text": text,
-                    "translated_text": translation,
-                    "source_lang": lang_to_use,
-                    "target_lang": target_lang
-                })
-                logger.info("Translation sent to client.")
-            except websockets.exceptions.ConnectionClosed:
-                logger.warning("Could not send translation, connection closed.")
-            except Exception as e:
-                logger.error(f"Error sending translation to client: {e}", exc_info=True)
+            # 經由流水線的發送任務寫出，與轉錄結果不會並發寫入同一個 WebSocket
+            pipeline.send({
+                "type": "translation",
+                "original_text": text,
+                "translated_text": translation,
+                "source_lang": lang_to_use,
+                "target_lang": target_lang
+            })
+            logger.info("Translation queued for client.")
         else:
              logger.warning("Translation failed or returned empty.")
              # 可以選擇是否發送錯誤訊息給客戶端
              # await websocket.send_json({"type": "error", "message": "Translation failed"})
 
+    pipeline = None
     try:
         # 創建流式處理器實例
-        streamer = AudioTranscriptionStreamer(language=language, initial_prompt=prompt)
+        streamer = AudioTranscriptionStreamer(language=language, initial_prompt=prompt, model_name=session_model_name)
         logger.info("AudioTranscriptionStreamer created for WebSocket connection.")
 
-        # 循環接收音訊數據
-        while True:
-            try:
-                # data 可能包含 bytes (音訊) 或 str (控制訊息)
-                data = await websocket.receive()
-
-                if "bytes" in data:
-                    chunk = data["bytes"]
-                    # 處理音訊塊並獲取結果
-                    async for result in streamer.process_audio_chunk(chunk):
-                        # **首先發送原始結果 (final/info/error)**
-                        await websocket.send_json(result)
-
-                        # **如果結果是 final 且啟用了翻譯，則觸發翻譯任務**
-                        if result.get("type") == "final" and translate:
-                            original_text = result.get("text")
-                            detected_lang = result.get("language") # Whisper 檢測到的語言
-                            if original_text and target_lang: # 確保有文本和目標語言
-                                # *** 創建一個異步任務來處理翻譯，不阻塞主循環 ***
-                                asyncio.create_task(translate_and_send(original_text, detected_lang))
-                            elif not target_lang:
-                                # 這不應該發生，因為前面檢查過了
-                                logger.warning("Translation enabled but target_lang is missing.")
-
-
-                elif "text" in data:
-                    # ... (處理 STREAM_END 等文本消息 - 保持不變) ...
-                    message = data["text"]
-                    logger.info(f"Received text message: {message}")
-                    if message == "STREAM_END":
-                        logger.info("Received stream end signal.")
-                        break
-                    else:
-                         await websocket.send_json({"type": "info", "message": f"Received unknown text message: {message}"})
-
-            except WebSocketDisconnect:
-                logger.info(f"WebSocket disconnected by client {websocket.client.host}:{websocket.client.port}")
-                break
-            except Exception as e:
-                 logger.error(f"Error during WebSocket communication loop: {e}", exc_info=True)
-                 try: # 嘗試發送錯誤
-                     await websocket.send_json({"type": "error", "message": f"Server processing error: {e}"})
-                 except: pass
-                 break
-
-        # WebSocket 接收循環結束 (客戶端斷開或收到結束信號)
-        logger.info("Processing any remaining audio in buffer...")
-        async for result in streamer.stream_complete():
-            await websocket.send_json(result)
-            # 如果最後一段也需要翻譯
-            if result.get("type") == "final" and translate:
-                original_text = result.get("text")
-                detected_lang = result.get("language")
-                if original_text and target_lang:
-                    asyncio.create_task(translate_and_send(original_text, detected_lang))
+        def on_final(result: Dict[str, Any]):
+            # **如果結果是 final 且啟用了翻譯，則觸發翻譯任務**
+            if translate and target_lang and result.get("text"):
+                # *** 創建一個異步任務來處理翻譯，不阻塞推理階段 (由會話追蹤，斷開時取消) ***
+                pipeline.start_translation(translate_and_send(result["text"], result.get("language")))
 
+        # 接收、VAD 與推理分別在各自的任務中執行，以有界隊列連接；推理期間仍持續接收音訊
+        pipeline = StreamingSessionPipeline(websocket, streamer, on_final=on_final)
+        try:
+            await pipeline.run()
+        except Exception as e:
+            logger.error(f"Error during WebSocket streaming pipeline: {e}", exc_info=True)
+            if not pipeline.disconnected:
+                try: # 嘗試發送錯誤
+                    await pipeline.websocket.send_json({"type": "error", "message": f"Server processing error: {e}"})
+                except Exception:
+                    pass
 
+        # 關閉會話目前使用的連接 (可能是重新連接後的 WebSocket)
         logger.info("Closing WebSocket connection.")
-        await websocket.close()
+        await pipeline.close()
 
     except ValueError as e:
         # Handle cases like model not loaded during streamer initialization
@@ -257,4 +498,6 @@ async def websocket_transcription_endpoint(
         try:
             await websocket.close(code=1011, reason="Unexpected server error")
         except:
-            pass # Ignore errors during close if connection already broke
\ No newline at end of file
+            pass # Ignore errors during close if connection already broke
+    finally:
+        model_registry.unpin(session_model_name)
\ No newline at end of file
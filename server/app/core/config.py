@@ -9,6 +9,133 @@ class Settings(BaseSettings):
     stt_device: str = Field(default="cuda", validation_alias="STT_DEVICE") # "cuda" or "cpu"
     stt_compute_type: str = Field(default="float16", validation_alias="STT_COMPUTE_TYPE") # e.g., "float16", "int8_float16", "int8" (GPU); "int8", "float32" (CPU)
 
+    # --- STT 後端 ---
+    # "faster_whisper" 或 "stub" (不載入模型的確定性模擬後端，用於 CI 與流水線開銷的基準測試)
+    stt_backend: str = Field(default="faster_whisper", validation_alias="STT_BACKEND")
+    # stub 後端每次解碼的固定延遲 (毫秒) 與按音訊長度計的模擬 RTF (解碼耗時 = 固定延遲 + RTF × 音訊秒數)
+    stt_stub_latency_ms: float = Field(default=50.0, ge=0, validation_alias="STT_STUB_LATENCY_MS")
+    stt_stub_rtf: float = Field(default=0.05, ge=0, validation_alias="STT_STUB_RTF")
+    # stub 後端每個輸出片段涵蓋的音訊秒數
+    stt_stub_segment_sec: float = Field(default=5.0, gt=0, validation_alias="STT_STUB_SEGMENT_SEC")
+
+    # --- 多模型 ---
+    # 額外可選的模型，格式 "name=path,name=path" (例如 "small=/app/models/faster-whisper-small")，
+    # 請求時以 model 參數選擇；默認模型 (STT_MODEL_PATH) 以其目錄名登記
+    stt_models: str = Field(default="", validation_alias="STT_MODELS")
+    # 已載入模型的記憶體預算 (MB，按模型文件大小估算)，超過時按 LRU 卸載，設為 0 則不限制
+    stt_model_memory_budget_mb: float = Field(default=0.0, validation_alias="STT_MODEL_MEMORY_BUDGET_MB")
+    # 非默認模型閒置多少秒後自動卸載，設為 0 則不卸載
+    stt_model_idle_timeout_sec: float = Field(default=600.0, validation_alias="STT_MODEL_IDLE_TIMEOUT_SEC")
+
+    # --- 模型預熱 ---
+    # 模型載入後、就緒前先以合成音訊解碼數次，避免首個真實請求承擔冷啟動開銷
+    stt_warmup_enabled: bool = Field(default=True, validation_alias="STT_WARMUP_ENABLED")
+    # 預熱使用的合成音訊長度 (秒，逗號分隔)
+    stt_warmup_durations_sec: str = Field(default="1,5,15", validation_alias="STT_WARMUP_DURATIONS_SEC")
+
+    # --- 跨會話批次推理排程 ---
+    # 在此窗口內收集各 WebSocket 會話的語音片段並合併為一批解碼 (毫秒)，設為 0 則不等待
+    stt_batch_window_ms: float = Field(default=30.0, validation_alias="STT_BATCH_WINDOW_MS")
+    stt_batch_max_size: int = Field(default=8, validation_alias="STT_BATCH_MAX_SIZE") # 單批最多片段數，設為 1 則停用批次
+
+    # --- STT 執行引擎 ---
+    # 專用線程池大小，同時作為 faster-whisper 的 num_workers (可並行執行的轉錄數)
+    stt_num_workers: int = Field(default=2, validation_alias="STT_NUM_WORKERS")
+    # 等待中的轉錄工作上限，超過時新的文件上傳會收到 429
+    stt_max_pending_jobs: int = Field(default=8, validation_alias="STT_MAX_PENDING_JOBS")
+
+    # --- 長文件並行轉錄 ---
+    # 上傳音訊超過此長度 (秒) 時切成區塊並行轉錄，設為 0 則停用
+    stt_long_audio_threshold_sec: float = Field(default=300.0, validation_alias="STT_LONG_AUDIO_THRESHOLD_SEC")
+    # 每個區塊的目標長度 (秒)，實際切點落在目標之前最安靜的位置
+    stt_long_audio_chunk_sec: float = Field(default=120.0, validation_alias="STT_LONG_AUDIO_CHUNK_SEC")
+    # 在目標切點之前多少秒的範圍內尋找靜音
+    stt_long_audio_split_search_sec: float = Field(default=10.0, validation_alias="STT_LONG_AUDIO_SPLIT_SEARCH_SEC")
+    # 同時轉錄的區塊數。區塊與流式會話共用 STT 執行引擎的線程 (STT_NUM_WORKERS 個)，
+    # 設為 0 則為 STT_NUM_WORKERS - 1 (至少 1)，保留一個線程給流式解碼
+    stt_long_audio_parallelism: int = Field(default=0, validation_alias="STT_LONG_AUDIO_PARALLELISM")
+
+    # --- 非同步轉錄任務 ---
+    # 任務資料庫 (SQLite) 與暫存上傳文件的目錄
+    stt_jobs_dir: str = Field(default="/app/data/jobs", validation_alias="STT_JOBS_DIR")
+    stt_job_concurrency: int = Field(default=1, validation_alias="STT_JOB_CONCURRENCY") # 同時執行的任務數
+    # 已結束任務 (及其結果) 保留多少小時，設為 0 則永久保留
+    stt_job_retention_hours: float = Field(default=168.0, validation_alias="STT_JOB_RETENTION_HOURS")
+
+    # --- 重複循環檢測 ---
+    # 解碼結果尾部同一組詞 (最長 MAX_NGRAM 個詞/字) 連續重複至少 MIN_REPEATS 次、共至少 MIN_TOKENS 個詞/字時，
+    # 視為 Whisper 重複循環並停止消耗該次解碼的結果；MIN_REPEATS 設為 0 則停用
+    stt_repetition_max_ngram: int = Field(default=8, validation_alias="STT_REPETITION_MAX_NGRAM")
+    stt_repetition_min_repeats: int = Field(default=3, validation_alias="STT_REPETITION_MIN_REPEATS")
+    stt_repetition_min_tokens: int = Field(default=6, validation_alias="STT_REPETITION_MIN_TOKENS")
+
+    # --- 轉錄結果緩存 ---
+    # 以解碼後音訊 + 模型 + 語言 + 提示的雜湊為鍵緩存片段結果，重複上傳 (或換一種 response_format) 時直接返回
+    stt_result_cache_memory_items: int = Field(default=128, validation_alias="STT_RESULT_CACHE_MEMORY_ITEMS") # 記憶體層條目數，設為 0 則停用
+    stt_result_cache_dir: str = Field(default="/app/data/result_cache", validation_alias="STT_RESULT_CACHE_DIR")
+    # 磁碟層總大小上限 (MB)，超過時淘汰最久未使用的結果，設為 0 則停用磁碟層
+    stt_result_cache_disk_mb: float = Field(default=512.0, validation_alias="STT_RESULT_CACHE_DISK_MB")
+    # stream=true 請求為寫入緩存最多保留多少個片段，超過時丟棄已保留的片段、該請求不寫入緩存 (設為 0 則流式請求不寫入緩存)
+    stt_result_cache_stream_max_segments: int = Field(default=2000, validation_alias="STT_RESULT_CACHE_STREAM_MAX_SEGMENTS")
+
+    # --- 流式中間結果 (partial) ---
+    # 說話期間每隔多少秒發送一次中間結果，設為 0 則停用
+    stt_partial_interval_sec: float = Field(default=1.0, validation_alias="STT_PARTIAL_INTERVAL_SEC")
+    # 語音緩衝至少累積多少秒才開始產生中間結果
+    stt_partial_min_audio_sec: float = Field(default=1.0, validation_alias="STT_PARTIAL_MIN_AUDIO_SEC")
+
+    # --- 流式片段長度上限 ---
+    # 持續沒有靜音時，片段達到此長度 (秒) 即強制切分 (不超過 Whisper 的 30 秒窗口)
+    stt_max_segment_sec: float = Field(default=25.0, validation_alias="STT_MAX_SEGMENT_SEC")
+    # 在上限前多少秒的範圍內尋找能量最低的切分點
+    stt_split_search_sec: float = Field(default=3.0, validation_alias="STT_SPLIT_SEARCH_SEC")
+    # 相鄰兩個強制切分片段之間的重疊長度 (秒)，接縫處的重複文字會被去除
+    stt_split_overlap_sec: float = Field(default=0.5, validation_alias="STT_SPLIT_OVERLAP_SEC")
+
+    # --- 流式會話流水線 (接收 -> VAD -> 推理，以有界隊列連接) ---
+    stt_stream_audio_queue_size: int = Field(default=256, validation_alias="STT_STREAM_AUDIO_QUEUE_SIZE") # 接收與 VAD 之間最多排隊的音訊塊數
+    stt_stream_segment_queue_size: int = Field(default=4, validation_alias="STT_STREAM_SEGMENT_QUEUE_SIZE") # VAD 與推理之間最多排隊的片段數
+    # 會話積壓的未轉錄音訊超過此秒數時向客戶端發送 {"type": "throttle", "active": true}，回落到一半以下時解除
+    stt_stream_throttle_sec: float = Field(default=5.0, validation_alias="STT_STREAM_THROTTLE_SEC")
+    # 隊列滿時的過載策略: "buffer" (阻塞接收，讓 TCP 反壓到客戶端)、
+    # "drop_silence" (丟棄靜音音訊塊，只保留其時長)、"merge" (將排隊中的相鄰片段合併成一次解碼)
+    stt_stream_overload_policy: str = Field(default="buffer", validation_alias="STT_STREAM_OVERLOAD_POLICY")
+    # 客戶端斷開後保留會話多少秒等待其以 session_id 重新連接 (期間已排隊的片段繼續轉錄，結果在重連後送出)；
+    # 設為 0 則斷開時立即取消該會話排隊中與執行中的轉錄及翻譯
+    stt_stream_reconnect_grace_sec: float = Field(default=0.0, validation_alias="STT_STREAM_RECONNECT_GRACE_SEC")
+    # drop_silence 策略下，能量低於此值 (dBFS) 的音訊塊視為靜音
+    stt_stream_drop_silence_dbfs: float = Field(default=-45.0, validation_alias="STT_STREAM_DROP_SILENCE_DBFS")
+
+    # --- VAD 引擎 ---
+    stt_vad_engine: str = Field(default="webrtc", validation_alias="STT_VAD_ENGINE") # "webrtc" 或 "silero"
+    # webrtc 引擎的能量門限 (dBFS)，低於此能量的幀不經 webrtcvad 直接判為靜音
+    stt_vad_energy_gate_dbfs: float = Field(default=-60.0, validation_alias="STT_VAD_ENERGY_GATE_DBFS")
+    # silero 引擎: silero-vad v5 ONNX 模型路徑、語音概率閾值、跨會話批次的收集間隔 (毫秒)
+    stt_silero_vad_model_path: str = Field(default="/app/models/silero_vad.onnx", validation_alias="STT_SILERO_VAD_MODEL_PATH")
+    stt_silero_vad_threshold: float = Field(default=0.5, validation_alias="STT_SILERO_VAD_THRESHOLD")
+    stt_silero_vad_tick_ms: float = Field(default=10.0, validation_alias="STT_SILERO_VAD_TICK_MS")
+
+    # --- 流式語言自動鎖定 (客戶端未指定 language 時) ---
+    # 連續多少個片段檢測到相同語言且置信度都超過閾值後鎖定
+    stt_language_pin_segments: int = Field(default=3, validation_alias="STT_LANGUAGE_PIN_SEGMENTS")
+    stt_language_pin_threshold: float = Field(default=0.8, validation_alias="STT_LANGUAGE_PIN_THRESHOLD")
+    # 鎖定後片段的平均 avg_logprob 低於此值時，下一個片段重新做語言檢測
+    stt_language_redetect_logprob: float = Field(default=-1.0, validation_alias="STT_LANGUAGE_REDETECT_LOGPROB")
+
+    # --- 管理端點 ---
+    # /v1/admin/* 需要在 X-Admin-Key 標頭中提供此值；未設置 (默認) 時管理 API 停用，所有請求返回 403
+    admin_api_key: str | None = Field(default=None, validation_alias="ADMIN_API_KEY")
+    # 管理端點 CPU / 記憶體剖析單次採集的最長秒數
+    admin_profile_max_sec: float = Field(default=300.0, gt=0, validation_alias="ADMIN_PROFILE_MAX_SEC")
+
+    # --- 事件循環阻塞監測 ---
+    # 事件循環被阻塞超過此毫秒數時記錄一次阻塞 (含當時的調用棧)，0 表示關閉監測
+    loop_stall_threshold_ms: float = Field(default=200.0, ge=0, validation_alias="LOOP_STALL_THRESHOLD_MS")
+    # 心跳間隔 (毫秒)，也是檢查阻塞的頻率；越小越靈敏但開銷越大
+    loop_stall_check_interval_ms: float = Field(default=50.0, gt=0, validation_alias="LOOP_STALL_CHECK_INTERVAL_MS")
+    # 保留最近多少次阻塞記錄
+    loop_stall_history: int = Field(default=50, ge=1, validation_alias="LOOP_STALL_HISTORY")
+
     # --- LLM Settings ---
     # 確保這個 URL 指向您本地 LLM 的 OpenAI 相容端點
     local_llm_api_base: str = Field(default="http://localhost:8001/v1", validation_alias="LOCAL_LLM_API_BASE")
@@ -39,9 +166,17 @@ settings = Settings()
 
 # 打印加載的設置 (用於調試)
 print("--- Application Settings ---")
+print(f"STT Backend: {settings.stt_backend}" + (f" (latency: {settings.stt_stub_latency_ms:g} ms, RTF: {settings.stt_stub_rtf:g})" if settings.stt_backend == "stub" else ""))
 print(f"STT Model Path: {settings.stt_model_path}")
 print(f"STT Device: {settings.stt_device}")
 print(f"STT Compute Type: {settings.stt_compute_type}")
+print(f"STT Extra Models: {settings.stt_models or '(none)'}")
+print(f"STT Workers: {settings.stt_num_workers} (max pending jobs: {settings.stt_max_pending_jobs})")
+print(f"STT Batch Window: {settings.stt_batch_window_ms} ms (max size: {settings.stt_batch_max_size})")
+print(f"STT Stream Overload Policy: {settings.stt_stream_overload_policy} (throttle after {settings.stt_stream_throttle_sec:g}s backlog)")
+print(f"STT Result Cache: {settings.stt_result_cache_memory_items} items in memory, {settings.stt_result_cache_disk_mb:g} MB on disk ({settings.stt_result_cache_dir}), streaming up to {settings.stt_result_cache_stream_max_segments} segments")
+print(f"Event Loop Stall Threshold: {settings.loop_stall_threshold_ms:g} ms" + (" (disabled)" if not settings.loop_stall_threshold_ms else ""))
+print(f"Admin API: {'enabled' if settings.admin_api_key else 'disabled (set ADMIN_API_KEY to enable)'}")
 print(f"LLM API Base: {settings.local_llm_api_base}")
 print(f"LLM Model Name: {settings.local_llm_model_name}")
 print("--------------------------")
\ No newline at end of file
@@ -1,9 +1,10 @@
 import logging
 from contextlib import asynccontextmanager
 import asyncio # 仍然需要導入 asyncio，但可能不再需要 loop
+import time
 import uvicorn
 from fastapi import FastAPI, Request # 為了 health check 導入 Request
-from fastapi.responses import JSONResponse # 為了 health check
+from fastapi.responses import JSONResponse, PlainTextResponse # 為了 health check
 from fastapi.openapi.docs import (
     get_redoc_html,
     get_swagger_ui_html,
@@ -14,48 +15,121 @@ from fastapi.openapi.docs import (
 from .core.config import settings
 
 # 導入服務層的加載/卸載函數
-from .services.stt_service import load_stt_model, unload_stt_model, stt_model # 導入 stt_model 以便檢查
+from .services.stt_service import load_stt_model, unload_stt_model, stt_model, model_registry, warmup_stt_model # 導入 stt_model 以便檢查
+from .services.stt_scheduler import inference_scheduler
+from .services.stt_backends import stt_backend
+from .services.stt_executor import stt_executor
+from .services.vad_engine import shutdown_vad_engines
+from .services.stt_jobs import job_manager
+from .services.stt_result_cache import result_cache
+from .services.stt_stream_pipeline import streaming_stats
+from .services import metrics, summary_service
+from .services.loop_monitor import loop_monitor
 
 # 導入 API 路由
 from .api.v1 import audio as api_v1_audio
 from .api.v1 import summarize as api_v1_summarize
 from .api.v1 import tts as api_v1_tts
 from .api.v1 import chat as api_v1_chat 
+from .api.v1 import admin as api_v1_admin
 
 # 配置日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- lifespan 管理器 ---
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # --- Application Startup ---
-    logger.info("Application startup...")
-    logger.info("Loading STT model synchronously...")
-    app.state.stt_model_loaded = False # 初始化狀態
+# --- STT 模型載入狀態 ---
+# loading: 背景載入中；ready: 可以處理請求；failed: 載入失敗
+STT_STATUS_LOADING = "loading"
+STT_STATUS_READY = "ready"
+STT_STATUS_FAILED = "failed"
+
 
+async def load_stt_model_in_background(app: FastAPI):
+    """在背景線程中載入默認 STT 模型，完成後切換就緒狀態 (啟動不再被模型載入阻塞)"""
+    started_at = time.perf_counter()
     try:
         # *** 修改點：接收返回值並檢查 ***
-        returned_model_object = load_stt_model() # 接收返回值
+        returned_model_object = await asyncio.to_thread(load_stt_model) # 接收返回值
+        app.state.stt_model_load_sec = round(time.perf_counter() - started_at, 3)
 
         if returned_model_object is None:
              logger.error("STT Model failed to load during startup! (Checked via return value)")
-             # app.state.stt_model_loaded 保持 False
+             app.state.stt_model_status = STT_STATUS_FAILED
         else:
-             logger.info("STT Model loaded successfully during startup. (Checked via return value)")
+             logger.info(f"STT Model loaded successfully in background ({app.state.stt_model_load_sec:.1f}s).")
+             if settings.stt_warmup_enabled:
+                 await run_stt_warmup(app, returned_model_object)
+             app.state.stt_model_status = STT_STATUS_READY
              app.state.stt_model_loaded = True # 設置狀態標誌為 True
+             start_job_manager()
              # 注意：我們仍然依賴 stt_service.py 中的全局變數 stt_model 被正確設置，
              # 因為 transcribe_audio 函數會用到它。
 
     except Exception as e:
         logger.error(f"Critical error during STT model loading: {e}", exc_info=True)
-        app.state.stt_model_loaded = False
+        app.state.stt_model_status = STT_STATUS_FAILED
+        app.state.stt_model_load_sec = round(time.perf_counter() - started_at, 3)
+
+
+def start_job_manager():
+    """模型就緒後開始處理非同步轉錄任務 (包括上次關閉時未完成的任務)"""
+    try:
+        job_manager.start()
+    except Exception as e:
+        logger.error(f"Failed to start transcription job manager: {e}", exc_info=True)
+
+
+async def run_stt_warmup(app: FastAPI, model):
+    """預熱模型與 VAD (失敗不影響就緒，只記錄警告)，結果保存在 app.state.stt_warmup 供 /health 查看"""
+    try:
+        durations = [float(value) for value in settings.stt_warmup_durations_sec.split(",") if value.strip()]
+        app.state.stt_warmup = await warmup_stt_model(model, durations)
+    except Exception as e:
+        logger.warning(f"STT warmup failed, continuing without it: {e}", exc_info=True)
+        app.state.stt_warmup = {"error": str(e)}
+
+
+# --- lifespan 管理器 ---
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # --- Application Startup ---
+    logger.info("Application startup...")
+    logger.info("Loading STT model in background...")
+    app.state.stt_model_loaded = False # 初始化狀態
+    app.state.stt_model_status = STT_STATUS_LOADING
+    app.state.stt_model_load_sec = None
+    app.state.stt_warmup = None
+    app.state.started_at = time.time()
+    model_load_task = asyncio.create_task(load_stt_model_in_background(app))
+
+    # 定期卸載閒置的非默認模型
+    model_registry.start_idle_reaper()
+    # 監測阻塞事件循環的同步工作
+    loop_monitor.start()
+    # 在背景線程中導入 openai 並創建 LLM 客戶端，第一次翻譯不必等待 (也不阻塞事件循環)
+    llm_client_task = asyncio.create_task(summary_service.get_client())
 
     yield # <--- Startup 完成
 
     # --- Application Shutdown ---
     logger.info("Application shutdown...")
 
+    await model_registry.stop_idle_reaper()
+    await loop_monitor.stop()
+    await llm_client_task
+    if not model_load_task.done():
+        # 載入在線程中進行，無法中斷，只能等待其結束後再卸載
+        logger.info("Waiting for background STT model loading to finish before shutdown...")
+        await asyncio.wait([model_load_task])
+
+    # 停止任務執行 (執行中的任務在下次啟動時重新排隊)
+    await job_manager.shutdown()
+
+    # 先停止批次排程器，等待進行中的批次完成
+    await inference_scheduler.shutdown()
+    stt_executor.shutdown()
+    shutdown_vad_engines()
+
     # *** 修改點：直接同步調用模型卸載 ***
     logger.info("Unloading STT model synchronously...")
     try:
@@ -78,6 +152,7 @@ app.include_router(api_v1_audio.router)
 app.include_router(api_v1_summarize.router)
 app.include_router(api_v1_tts.router)
 app.include_router(api_v1_chat.router)
+app.include_router(api_v1_admin.router)
 
 
 ####################
@@ -118,18 +193,72 @@ async def read_root():
 @app.get("/health", tags=["System"])
 async def health_check(request: Request): # 注入 Request 以訪問 app.state
     """
-    執行健康檢查，包括模型加載狀態。
+    執行健康檢查，包括模型加載狀態 (loading / ready / failed) 與預熱耗時。
+    模型未就緒 (載入或預熱中) 時返回 503。
     """
-    model_loaded = getattr(request.app.state, 'stt_model_loaded', False) # 從 app.state 讀取狀態
-    if model_loaded:
-        return {"status": "ok", "stt_model_loaded": True}
+    status = getattr(request.app.state, 'stt_model_status', STT_STATUS_LOADING) # 從 app.state 讀取狀態
+    load_sec = getattr(request.app.state, 'stt_model_load_sec', None)
+    if status == STT_STATUS_READY:
+        return {"status": "ok", "stt_model_status": status, "stt_model_loaded": True, "stt_model_load_sec": load_sec, "stt_backend": stt_backend.name,
+                "stt_warmup": getattr(request.app.state, 'stt_warmup', None),
+                "stt_scheduler": inference_scheduler.stats(), "stt_executor": stt_executor.stats(), "stt_models": model_registry.stats(),
+                "stt_jobs": job_manager.stats(), "stt_result_cache": result_cache.stats(),
+                "stt_streaming": streaming_stats(), "event_loop": loop_monitor.stats()}
+    elif status == STT_STATUS_LOADING:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "loading", "stt_model_status": status, "stt_model_loaded": False, "detail": "STT model is still loading."},
+            headers={"Retry-After": "5"}
+        )
     else:
         # 如果模型加載是關鍵，返回 503
         return JSONResponse(
             status_code=503,
-            content={"status": "error", "stt_model_loaded": False, "detail": "STT model failed to load or is not available."}
+            content={"status": "error", "stt_model_status": status, "stt_model_loaded": False, "load_sec": load_sec, "detail": "STT model failed to load or is not available."}
         )
 
+# --- Prometheus 指標 ---
+# 以下指標在抓取時才從各模組現有的統計中讀取，請求路徑上沒有額外開銷
+metrics.registry.gauge_callback("stream_sessions_active", "Active WebSocket streaming sessions.",
+                                lambda: streaming_stats()["sessions_active"])
+metrics.registry.gauge_callback("stt_executor_queue_depth", "STT jobs waiting for a worker thread.",
+                                lambda: stt_executor.queue_depth)
+metrics.registry.gauge_callback("stt_executor_in_flight", "STT jobs submitted and not yet finished (running + queued).",
+                                lambda: stt_executor.stats()["in_flight"])
+metrics.registry.gauge_callback("stt_models_loaded", "STT models currently loaded.",
+                                lambda: model_registry.loaded_count)
+metrics.registry.counter_callback("stt_executor_jobs_rejected_total", "STT jobs rejected by admission control (429).",
+                                  lambda: stt_executor.jobs_rejected)
+metrics.registry.counter_callback("stt_executor_jobs_cancelled_total", "STT jobs withdrawn before a worker started them.",
+                                  lambda: stt_executor.jobs_cancelled)
+metrics.registry.counter_callback("stt_scheduler_segments_cancelled_total", "Streaming segments cancelled before decoding.",
+                                  lambda: inference_scheduler.segments_cancelled)
+metrics.registry.counter_callback("stt_scheduler_results_discarded_total", "Decoded segments whose requester had already gone.",
+                                  lambda: inference_scheduler.results_discarded)
+metrics.registry.counter_callback("stt_result_cache_lookups_total", "Transcription result cache lookups.",
+                                  lambda: {("memory_hit",): result_cache.memory_hits, ("disk_hit",): result_cache.disk_hits,
+                                           ("miss",): result_cache.misses},
+                                  labelnames=("result",))
+
+@app.get("/metrics", tags=["System"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """以 Prometheus 文本格式輸出服務指標 (延遲直方圖、隊列與會話數、過濾計數等)"""
+    return PlainTextResponse(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/health/live", tags=["System"])
+async def liveness_check(request: Request):
+    """存活檢查: 進程與事件循環正常即返回 200，不依賴模型狀態 (容器啟動後立即可用)"""
+    started_at = getattr(request.app.state, 'started_at', None)
+    return {"status": "alive", "uptime_sec": round(time.time() - started_at, 1) if started_at else None}
+
+@app.get("/health/ready", tags=["System"])
+async def readiness_check(request: Request):
+    """就緒檢查: 模型載入完成才返回 200，否則返回 503 及目前狀態"""
+    status = getattr(request.app.state, 'stt_model_status', STT_STATUS_LOADING)
+    if status == STT_STATUS_READY:
+        return {"status": "ready"}
+    return JSONResponse(status_code=503, content={"status": status})
+
 
 # (用於本地測試的 uvicorn 啟動部分保持不變)
 if __name__ == "__main__":
@@ -0,0 +1,143 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRingBuffer:
+    """
+    預分配的 PCM 環形緩衝區，用於將任意大小的 WebSocket 音訊塊切成固定長度的 VAD 幀。
+
+    容量始終是幀長度的整數倍，且讀取總是以整幀為單位，因此讀指針永遠對齊幀邊界，
+    任何一幀都不會跨越緩衝區尾部 —— `drain_frames()` 在未環繞時可以直接交出視圖而不必複製。
+    每個輸入字節只被複製一次 (寫入時)，與音訊塊大小無關。
+
+    注意: 交出的幀陣列可能是緩衝區的視圖，只在下一次 `write()` 之前有效，
+    需要保留幀內容的調用者必須自行複製。
+    """
+
+    def __init__(self, frame_bytes: int, initial_frames: int = 64):
+        self.frame_bytes = frame_bytes
+        self._capacity = frame_bytes * max(initial_frames, 2)
+        self._data = bytearray(self._capacity)
+        self._view = memoryview(self._data)
+        self._head = 0 # 下一個待讀取幀的起點 (總是幀對齊)
+        self._size = 0 # 目前緩衝的字節數
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _grow(self, needed: int):
+        """擴容到至少可容納 needed 字節 (保持幀長度的整數倍)，並將內容線性化到開頭"""
+        new_capacity = self._capacity
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_data = bytearray(new_capacity)
+        first = min(self._size, self._capacity - self._head)
+        new_data[:first] = self._view[self._head:self._head + first]
+        new_data[first:self._size] = self._view[:self._size - first]
+        self._data = new_data
+        self._view = memoryview(self._data)
+        self._capacity = new_capacity
+        self._head = 0
+        logger.debug(f"FrameRingBuffer grown to {new_capacity} bytes")
+
+    def write(self, chunk: bytes):
+        """寫入一個音訊塊 (必要時擴容)"""
+        length = len(chunk)
+        if length == 0:
+            return
+        if self._size + length > self._capacity:
+            self._grow(self._size + length)
+
+        source = memoryview(chunk)
+        tail = (self._head + self._size) % self._capacity
+        first = min(length, self._capacity - tail)
+        self._view[tail:tail + first] = source[:first]
+        if first < length:
+            # 環繞到緩衝區開頭
+            self._view[:length - first] = source[first:]
+        self._size += length
+
+    def drain_frames(self) -> np.ndarray:
+        """
+        一次取出所有完整的幀，返回形狀為 (幀數, 每幀樣本數) 的 int16 陣列，供整塊向量化處理。
+        未環繞時是緩衝區的零複製視圖；跨越緩衝區尾部時 (每繞一圈最多一次) 才拼接複製。
+        """
+        samples_per_frame = self.frame_bytes // 2
+        count = self._size // self.frame_bytes
+        if count == 0:
+            return np.empty((0, samples_per_frame), dtype=np.int16)
+
+        total = count * self.frame_bytes
+        first = min(total, self._capacity - self._head)
+        pcm = np.frombuffer(self._data, dtype=np.int16, count=first // 2, offset=self._head)
+        if first < total:
+            wrapped = np.frombuffer(self._data, dtype=np.int16, count=(total - first) // 2)
+            pcm = np.concatenate((pcm, wrapped))
+        self._head = (self._head + total) % self._capacity
+        self._size -= total
+        return pcm.reshape(count, samples_per_frame)
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+
+class SpeechSegmentBuffer:
+    """
+    每個會話一個的語音片段累積器。
+
+    語音幀直接複製進預分配、可增長的 int16 陣列 (取代 deque[bytes] + b"".join)，
+    交給轉錄時以一次乘法轉換成 float32 (取代 frombuffer().astype() / 32768.0 產生的多份副本與臨時陣列)。
+    清空時保留已分配的容量，超長片段之後會縮回 `retain_samples`，讓長時間會話的穩態記憶體保持有界。
+
+    轉換結果每次都是新的陣列而不是可重用的暫存區: 片段會在隊列中等待、與其他會話的片段合併成批次，
+    其生命週期與此緩衝區的寫入無關。每個片段多一次最多約 2 MB (30 秒) 的分配，相對於解碼的耗時可以忽略。
+    """
+
+    def __init__(self, initial_samples: int, retain_samples: int | None = None):
+        self._initial_samples = max(initial_samples, 1)
+        self._retain_samples = max(retain_samples or self._initial_samples, self._initial_samples)
+        self._samples = np.empty(self._initial_samples, dtype=np.int16)
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, frame) -> None:
+        """追加一個 16-bit PCM 幀 (bytes 或 memoryview)"""
+        pcm = np.frombuffer(frame, dtype=np.int16)
+        needed = self._length + len(pcm)
+        if needed > len(self._samples):
+            new_capacity = len(self._samples)
+            while new_capacity < needed:
+                new_capacity *= 2
+            grown = np.empty(new_capacity, dtype=np.int16)
+            grown[:self._length] = self._samples[:self._length]
+            self._samples = grown
+        self._samples[self._length:needed] = pcm
+        self._length = needed
+
+    def pcm(self) -> np.ndarray:
+        """目前累積的 int16 樣本 (視圖，不複製)"""
+        return self._samples[:self._length]
+
+    def copy_float32(self, end: int | None = None) -> np.ndarray:
+        """將 [:end] 的樣本轉換為 Whisper 所需的 [-1, 1) float32 獨立陣列 (交給其他任務排隊轉錄時使用，不受之後的寫入影響)"""
+        end = self._length if end is None else min(end, self._length)
+        return np.multiply(self._samples[:end], np.float32(1.0 / 32768.0), dtype=np.float32)
+
+    def keep_tail(self, start: int) -> None:
+        """丟棄 start 之前的樣本，只保留 [start:] 並移到緩衝區開頭 (用於強制切分後的重疊部分)"""
+        start = min(max(start, 0), self._length)
+        remaining = self._length - start
+        self._samples[:remaining] = self._samples[start:self._length]
+        self._length = remaining
+
+    def clear(self) -> None:
+        self._length = 0
+        # 超長片段之後釋放多餘容量，避免一次長片段讓記憶體永久膨脹
+        if len(self._samples) > self._retain_samples:
+            self._samples = np.empty(self._retain_samples, dtype=np.int16)
@@ -0,0 +1,83 @@
+import logging
+from typing import BinaryIO
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# 按容器聲明的時長預分配的上限 (秒，約 115 MB)。聲明值來自上傳文件本身，不可信，更長的音訊靠倍增擴容
+MAX_PREALLOCATED_SEC = 30 * 60
+
+
+class AudioDecodeError(RuntimeError):
+    """上傳的音訊無法解碼 (由 API 層轉換為 400)"""
+
+
+def decode_audio_to_float32(file: BinaryIO, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    以 PyAV 在記憶體中解碼上傳的音訊，直接重採樣為 Whisper 所需的單聲道 float32 陣列。
+
+    取代 pydub (ffmpeg 子進程) + 匯出臨時 WAV + faster-whisper 再解碼一次的三遍處理：
+    封包逐個解碼、逐幀重採樣後寫入一個按容器時長預估並預分配的輸出陣列 (不足時倍增)，
+    因此除了輸出本身之外，任何時刻只有一個解碼幀的臨時數據，也不需要任何臨時文件。
+    """
+    import av # 局部導入，僅在轉錄上傳文件時需要
+
+    file.seek(0)
+    try:
+        container = av.open(file, mode="r", metadata_errors="ignore")
+    except av.FFmpegError as e:
+        raise AudioDecodeError(f"Unsupported or corrupted audio file: {e}") from e
+
+    with container:
+        if not container.streams.audio:
+            raise AudioDecodeError("The uploaded file contains no audio stream.")
+        stream = container.streams.audio[0]
+        stream.thread_type = "AUTO"
+
+        # 按容器時長預分配 (多留 1 秒，最多 MAX_PREALLOCATED_SEC)，時長未知時從 60 秒開始倍增
+        duration_sec = None
+        if stream.duration is not None and stream.time_base is not None:
+            duration_sec = float(stream.duration * stream.time_base)
+        elif container.duration is not None:
+            duration_sec = container.duration / av.time_base
+        if not duration_sec or duration_sec < 0:
+            duration_sec = 60.0
+        capacity = int((min(duration_sec, MAX_PREALLOCATED_SEC) + 1.0) * sample_rate)
+        output = np.empty(capacity, dtype=np.float32)
+        length = 0
+
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=sample_rate)
+
+        def append(frames):
+            nonlocal output, length
+            for frame in frames:
+                samples = frame.to_ndarray().reshape(-1)
+                needed = length + len(samples)
+                if needed > len(output):
+                    new_capacity = len(output)
+                    while new_capacity < needed:
+                        new_capacity *= 2
+                    grown = np.empty(new_capacity, dtype=np.float32)
+                    grown[:length] = output[:length]
+                    output = grown
+                output[length:needed] = samples
+                length = needed
+
+        try:
+            for frame in container.decode(stream):
+                append(resampler.resample(frame))
+            append(resampler.resample(None)) # 取出重採樣器中剩餘的樣本
+        except av.FFmpegError as e:
+            # 文件尾部損壞時保留已解碼的部分
+            if length == 0:
+                raise AudioDecodeError(f"Failed to decode audio: {e}") from e
+            logger.warning(f"Audio decoding stopped early after {length / sample_rate:.1f}s: {e}")
+
+    if length == 0:
+        raise AudioDecodeError("The uploaded file contains no decodable audio.")
+    # 預估明顯偏大時複製一份緊湊的陣列，避免長期持有多餘記憶體
+    if len(output) - length > sample_rate * 10:
+        return output[:length].copy()
+    return output[:length]
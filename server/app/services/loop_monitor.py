@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List
+
+from ..core.config import settings
+from .metrics import EVENT_LOOP_LAG_SECONDS, EVENT_LOOP_STALLS
+
+logger = logging.getLogger(__name__)
+
+MAX_STACK_FRAMES = 30 # 記錄的調用棧最多保留最內層的幀數
+
+
+class EventLoopStallMonitor:
+    """
+    事件循環阻塞監測。
+
+    事件循環上的心跳協程每 interval 醒來一次並記錄時間；另一個監視線程在心跳逾期超過
+    threshold 時 (事件循環此刻正被阻塞) 讀取事件循環線程的調用棧與當前任務，
+    因此記錄下的是造成阻塞的那段程式碼，而不是阻塞結束後才執行的程式碼。
+    心跳恢復後以實際延遲補上阻塞時長，寫入最近的阻塞記錄並輸出警告日誌。
+    """
+
+    def __init__(self, threshold_ms: float, interval_ms: float, history: int):
+        self.threshold_sec = threshold_ms / 1000.0
+        self.interval_sec = interval_ms / 1000.0
+        self._records: deque = deque(maxlen=history)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id: int | None = None
+        self._heartbeat_task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._beat = 0 # 心跳序號
+        self._last_beat_at = 0.0
+        self._captured: Dict[int, Dict[str, Any]] = {} # 心跳序號 -> 阻塞期間採集的調用棧
+
+        self.stalls = 0
+        self.total_stall_sec = 0.0
+        self.max_stall_sec = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_sec > 0
+
+    def start(self):
+        """在事件循環中調用 (例如 lifespan 啟動時)"""
+        if not self.enabled or self._heartbeat_task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat_at = time.perf_counter()
+        self._stop.clear()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-stall-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop stall monitor started (threshold: {self.threshold_sec * 1000:.0f} ms, interval: {self.interval_sec * 1000:.0f} ms)")
+
+    async def stop(self):
+        if self._heartbeat_task is None:
+            return
+        self._stop.set()
+        self._heartbeat_task.cancel()
+        try:
+            await self._heartbeat_task
+        except asyncio.CancelledError:
+            pass
+        self._heartbeat_task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join, 1.0)
+            self._watchdog = None
+        logger.info(f"Event loop stall monitor stopped. Stalls recorded: {self.stalls}")
+
+    async def _heartbeat_loop(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval_sec)
+            now = time.perf_counter()
+            lag = max(now - before - self.interval_sec, 0.0)
+            beat = self._beat
+            self._beat += 1
+            self._last_beat_at = now
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            capture = self._captured.pop(beat, None)
+            if lag >= self.threshold_sec:
+                self._record_stall(lag, capture)
+            self._captured.clear() # 丟棄已過時的採集 (理論上不會有)
+
+    def _watch(self):
+        # 在獨立線程中執行: 事件循環被阻塞時仍能運作
+        while not self._stop.wait(self.interval_sec / 2):
+            beat = self._beat
+            overdue = time.perf_counter() - self._last_beat_at - self.interval_sec
+            if overdue >= self.threshold_sec and beat not in self._captured:
+                self._captured[beat] = self._capture_loop_stack()
+
+    def _capture_loop_stack(self) -> Dict[str, Any]:
+        """讀取事件循環線程此刻的調用棧與正在執行的任務"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame)[-MAX_STACK_FRAMES:] if frame is not None else []
+        task_name, coroutine = None, None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            task = None
+        if task is not None:
+            task_name = task.get_name()
+            coro = task.get_coro()
+            coroutine = getattr(coro, "__qualname__", repr(coro))
+        return {"task": task_name, "coroutine": coroutine, "stack": [line.rstrip() for line in stack]}
+
+    def _record_stall(self, duration: float, capture: Dict[str, Any] | None):
+        self.stalls += 1
+        self.total_stall_sec += duration
+        self.max_stall_sec = max(self.max_stall_sec, duration)
+        EVENT_LOOP_STALLS.inc()
+        record = {
+            "at": time.time() - duration, # 阻塞開始的大約時刻
+            "duration_ms": round(duration * 1000, 1),
+            "task": capture["task"] if capture else None,
+            "coroutine": capture["coroutine"] if capture else None,
+            "stack": capture["stack"] if capture else None, # 阻塞太短、監視線程未及採集時為 None
+        }
+        self._records.append(record)
+        where = f" in task '{record['task']}' ({record['coroutine']})" if record["task"] else ""
+        stack_text = "\n".join(record["stack"]) if record["stack"] else "(stack not captured)"
+        logger.warning(f"Event loop blocked for {record['duration_ms']:.0f} ms{where}. Stack:\n{stack_text}")
+
+    def recent_stalls(self) -> List[Dict[str, Any]]:
+        """最近的阻塞記錄 (新的在前，含調用棧)"""
+        return list(reversed(self._records))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._heartbeat_task is not None,
+            "threshold_ms": self.threshold_sec * 1000,
+            "interval_ms": self.interval_sec * 1000,
+            "stalls": self.stalls,
+            "total_stall_ms": round(self.total_stall_sec * 1000, 1),
+            "max_stall_ms": round(self.max_stall_sec * 1000, 1),
+            "last_stall": {key: value for key, value in self._records[-1].items() if key != "stack"} if self._records else None,
+        }
+
+
+# --- 全局監測器 ---
+loop_monitor = EventLoopStallMonitor(
+    threshold_ms=settings.loop_stall_threshold_ms,
+    interval_ms=settings.loop_stall_check_interval_ms,
+    history=settings.loop_stall_history,
+)
@@ -0,0 +1,185 @@
+import bisect
+from abc import ABC, abstractmethod
+import threading
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Prometheus 文本格式 (version 0.0.4) 的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRIC_PREFIX = "kaudio_"
+
+# 常用的桶邊界 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RTF_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(labelnames: Sequence[str], values: LabelValues, extra: Tuple[str, str] | None = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape_label_value(str(value))}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = METRIC_PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock() # 部分觀測在 STT 工作線程中發生
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        """返回此指標的樣本行 (不含 HELP / TYPE)"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """單調遞增的計數器"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """
+    固定桶邊界的直方圖。observe 只做一次二分查找與幾次加法，可以常駐在熱路徑上；
+    各桶保存非累計計數，輸出時才累加成 Prometheus 的累計桶。
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelValues, List[float]] = {} # [桶計數..., +Inf 桶計數, 總和]
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines: List[str] = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class CallbackMetric(_Metric):
+    """
+    在抓取時才調用 callback 取值的指標 (gauge 或 counter)，用於已在其他模組中維護的狀態
+    (例如隊列深度、已載入模型數)，熱路徑上沒有任何額外開銷。
+    callback 返回 {標籤值元組: 數值}，沒有標籤時返回單個數值。
+    """
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float | Dict[LabelValues, float]],
+                 kind: str = "gauge", labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        values = self._callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values.items()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = LATENCY_BUCKETS, labelnames: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def gauge_callback(self, name: str, documentation: str, callback, labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, "gauge", labelnames))
+
+    def counter_callback(self, name: str, documentation: str, callback, labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, documentation, callback, "counter", labelnames))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+# --- 全局指標 ---
+registry = MetricsRegistry()
+
+STT_QUEUE_WAIT_SECONDS = registry.histogram(
+    "stt_queue_wait_seconds", "Time a streaming segment waited in the inference scheduler before dispatch.")
+STT_DECODE_SECONDS = registry.histogram(
+    "stt_decode_seconds", "Wall time of one decode (a scheduler batch or a file transcription).", labelnames=("source",))
+STT_REAL_TIME_FACTOR = registry.histogram(
+    "stt_real_time_factor", "Decode time divided by audio duration.", buckets=RTF_BUCKETS, labelnames=("source",))
+STT_END_OF_SPEECH_TO_FINAL_SECONDS = registry.histogram(
+    "stt_end_of_speech_to_final_seconds", "Time from the VAD closing a segment to its final result being queued for the client.")
+TRANSLATION_LATENCY_SECONDS = registry.histogram(
+    "translation_latency_seconds", "LLM translation request latency.", labelnames=("outcome",))
+TTS_TIME_TO_FIRST_BYTE_SECONDS = registry.histogram(
+    "tts_time_to_first_byte_seconds", "Time until the TTS backend returned response headers.")
+EVENT_LOOP_LAG_SECONDS = registry.histogram(
+    "event_loop_lag_seconds", "Delay of the event loop heartbeat beyond its scheduled interval.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+EVENT_LOOP_STALLS = registry.counter(
+    "event_loop_stalls_total", "Event loop stalls longer than the configured threshold.")
+STT_FILTERED_SEGMENTS = registry.counter(
+    "stt_filtered_segments_total", "Decoded segments flagged or dropped by post-filtering.", labelnames=("reason",))
+
+
+def render_metrics() -> str:
+    """以 Prometheus 文本格式輸出所有指標"""
+    return registry.render()
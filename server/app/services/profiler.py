@@ -0,0 +1,145 @@
+import asyncio
+import cProfile
+import io
+import linecache
+import logging
+import marshal
+import pstats
+import tracemalloc
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+CPU_SORT_KEYS = ("cumulative", "tottime", "calls", "ncalls", "time")
+MEMORY_KEY_TYPES = ("lineno", "filename", "traceback")
+
+
+class ProfilerBusyError(Exception):
+    """已有剖析正在進行 (同一時間只允許一個 CPU 或記憶體採集)"""
+    pass
+
+
+_active_capture: str | None = None
+
+
+def _claim(kind: str):
+    global _active_capture
+    if _active_capture is not None:
+        raise ProfilerBusyError(f"A {_active_capture} profile capture is already running.")
+    _active_capture = kind
+
+
+def _release():
+    global _active_capture
+    _active_capture = None
+
+
+def active_capture() -> str | None:
+    return _active_capture
+
+
+async def capture_cpu_profile(seconds: float, sort: str = "cumulative", limit: int = 50) -> Dict[str, Any]:
+    """
+    在運行中的服務上以 cProfile 採集 seconds 秒，返回按 sort 排序的前 limit 個函數。
+    Python 3.12 起 cProfile 基於 sys.monitoring，對所有線程生效 (包括 STT 工作線程)；
+    更早的版本只剖析事件循環線程。結果中的 pstats 為 marshal 格式的原始數據，
+    可寫入 .prof 文件後用 pstats / snakeviz 查看。
+    """
+    _claim("cpu")
+    try:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e: # 另一個剖析工具 (例如調試器) 已啟用
+            raise ProfilerBusyError(str(e)) from e
+        logger.info(f"CPU profile capture started for {seconds:g}s.")
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profile.disable()
+    finally:
+        _release()
+    # 統計整理可能耗時數百毫秒，不在事件循環上進行
+    return await asyncio.to_thread(_summarize_cpu_profile, profile, seconds, sort, limit)
+
+
+def _summarize_cpu_profile(profile: cProfile.Profile, seconds: float, sort: str, limit: int) -> Dict[str, Any]:
+    stream = io.StringIO()
+    stats = pstats.Stats(profile, stream=stream)
+    stats.sort_stats(sort).print_stats(limit)
+    profile.create_stats()
+    functions: List[Dict[str, Any]] = []
+    for (filename, lineno, name) in stats.fcn_list[:limit]:
+        primitive_calls, total_calls, tottime, cumtime, _ = stats.stats[(filename, lineno, name)]
+        functions.append({
+            "function": f"{filename}:{lineno}({name})",
+            "calls": total_calls,
+            "primitive_calls": primitive_calls,
+            "tottime_sec": round(tottime, 6),
+            "cumtime_sec": round(cumtime, 6),
+        })
+    logger.info(f"CPU profile capture finished: {stats.total_calls} calls in {stats.total_tt:.3f}s of profiled time.")
+    return {
+        "seconds": seconds,
+        "sort": sort,
+        "total_calls": stats.total_calls,
+        "total_time_sec": round(stats.total_tt, 6),
+        "functions": functions,
+        "report": stream.getvalue(),
+        "pstats": marshal.dumps(profile.stats),
+    }
+
+
+async def capture_memory_profile(seconds: float, key_type: str = "lineno", limit: int = 30, frames: int = 1) -> Dict[str, Any]:
+    """
+    以 tracemalloc 在 seconds 秒的窗口前後各拍一次快照，返回期間記憶體增長最多的 limit 個位置，
+    以及窗口結束時仍存活、由追蹤開始後分配的記憶體中佔用最多的位置。
+    若 tracemalloc 原本未啟用，則只在採集期間啟用 (追蹤會使分配變慢)，結束後關閉。
+    """
+    _claim("memory")
+    started_here = not tracemalloc.is_tracing()
+    try:
+        if started_here:
+            tracemalloc.start(frames)
+        logger.info(f"Memory profile capture started for {seconds:g}s (frames: {tracemalloc.get_traceback_limit()}).")
+        before = tracemalloc.take_snapshot()
+        await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+        _release()
+    result = await asyncio.to_thread(_summarize_memory_profile, before, after, key_type, limit)
+    result.update({"seconds": seconds, "key_type": key_type, "traced_current_kb": round(current / 1024, 1),
+                   "traced_peak_kb": round(peak / 1024, 1), "tracing_started_for_capture": started_here})
+    logger.info(f"Memory profile capture finished: traced {current / 1024:.0f} KB (peak {peak / 1024:.0f} KB).")
+    return result
+
+
+def _summarize_memory_profile(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot, key_type: str, limit: int) -> Dict[str, Any]:
+    # 排除 tracemalloc 本身與導入機制的分配
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ]
+    before, after = before.filter_traces(filters), after.filter_traces(filters)
+    growth = [
+        {"location": _format_traceback(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+         "size_kb": round(stat.size / 1024, 1), "count_diff": stat.count_diff, "count": stat.count}
+        for stat in after.compare_to(before, key_type)[:limit]
+    ]
+    top = [
+        {"location": _format_traceback(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+        for stat in after.statistics(key_type)[:limit]
+    ]
+    return {"growth": growth, "top": top}
+
+
+def _format_traceback(trace: tracemalloc.Traceback) -> List[str]:
+    lines = []
+    for frame in trace:
+        source = linecache.getline(frame.filename, frame.lineno).strip()
+        lines.append(f"{frame.filename}:{frame.lineno}" + (f"  {source}" if source else ""))
+    return lines
@@ -0,0 +1,280 @@
+import bisect
+import hashlib
+from abc import ABC, abstractmethod
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, NamedTuple, Protocol, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+class STTSegment(Protocol):
+    """解碼出的一段文本 (與 faster-whisper Segment 的必要欄位相同)，時間戳相對於輸入音訊的開頭"""
+    start: float
+    end: float
+    text: str
+    no_speech_prob: float
+    avg_logprob: float
+
+
+class DecodedSegment(NamedTuple):
+    """已完整解碼的片段 (與 faster-whisper Segment 的必要欄位相同)，可安全跨線程傳遞"""
+    start: float
+    end: float
+    text: str
+    no_speech_prob: float
+    avg_logprob: float
+
+
+def to_decoded(segment: STTSegment, offset: float = 0.0) -> DecodedSegment:
+    return DecodedSegment(
+        start=segment.start - offset,
+        end=segment.end - offset,
+        text=segment.text or "",
+        no_speech_prob=segment.no_speech_prob,
+        avg_logprob=segment.avg_logprob,
+    )
+
+
+class STTModel(Protocol):
+    """後端載入的模型。transcribe 返回 (惰性的片段迭代器, info)，info 至少有 language / language_probability / duration"""
+
+    def transcribe(self, audio: np.ndarray, **options: Any) -> Tuple[Iterable[STTSegment], Any]:
+        ...
+
+
+class STTBackend(ABC):
+    """
+    STT 後端接口。模型登記表以 load_model 載入模型，非流式轉錄、預熱與流式會話的解碼
+    都經由 transcribe / transcribe_batch 進行，不直接依賴具體的推理庫。
+    transcribe 可能惰性解碼 (迭代片段時才真正計算)，必須在 STT 執行引擎的線程中迭代。
+    """
+    name = "base"
+    # 排程器 (流式) 的每次解碼都加上這些選項，讓同一片段不論單獨解碼還是與其他片段批次解碼都得到相同結果
+    batch_consistent_options: Dict[str, Any] = {}
+
+    def check_model_path(self, model_path: str):
+        """模型路徑無效時拋出 FileNotFoundError (熱替換前的同步檢查)"""
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"STT model path not found: {model_path}")
+
+    @abstractmethod
+    def load_model(self, model_path: str, compute_type: str | None = None) -> STTModel:
+        """載入模型 (在背景線程中調用，可能耗時數秒)"""
+
+    def transcribe(self, model: STTModel, audio: np.ndarray, **options: Any) -> Tuple[Iterable[STTSegment], Any]:
+        return model.transcribe(audio, **options)
+
+    def detect_language(self, model: STTModel, audio: np.ndarray, **options: Any) -> Tuple[str | None, float | None]:
+        """
+        檢測音訊的語言，返回 (語言, 概率)。
+        默認取 transcribe 返回的 info 而不迭代片段 (惰性解碼的後端只做語言檢測)。
+        """
+        _, info = self.transcribe(model, audio, **options)
+        return info.language, info.language_probability
+
+    def transcribe_batch(self, model: STTModel, audios: List[np.ndarray], options: Dict[str, Any]) -> List[Tuple[List[DecodedSegment], Any]]:
+        """
+        一次完整解碼多個互相獨立的片段，返回每個片段的 (已解碼片段列表, info)，時間戳相對於各自片段的開頭。
+        默認逐個解碼；支援批次推理的後端應覆寫此方法。
+        """
+        results = []
+        for audio in audios:
+            segments, info = self.transcribe(model, audio, **options)
+            results.append(([to_decoded(segment) for segment in segments], info))
+        return results
+
+    @property
+    def identity_prefix(self) -> str:
+        """模型標識 (結果緩存鍵的一部分) 的前綴，避免不同後端以相同路徑載入的模型共用緩存"""
+        return f"{self.name}:"
+
+
+class FasterWhisperBackend(STTBackend):
+    """faster-whisper (CTranslate2) 後端"""
+    name = "faster_whisper"
+    # BatchedInferencePipeline.transcribe 的默認值與 WhisperModel.transcribe 不同: without_timestamps=True，
+    # 且只使用第一個 temperature (沒有溫度回退)。明確指定這兩項，單獨與批次解碼的文本和片段邊界才一致
+    batch_consistent_options = {"without_timestamps": False, "temperature": 0.0}
+
+    def __init__(self):
+        self._pipelines: "weakref.WeakKeyDictionary[WhisperModel, Any]" = weakref.WeakKeyDictionary() # 每個模型一個批次推理管線
+        self._pipelines_lock = threading.Lock()
+
+    def load_model(self, model_path: str, compute_type: str | None = None) -> "WhisperModel":
+        """按統一的設備/精度配置創建 WhisperModel，compute_type 未指定時使用配置值"""
+        self.check_model_path(model_path)
+        from faster_whisper import WhisperModel # 局部導入: faster_whisper 導入很慢
+        return WhisperModel(
+            model_path,
+            device=settings.stt_device,
+            compute_type=compute_type or settings.stt_compute_type,
+            num_workers=settings.stt_num_workers # 與 STT 執行引擎的線程數一致
+        )
+
+    def detect_language(self, model: "WhisperModel", audio: np.ndarray, **options: Any) -> Tuple[str | None, float | None]:
+        # 只跑編碼器與語言標記，不解碼文本
+        language, probability, _ = model.detect_language(audio, **options)
+        return language, probability
+
+    def transcribe_batch(self, model: "WhisperModel", audios: List[np.ndarray], options: Dict[str, Any]) -> List[Tuple[List[DecodedSegment], Any]]:
+        """
+        將多個片段拼接後一次送入 BatchedInferencePipeline，
+        再依 clip_timestamps 將結果分回各自的片段 (時間戳轉回片段內相對時間)。
+        BatchedInferencePipeline 的 clip_timestamps 以樣本位置 (整數) 表示，輸出片段的時間戳則以秒表示。
+        解碼選項由調用者指定 (排程器會加上 batch_consistent_options)，否則使用 BatchedInferencePipeline 自己的默認值。
+        """
+        if len(audios) == 1:
+            return super().transcribe_batch(model, audios, options)
+
+        clip_timestamps: List[Dict[str, int]] = []
+        cursor = 0
+        for audio in audios:
+            clip_timestamps.append({"start": cursor, "end": cursor + len(audio)})
+            cursor += len(audio)
+        clip_starts = [clip["start"] / SAMPLE_RATE for clip in clip_timestamps] # 秒，只用於將片段分回所屬的片段
+
+        segments_generator, info = self._pipeline(model).transcribe(
+            np.concatenate(audios),
+            clip_timestamps=clip_timestamps,
+            vad_filter=False,
+            batch_size=len(audios),
+            **options,
+        )
+
+        per_clip: List[List[DecodedSegment]] = [[] for _ in audios]
+        for segment in segments_generator:
+            index = max(bisect.bisect_right(clip_starts, segment.start) - 1, 0)
+            per_clip[index].append(to_decoded(segment, offset=clip_starts[index]))
+        return [(segments, info) for segments in per_clip]
+
+    def _pipeline(self, model: "WhisperModel") -> Any:
+        """返回模型的 BatchedInferencePipeline (首次使用時創建，隨模型一起釋放)"""
+        with self._pipelines_lock:
+            pipeline = self._pipelines.get(model)
+            if pipeline is None:
+                from faster_whisper import BatchedInferencePipeline # 局部導入
+                pipeline = self._pipelines[model] = BatchedInferencePipeline(model=model)
+            return pipeline
+
+    @property
+    def identity_prefix(self) -> str:
+        return "" # 與引入後端接口之前寫入的結果緩存相容
+
+
+# --- 確定性的模擬後端 ---
+@dataclass
+class StubSegment:
+    start: float
+    end: float
+    text: str
+    no_speech_prob: float
+    avg_logprob: float
+
+
+@dataclass
+class StubInfo:
+    language: str
+    language_probability: float
+    duration: float
+
+
+_STUB_WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+               "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa")
+
+
+class StubModel:
+    """
+    不做任何推理的模擬模型: 每 segment_sec 秒音訊產生一個片段，文本由音訊內容的雜湊決定
+    (相同輸入永遠得到相同輸出)，沒有高於能量門限的音訊的片段標記為無語音。
+    每個片段在迭代時以 time.sleep 模擬解碼耗時 (固定延遲 + RTF × 片段長度)，
+    與 faster-whisper 一樣是惰性的、會佔住執行它的線程。
+    """
+
+    def __init__(self, path: str, latency_ms: float, rtf: float, segment_sec: float, silence_dbfs: float = -50.0):
+        self.path = path
+        self.latency_sec = latency_ms / 1000.0
+        self.rtf = rtf
+        self.segment_samples = max(int(segment_sec * SAMPLE_RATE), 1)
+        self.silence_rms = 10 ** (silence_dbfs / 20)
+
+    def transcribe(self, audio: np.ndarray, language: str | None = None, fixed_latency: bool = True,
+                   **options: Any) -> Tuple[Iterator[StubSegment], StubInfo]:
+        """其餘 faster-whisper 選項 (initial_prompt、vad_filter 等) 被忽略；fixed_latency=False 時不計固定延遲"""
+        audio = np.asarray(audio, dtype=np.float32)
+        info = StubInfo(language=language or "en", language_probability=1.0, duration=len(audio) / SAMPLE_RATE)
+        return self._segments(audio, self.latency_sec if fixed_latency else 0.0), info
+
+    def _segments(self, audio: np.ndarray, latency: float) -> Iterator[StubSegment]:
+        # 固定延遲只在第一個片段前發生一次
+        for offset in range(0, len(audio), self.segment_samples):
+            chunk = audio[offset:offset + self.segment_samples]
+            time.sleep(latency + self.rtf * len(chunk) / SAMPLE_RATE)
+            latency = 0.0
+            yield self._make_segment(chunk, offset / SAMPLE_RATE)
+
+    def _make_segment(self, chunk: np.ndarray, start: float) -> StubSegment:
+        # 每秒音訊對應一個由其內容雜湊決定的詞: 音訊變長時前面的詞不變 (中間結果能形成穩定前綴)
+        words = []
+        for offset in range(0, len(chunk), SAMPLE_RATE):
+            second = chunk[offset:offset + SAMPLE_RATE]
+            if float(np.sqrt(np.mean(np.square(second)))) >= self.silence_rms:
+                words.append(_STUB_WORDS[hashlib.blake2b(second.tobytes(), digest_size=1).digest()[0] % len(_STUB_WORDS)])
+        end = start + len(chunk) / SAMPLE_RATE
+        if not words:
+            return StubSegment(start, end, "", no_speech_prob=0.95, avg_logprob=-1.0)
+        return StubSegment(start, end, " ".join(words).capitalize() + ".", no_speech_prob=0.01, avg_logprob=-0.2)
+
+
+class StubBackend(STTBackend):
+    """
+    確定性的模擬後端，用於在沒有模型與 GPU 的機器上 (CI、CPU 基準測試) 測試與剖析
+    分幀、VAD、排程與 WebSocket 分發等流水線開銷。模型路徑不需要存在。
+    """
+    name = "stub"
+
+    def __init__(self, latency_ms: float, rtf: float, segment_sec: float):
+        self.latency_ms = latency_ms
+        self.rtf = rtf
+        self.segment_sec = segment_sec
+
+    def check_model_path(self, model_path: str):
+        pass
+
+    def load_model(self, model_path: str, compute_type: str | None = None) -> StubModel:
+        logger.info(f"Loading stub STT model for '{model_path}' (latency: {self.latency_ms:g} ms, RTF: {self.rtf:g})")
+        return StubModel(model_path, self.latency_ms, self.rtf, self.segment_sec)
+
+    def transcribe_batch(self, model: StubModel, audios: List[np.ndarray], options: Dict[str, Any]) -> List[Tuple[List[DecodedSegment], Any]]:
+        # 模擬批次推理: 固定延遲整批只付一次，其餘按總音訊長度計算
+        results = []
+        for index, audio in enumerate(audios):
+            segments, info = model.transcribe(audio, fixed_latency=index == 0, **options)
+            results.append(([to_decoded(segment) for segment in segments], info))
+        return results
+
+
+def create_stt_backend(backend: str = settings.stt_backend) -> STTBackend:
+    """根據配置創建 STT 後端"""
+    if backend == "stub":
+        return StubBackend(settings.stt_stub_latency_ms, settings.stt_stub_rtf, settings.stt_stub_segment_sec)
+    if backend != "faster_whisper":
+        logger.error(f"Unknown STT backend '{backend}'. Falling back to faster_whisper.")
+    return FasterWhisperBackend()
+
+
+# --- 全局後端 (模型登記表、排程器與轉錄函數共用) ---
+stt_backend = create_stt_backend()
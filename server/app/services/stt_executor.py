@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class STTQueueFullError(RuntimeError):
+    """STT 等待隊列已滿，新的工作被拒絕 (由 API 層轉換為 429)"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"STT queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class STTExecutor:
+    """
+    STT 專用的有界執行引擎。
+
+    所有轉錄工作 (文件上傳與流式片段) 都在這個固定大小的線程池中執行，
+    不再與默認線程池中的其他工作競爭，同時限制同時進入 CTranslate2 的轉錄數量。
+    `admission=True` 的工作 (文件上傳) 在等待隊列已滿時會被直接拒絕，
+    避免其堆積拖慢所有即時流的延遲；流式片段則總是被接受。
+    """
+
+    # 估算 Retry-After 用的平均工作時長平滑係數
+    _EWMA_ALPHA = 0.2
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_workers = max(max_workers, 1)
+        self.max_pending = max(max_pending, 0)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stt-worker")
+        self._lock = threading.Lock() # 保護下列計數 (工作完成時在工作線程中更新)
+        self._submitted = 0 # 已提交但尚未完成的工作數 (執行中 + 排隊中)
+        self._avg_job_sec = 1.0
+        self.jobs_completed = 0
+        self.jobs_rejected = 0
+        self.jobs_cancelled = 0 # 開始執行前被撤回的工作
+
+    @property
+    def queue_depth(self) -> int:
+        """正在排隊 (尚未取得工作線程) 的工作數"""
+        return max(self._submitted - self.max_workers, 0)
+
+    def _retry_after(self) -> int:
+        # 估算隊列清空所需時間
+        return max(math.ceil(self._avg_job_sec * (self.queue_depth + 1) / self.max_workers), 1)
+
+    def submit(self, func: Callable[..., Any], *args: Any, admission: bool = False) -> Future:
+        """
+        將 func(*args) 提交到 STT 線程池，返回 concurrent.futures.Future。
+        只有尚未開始執行的工作可以撤回 (Future.cancel() 返回 True)；已開始的工作會在線程中執行完，
+        其佔用的名額在線程真正結束時才釋放，排隊深度與准入判斷因此不會低估。
+        """
+        if admission and self.queue_depth >= self.max_pending:
+            self.jobs_rejected += 1
+            retry_after = self._retry_after()
+            logger.warning(f"STT queue full ({self.queue_depth} pending, limit {self.max_pending}). Rejecting job, retry after {retry_after}s.")
+            raise STTQueueFullError(retry_after)
+
+        with self._lock:
+            self._submitted += 1
+        started_at = time.perf_counter()
+
+        def on_done(future: Future):
+            with self._lock:
+                self._submitted -= 1
+                if future.cancelled():
+                    self.jobs_cancelled += 1
+                    return
+                self.jobs_completed += 1
+                elapsed = time.perf_counter() - started_at
+                self._avg_job_sec += self._EWMA_ALPHA * (elapsed - self._avg_job_sec)
+
+        future = self._pool.submit(func, *args)
+        future.add_done_callback(on_done)
+        return future
+
+    async def run(self, func: Callable[..., Any], *args: Any, admission: bool = False) -> Any:
+        """在 STT 線程池中執行 func(*args)。等待被取消時撤回尚未開始的工作"""
+        return await asyncio.wrap_future(self.submit(func, *args, admission=admission))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "in_flight": self._submitted,
+            "queue_depth": self.queue_depth,
+            "jobs_completed": self.jobs_completed,
+            "jobs_rejected": self.jobs_rejected,
+            "jobs_cancelled": self.jobs_cancelled,
+            "avg_job_sec": self._avg_job_sec,
+        }
+
+    def shutdown(self):
+        logger.info("Shutting down STT executor...")
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+# --- 全局 STT 執行引擎 ---
+stt_executor = STTExecutor(
+    max_workers=settings.stt_num_workers,
+    max_pending=settings.stt_max_pending_jobs,
+)
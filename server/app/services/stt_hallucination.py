@@ -0,0 +1,106 @@
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+from .stt_partials import split_units
+
+_PUNCTUATION_PATTERN = re.compile(r"[^\w]+")
+
+
+class PhraseMatcher:
+    """
+    以 Aho-Corasick 自動機一次掃描文本，找出所有出現的幻覺詞 (不區分大小寫)。
+    取代逐個詞組 lower()/in 的掃描: 詞組再多也只需對文本掃描一遍，自動機在模組載入時建好。
+    """
+
+    def __init__(self, phrases: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[str]] = [[]]
+        for phrase in phrases:
+            self._add(phrase)
+        self._build()
+
+    def _add(self, phrase: str):
+        state = 0
+        for char in phrase.lower():
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append(phrase)
+
+    def _build(self):
+        # 廣度優先計算失敗指針，並把失敗鏈上的輸出合併到每個狀態
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> List[str]:
+        """返回文本中出現的所有詞組 (每個詞組最多一次，按首次出現順序)"""
+        found: List[str] = []
+        state = 0
+        for char in text.lower():
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for phrase in self._output[state]:
+                if phrase not in found:
+                    found.append(phrase)
+        return found
+
+
+class RepetitionDetector:
+    """
+    增量式 n-gram 重複檢測，用於發現 Whisper 的重複循環 ("Thank you. Thank you. Thank you...")。
+
+    每個片段的文本切成單位 (英文等按詞，中日韓按字，忽略大小寫與標點) 後追加到單位序列，
+    再檢查序列尾部是否為某個長度 n (1..max_ngram) 的單位組連續重複至少 min_repeats 次
+    且重複部分共至少 min_tokens 個單位 (避免 "no no no" 之類的正常重複被誤判)。
+    """
+
+    def __init__(self, max_ngram: int = 8, min_repeats: int = 3, min_tokens: int = 6):
+        self.max_ngram = max_ngram
+        self.min_repeats = min_repeats
+        self.min_tokens = min_tokens
+        self.units: List[str] = []
+
+    @property
+    def lookback_units(self) -> int:
+        """
+        檢測到循環時，重複部分最多延伸到觸發文本之前多少個單位 (觸發前的尾部尚未構成循環，其週期部分短於此值)。
+        起點早於 len(units) - lookback_units 的文本不會被之後檢測到的循環丟棄。
+        """
+        return self.max_ngram * (self.min_repeats + 1) + self.min_tokens
+
+    def feed(self, text: str) -> Tuple[int, int] | None:
+        """
+        追加一段文本，檢測到循環時返回 (n, 重複次數)，否則返回 None。
+        循環中第一次出現之後的重複部分從單位位置 len(units) - (重複次數 - 1) * n 開始。
+        """
+        for unit in split_units(text):
+            unit = _PUNCTUATION_PATTERN.sub("", unit.lower())
+            if unit:
+                self.units.append(unit)
+        if self.min_repeats < 2:
+            return None
+        units = self.units
+        for n in range(1, min(self.max_ngram, len(units) // self.min_repeats) + 1):
+            tail = units[-n:]
+            repeats = 1
+            while len(units) >= (repeats + 1) * n and units[-(repeats + 1) * n:-repeats * n] == tail:
+                repeats += 1
+            if repeats >= self.min_repeats and repeats * n >= self.min_tokens:
+                return n, repeats
+        return None
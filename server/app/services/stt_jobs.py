@@ -0,0 +1,322 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, BinaryIO, Dict, List
+
+from ..core.config import settings
+from .audio_decode import decode_audio_to_float32
+from .stt_executor import stt_executor
+from .stt_result_cache import compute_cache_key, result_cache
+from .stt_service import model_registry, stream_transcription
+
+logger = logging.getLogger(__name__)
+
+# 任務狀態
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT,
+    upload_path TEXT,
+    model TEXT,
+    language TEXT,
+    prompt TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    duration REAL,
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+# GET /jobs/{id} 返回的欄位 (不含結果本身)
+_STATUS_COLUMNS = ("id", "status", "filename", "model", "language", "created_at", "started_at", "finished_at", "duration", "progress", "error")
+
+
+class JobStore:
+    """
+    以 SQLite 持久化的轉錄任務隊列。上傳內容保存在 uploads 目錄，結果 (全文/片段/資訊) 以 JSON 存入資料庫。
+    所有查詢都很短，由一個連接加鎖串行執行。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.upload_dir = os.path.join(directory, "uploads")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(directory, "jobs.sqlite3"), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params)
+
+    def create(self, job_id: str, filename: str | None, upload_path: str, model: str, language: str | None, prompt: str | None):
+        self._execute(
+            "INSERT INTO jobs (id, status, filename, upload_path, model, language, prompt, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, JOB_QUEUED, filename, upload_path, model, language, prompt, time.time()),
+        )
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def claim_next(self) -> Dict[str, Any] | None:
+        """取出最早的排隊任務並標記為執行中"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_QUEUED,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE jobs SET status = ?, started_at = ?, progress = 0 WHERE id = ?", (JOB_RUNNING, time.time(), row["id"]))
+        job = dict(row)
+        job["status"] = JOB_RUNNING
+        return job
+
+    def update(self, job_id: str, **fields: Any):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def cancel_if_queued(self, job_id: str) -> bool:
+        cursor = self._execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?", (JOB_CANCELLED, time.time(), job_id, JOB_QUEUED))
+        return cursor.rowcount > 0
+
+    def requeue_interrupted(self) -> int:
+        """服務重啟後，將上次執行到一半的任務放回隊列"""
+        return self._execute("UPDATE jobs SET status = ?, started_at = NULL, progress = 0 WHERE status = ?", (JOB_QUEUED, JOB_RUNNING)).rowcount
+
+    def purge_finished(self, older_than: float) -> List[str]:
+        """刪除早於 older_than 結束的任務，返回其上傳文件路徑"""
+        placeholders = ", ".join("?" for _ in FINISHED_STATES)
+        with self._lock, self._conn:
+            rows = self._conn.execute(f"SELECT upload_path FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?", (*FINISHED_STATES, older_than)).fetchall()
+            self._conn.execute(f"DELETE FROM jobs WHERE status IN ({placeholders}) AND finished_at < ?", (*FINISHED_STATES, older_than))
+        return [row["upload_path"] for row in rows if row["upload_path"]]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """
+    非同步轉錄任務的執行器: `concurrency` 個工作協程從 JobStore 取出排隊任務，
+    以流式解碼逐段更新進度，完成後保存結果並刪除暫存的上傳文件。
+    執行中的任務可被取消 (在當前片段之後停止解碼)。
+    """
+
+    # 進度寫入資料庫的最小間隔 (秒)
+    PROGRESS_INTERVAL_SEC = 1.0
+
+    def __init__(self, directory: str, concurrency: int, retention_sec: float):
+        self.directory = directory
+        self.concurrency = max(concurrency, 1)
+        self.retention_sec = retention_sec
+        self._store: JobStore | None = None
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._cancel_requested: set[str] = set()
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore(self.directory)
+        return self._store
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    def start(self):
+        if self._workers:
+            return
+        requeued = self.store.requeue_interrupted()
+        if requeued:
+            logger.info(f"Re-queued {requeued} transcription job(s) interrupted by the last shutdown.")
+        self._purge_expired()
+        self._wakeup = asyncio.Event()
+        self._wakeup.set() # 啟動時先處理已在隊列中的任務
+        self._workers = [asyncio.create_task(self._worker_loop(i)) for i in range(self.concurrency)]
+        logger.info(f"Transcription job manager started ({self.concurrency} worker(s), directory: {self.directory}).")
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    async def submit(self, file: BinaryIO, filename: str | None, model: str, language: str | None, prompt: str | None) -> Dict[str, Any]:
+        """將上傳內容寫入磁碟 (在背景線程複製) 並加入隊列"""
+        job_id = uuid.uuid4().hex
+        suffix = os.path.splitext(filename or "")[1][:16]
+        upload_path = os.path.join(self.store.upload_dir, job_id + suffix)
+
+        def spool():
+            file.seek(0)
+            with open(upload_path, "wb") as out:
+                shutil.copyfileobj(file, out, length=1024 * 1024)
+
+        await asyncio.to_thread(spool)
+        self.store.create(job_id, filename, upload_path, model, language, prompt)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        logger.info(f"Transcription job {job_id} queued (file: '{filename}', {os.path.getsize(upload_path) / 1024 / 1024:.1f} MB).")
+        return self.status(job_id)
+
+    def status(self, job_id: str) -> Dict[str, Any] | None:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        return {name: job[name] for name in _STATUS_COLUMNS}
+
+    def result(self, job_id: str) -> Dict[str, Any] | None:
+        """返回已完成任務的結果 {"text", "segments", "info"}；未完成時返回 None"""
+        job = self.store.get(job_id)
+        if job is None or job["status"] != JOB_COMPLETED or not job["result"]:
+            return None
+        return json.loads(job["result"])
+
+    def cancel(self, job_id: str) -> Dict[str, Any] | None:
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == JOB_QUEUED and self.store.cancel_if_queued(job_id):
+            self._remove_upload(job["upload_path"])
+            logger.info(f"Transcription job {job_id} cancelled before it started.")
+        elif job["status"] == JOB_RUNNING:
+            self._cancel_requested.add(job_id) # 工作協程在下一個片段時停止
+            logger.info(f"Cancellation requested for running transcription job {job_id}.")
+        return self.status(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"workers": len(self._workers), "jobs": self.store.counts() if self._store is not None else {}}
+
+    # --- 內部 ---
+    def _remove_upload(self, path: str | None):
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _purge_expired(self):
+        if self.retention_sec <= 0:
+            return
+        for path in self.store.purge_finished(time.time() - self.retention_sec):
+            self._remove_upload(path)
+
+    async def _worker_loop(self, index: int):
+        while True:
+            job = self.store.claim_next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await self._run_job(job)
+            self._purge_expired()
+
+    async def _run_job(self, job: Dict[str, Any]):
+        job_id = job["id"]
+        logger.info(f"Transcription job {job_id} started.")
+        stt_model = None
+        final_status, error = JOB_COMPLETED, None
+        try:
+            stt_model = await model_registry.acquire(job["model"])
+
+            def decode():
+                with open(job["upload_path"], "rb") as file:
+                    return decode_audio_to_float32(file)
+
+            audio_np = await stt_executor.run(decode)
+            started_at = time.perf_counter()
+            cache_key = await asyncio.to_thread(compute_cache_key, audio_np, model_registry.identity(stt_model), job["language"], job["prompt"])
+            cached = await result_cache.get(cache_key)
+            if cached is not None:
+                text, segments, info = cached
+                info = {**info, "cached": True}
+                self.store.update(job_id, duration=info["duration"])
+            else:
+                info: Dict[str, Any] = {}
+                segments: List[Dict[str, Any]] = []
+                last_progress_at = 0.0
+                async for event in stream_transcription(audio_np, job["language"], job["prompt"], stt_model):
+                    if job_id in self._cancel_requested:
+                        final_status = JOB_CANCELLED
+                        break
+                    if event["type"] == "info":
+                        info = {key: value for key, value in event.items() if key != "type"}
+                        self.store.update(job_id, duration=info["duration"])
+                        continue
+                    segments.append({"start": event["start"], "end": event["end"], "text": event["text"]})
+                    now = time.monotonic()
+                    if info.get("duration") and now - last_progress_at >= self.PROGRESS_INTERVAL_SEC:
+                        last_progress_at = now
+                        self.store.update(job_id, progress=round(min(event["end"] / info["duration"], 1.0), 4))
+                text = " ".join(segment["text"] for segment in segments)
+                if final_status == JOB_COMPLETED:
+                    await result_cache.put(cache_key, (text, segments, info))
+                    info = {**info, "cached": False}
+            del audio_np
+
+            if final_status == JOB_COMPLETED:
+                processing_sec = time.perf_counter() - started_at
+                duration = info.get("duration") or 0.0
+                info["processing_sec"] = round(processing_sec, 3)
+                info["real_time_factor"] = round(processing_sec / duration, 4) if duration > 0 else None
+                result = {"text": text, "segments": segments, "info": info}
+                self.store.update(job_id, status=JOB_COMPLETED, progress=1.0, finished_at=time.time(), result=json.dumps(result, ensure_ascii=False))
+                logger.info(f"Transcription job {job_id} completed ({duration:.1f}s audio in {processing_sec:.1f}s).")
+        except asyncio.CancelledError:
+            # 服務關閉: 保持 running 狀態，下次啟動時重新排隊
+            logger.info(f"Transcription job {job_id} interrupted by shutdown; it will be re-queued on restart.")
+            raise
+        except Exception as e:
+            logger.error(f"Transcription job {job_id} failed: {e}", exc_info=True)
+            final_status, error = JOB_FAILED, str(e)
+        finally:
+            if stt_model is not None:
+                model_registry.release(stt_model)
+            self._cancel_requested.discard(job_id)
+
+        if final_status != JOB_COMPLETED:
+            self.store.update(job_id, status=final_status, finished_at=time.time(), error=error)
+            if final_status == JOB_CANCELLED:
+                logger.info(f"Transcription job {job_id} cancelled.")
+        self._remove_upload(job["upload_path"])
+
+
+# --- 全局任務管理器 (資料庫在首次使用時才建立) ---
+job_manager = JobManager(
+    directory=settings.stt_jobs_dir,
+    concurrency=settings.stt_job_concurrency,
+    retention_sec=settings.stt_job_retention_hours * 3600,
+)
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .stt_executor import stt_executor
+from .stt_backends import stt_backend
+from .stt_service import transcribe_audio_array
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+SAMPLES_PER_FRAME = 480 # 30 ms，與流式 VAD 幀一致
+SMOOTHING_FRAMES = 10 # 以約 0.3 秒的平均能量尋找靜音，避免切在單個低能量幀 (例如爆破音之前)
+
+
+def find_chunk_boundaries(audio_np: np.ndarray, chunk_samples: int, search_samples: int) -> List[Tuple[int, int]]:
+    """
+    將長音訊切成約 chunk_samples 長的區塊，返回 (起點, 終點) 樣本位置列表。
+
+    每個切點選在目標位置之前 search_samples 範圍內平滑能量最低處 (即最安靜的靜音段)，
+    讓切點落在句子之間而不是詞的中間。最後一塊不足 1/4 區塊長度時併入前一塊。
+    """
+    total = len(audio_np)
+    if total <= chunk_samples * 1.25:
+        return [(0, total)]
+
+    frame_count = total // SAMPLES_PER_FRAME
+    frames = audio_np[:frame_count * SAMPLES_PER_FRAME].reshape(frame_count, SAMPLES_PER_FRAME)
+    energies = np.einsum("ij,ij->i", frames, frames)
+    smoothed = np.convolve(energies, np.ones(SMOOTHING_FRAMES, dtype=np.float32) / SMOOTHING_FRAMES, mode="same")
+
+    bounds: List[Tuple[int, int]] = []
+    start = 0
+    while total - start > chunk_samples * 1.25:
+        target = start + chunk_samples
+        low = max(target - search_samples, start + SAMPLES_PER_FRAME) // SAMPLES_PER_FRAME
+        high = max(target // SAMPLES_PER_FRAME, low + 1)
+        cut = (low + int(np.argmin(smoothed[low:high]))) * SAMPLES_PER_FRAME + SAMPLES_PER_FRAME // 2
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, total))
+    return bounds
+
+
+def _detect_language(model, audio_np: np.ndarray) -> Tuple[str | None, float | None]:
+    """對開頭的音訊做一次語言檢測，讓所有區塊使用同一語言 (避免各區塊檢測結果不一致)"""
+    if model is None:
+        return None, None
+    return stt_backend.detect_language(model, audio_np[:SAMPLE_RATE * 30 * 3], vad_filter=True, language_detection_segments=3)
+
+
+async def transcribe_long_audio(audio_np: np.ndarray, language: str | None = None, initial_prompt: str | None = None,
+                                model=None, chunk_sec: float = settings.stt_long_audio_chunk_sec,
+                                parallelism: int = settings.stt_long_audio_parallelism) -> Tuple[str, list, Dict[str, Any]]:
+    """
+    長文件模式: 在靜音處將音訊切成區塊，以 STT 執行引擎並行轉錄 (最多 parallelism 個同時進行)，
+    再按順序合併片段並將時間戳轉回整個文件的絕對時間。返回格式與 transcribe_audio_array 相同，
+    資訊中額外包含區塊數與並行度。
+    """
+    duration = len(audio_np) / SAMPLE_RATE
+    bounds = find_chunk_boundaries(
+        audio_np,
+        chunk_samples=int(chunk_sec * SAMPLE_RATE),
+        search_samples=int(min(settings.stt_long_audio_split_search_sec, chunk_sec / 2) * SAMPLE_RATE),
+    )
+    # 區塊與流式會話共用執行引擎: 默認保留一個線程，長文件不會佔滿所有線程而讓流式解碼排隊
+    parallelism = max(parallelism or stt_executor.max_workers - 1, 1)
+    logger.info(f"Long-file mode: {duration:.1f}s split into {len(bounds)} chunks (~{chunk_sec:g}s each), parallelism {parallelism}.")
+
+    language_probability = None
+    if language is None and len(bounds) > 1:
+        language, language_probability = await stt_executor.run(_detect_language, model, audio_np)
+        logger.info(f"Long-file mode: detected language '{language}' ({language_probability}) for all chunks.")
+
+    semaphore = asyncio.Semaphore(parallelism)
+
+    async def run_chunk(index: int, start: int, end: int):
+        async with semaphore:
+            started_at = time.perf_counter()
+            result = await stt_executor.run(
+                transcribe_audio_array, audio_np[start:end], language, initial_prompt, model,
+                f"[chunk {index + 1}/{len(bounds)} @ {start / SAMPLE_RATE:.1f}s] "
+            )
+            logger.info(f"Chunk {index + 1}/{len(bounds)} ({(end - start) / SAMPLE_RATE:.1f}s) done in {time.perf_counter() - started_at:.2f}s")
+            return result
+
+    results = await asyncio.gather(*(run_chunk(i, start, end) for i, (start, end) in enumerate(bounds)))
+
+    segments_list: List[Dict[str, Any]] = []
+    for (start, _), (_, chunk_segments, _) in zip(bounds, results):
+        offset = start / SAMPLE_RATE
+        for segment in chunk_segments:
+            segments_list.append({"start": segment["start"] + offset, "end": segment["end"] + offset, "text": segment["text"]})
+    full_text = " ".join(text for text, _, _ in results if text)
+
+    first_info = results[0][2]
+    info_dict = {
+        "language": language or first_info["language"],
+        "language_probability": language_probability if language_probability is not None else first_info["language_probability"],
+        "duration": duration,
+        "chunks": len(bounds),
+        "parallelism": parallelism,
+        "repetition_loops": sum(info.get("repetition_loops", 0) for _, _, info in results),
+        "repetition_segments_dropped": sum(info.get("repetition_segments_dropped", 0) for _, _, info in results),
+    }
+    return full_text, segments_list, info_dict
@@ -0,0 +1,368 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# OpenAI 相容客戶端默認送出的模型名，視為默認模型
+OPENAI_DEFAULT_MODEL_NAMES = {"", "whisper-1"}
+
+
+def parse_model_paths(spec: str) -> Dict[str, str]:
+    """解析 "name=path,name=path" 格式的模型列表"""
+    models: Dict[str, str] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, path = item.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            logger.error(f"Ignoring invalid STT_MODELS entry: '{item}' (expected name=path)")
+            continue
+        models[name.strip()] = path.strip()
+    return models
+
+
+def estimate_model_size_mb(path: str) -> float:
+    """以模型目錄在磁碟上的大小粗略估算載入後佔用的記憶體 (MB)"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total / (1024 * 1024)
+
+
+def process_rss_mb() -> float | None:
+    """目前進程的常駐記憶體 (MB)，無法取得時返回 None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class UnknownModelError(KeyError):
+    """請求了未在 STT_MODELS 中配置的模型"""
+
+
+@dataclass
+class _LoadedModel:
+    model: Any
+    size_mb: float
+    path: str = ""
+    compute_type: str | None = None
+    last_used: float = field(default_factory=time.monotonic)
+    in_use: int = 0 # 正在使用此模型對象的工作數 (上傳請求 / 解碼中的片段)
+    sessions: int = 0 # 綁定此模型名稱的流式會話數；兩者都為 0 時才可卸載
+
+
+class ModelRegistry:
+    """
+    多模型登記表: 按名稱惰性載入 STT 模型 (由 loader，即 STT 後端的 load_model 創建)。
+
+    - 首次使用時才載入，超過記憶體預算時按 LRU 卸載未被使用的模型；
+      載入 (數秒) 不持有鎖，事件循環上的 checkout / release 不會因其他模型正在載入而阻塞；
+    - 閒置超過 idle_timeout_sec 的模型會被定期卸載；
+    - 默認模型常駐，不參與淘汰；
+    - 支援熱替換 (swap)：新模型載入完成後原子地接手後續工作，舊模型在進行中的工作結束後釋放。
+    """
+
+    def __init__(self, model_paths: Dict[str, str], default_name: str, loader: Callable[[str, str | None], Any],
+                 memory_budget_mb: float = 0.0, idle_timeout_sec: float = 0.0, identity_prefix: str = ""):
+        self.model_paths = dict(model_paths)
+        self.identity_prefix = identity_prefix # 區分不同後端以相同路徑載入的模型
+        self.default_name = default_name
+        self.memory_budget_mb = memory_budget_mb
+        self.idle_timeout_sec = idle_timeout_sec
+        self._loader = loader
+        self._loaded: "OrderedDict[str, _LoadedModel]" = OrderedDict()
+        self._draining: List[_LoadedModel] = [] # 已被熱替換、仍有工作在使用的舊模型
+        self._swap_task: asyncio.Task | None = None
+        self.swap_status: Dict[str, Any] = {"state": "idle"}
+        self._lock = threading.RLock() # 只保護登記表狀態，不在持有期間載入模型
+        self._loading: Dict[str, concurrent.futures.Future] = {} # 名稱 -> 正在進行的載入 (同名的並發載入只執行一次)
+        self._reaper_task: asyncio.Task | None = None
+        self.loads = 0
+        self.evictions = 0
+
+    def resolve_name(self, name: str | None) -> str:
+        """將請求中的模型名對應到登記表中的名稱"""
+        if name is None or name in OPENAI_DEFAULT_MODEL_NAMES:
+            return self.default_name
+        if name not in self.model_paths:
+            raise UnknownModelError(name)
+        return name
+
+    def get_loaded(self, name: str | None = None) -> Any | None:
+        """返回已載入的模型 (不觸發載入)"""
+        entry = self._loaded.get(self.resolve_name(name))
+        return entry.model if entry else None
+
+    def _get_loaded_locked(self, name: str, hold: bool) -> Any | None:
+        """已載入時更新 LRU 順序 (hold=True 時同時標記為使用中) 並返回模型，未載入時返回 None；調用者須持有鎖"""
+        entry = self._loaded.get(name)
+        if entry is None:
+            return None
+        entry.last_used = time.monotonic()
+        if hold:
+            entry.in_use += 1
+        self._loaded.move_to_end(name)
+        return entry.model
+
+    def _hold_loaded(self, name: str) -> Any | None:
+        """不觸發載入: 模型已載入時標記為使用中並返回，否則返回 None (可在事件循環上調用)"""
+        with self._lock:
+            return self._get_loaded_locked(name, hold=True)
+
+    def load(self, name: str | None = None, hold: bool = False) -> Any:
+        """
+        同步載入 (或取得已載入的) 模型，必要時先按 LRU 淘汰其他模型；hold=True 時同時標記為使用中。
+        會阻塞調用線程數秒，只能在背景線程 (或啟動時) 調用。同名模型正在載入時等待該次載入完成。
+        """
+        name = self.resolve_name(name)
+        while True:
+            with self._lock:
+                model = self._get_loaded_locked(name, hold)
+                if model is not None:
+                    return model
+                loading = self._loading.get(name)
+                if loading is None:
+                    loading = self._loading[name] = concurrent.futures.Future()
+                    break
+            loading.result() # 由其他線程載入 (失敗時拋出相同的異常)，之後重新檢查 (可能已被淘汰)
+
+        try:
+            path = self.model_paths[name]
+            size_mb = estimate_model_size_mb(path)
+            with self._lock:
+                self._make_room(size_mb)
+            logger.info(f"Loading STT model '{name}' from '{path}' (~{size_mb:.0f} MB)...")
+            model = self._loader(path, None) # 不持有鎖: 載入期間其他模型照常取用與釋放
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(name, None)
+            loading.set_exception(e)
+            raise
+
+        with self._lock:
+            self._loading.pop(name, None)
+            if name not in self._loaded: # 載入期間被熱替換時保留替換後的模型
+                self._loaded[name] = _LoadedModel(model=model, size_mb=size_mb, path=path)
+                self.loads += 1
+                logger.info(f"STT model '{name}' loaded. Loaded models: {list(self._loaded)}")
+            model = self._get_loaded_locked(name, hold)
+        loading.set_result(model)
+        return model
+
+    def _make_room(self, incoming_mb: float):
+        if self.memory_budget_mb <= 0:
+            return
+        for name in list(self._loaded):
+            if self._used_mb() + incoming_mb <= self.memory_budget_mb:
+                return
+            entry = self._loaded[name]
+            if name != self.default_name and entry.in_use == 0 and entry.sessions == 0:
+                self._unload(name, reason="memory budget")
+        if self._used_mb() + incoming_mb > self.memory_budget_mb:
+            logger.warning(f"STT model memory budget exceeded ({self._used_mb() + incoming_mb:.0f} MB > {self.memory_budget_mb:.0f} MB); all other models are in use.")
+
+    @property
+    def loaded_count(self) -> int:
+        """已載入 (不含正在排空) 的模型數"""
+        return len(self._loaded)
+
+    def _used_mb(self) -> float:
+        return sum(entry.size_mb for entry in self._loaded.values()) + sum(entry.size_mb for entry in self._draining)
+
+    def _unload(self, name: str, reason: str):
+        entry = self._loaded.pop(name)
+        self.evictions += 1
+        logger.info(f"Unloading STT model '{name}' ({reason}, ~{entry.size_mb:.0f} MB).")
+        del entry
+
+    async def acquire(self, name: str | None = None) -> Any:
+        """取得模型並標記為使用中 (載入在背景線程進行)，用完後必須調用 release"""
+        name = self.resolve_name(name)
+        model = self._hold_loaded(name) # 已載入，只更新 LRU 順序
+        if model is None:
+            model = await asyncio.to_thread(self.load, name, True)
+        return model
+
+    async def checkout(self, name: str | None = None) -> Any:
+        """
+        取得名稱目前對應的模型並標記為使用中 (用於單個流式片段)，用完後必須調用 release。
+        熱替換之後，新的片段會拿到新模型，已取得舊模型的片段則在舊模型上完成。
+        """
+        return await self.acquire(name)
+
+    def release(self, model: Any):
+        with self._lock:
+            for entry in self._loaded.values():
+                if entry.model is model:
+                    entry.in_use = max(entry.in_use - 1, 0)
+                    entry.last_used = time.monotonic()
+                    return
+            for entry in self._draining:
+                if entry.model is model:
+                    entry.in_use = max(entry.in_use - 1, 0)
+                    if entry.in_use == 0:
+                        self._draining.remove(entry)
+                        logger.info(f"Old STT model '{entry.path}' drained and released (~{entry.size_mb:.0f} MB). RSS: {process_rss_mb() or 0:.0f} MB")
+                        self._update_swap_after_drain()
+                    return
+
+    def identity(self, model: Any) -> str:
+        """返回模型實例的標識 (路徑 + 計算類型)，熱替換後同名模型的標識會改變，供結果緩存作為鍵的一部分"""
+        with self._lock:
+            for entry in list(self._loaded.values()) + self._draining:
+                if entry.model is model:
+                    return f"{self.identity_prefix}{entry.path}|{entry.compute_type or 'default'}"
+        return f"unregistered:{id(model)}"
+
+    async def pin(self, name: str | None = None) -> str:
+        """流式會話綁定一個模型名稱 (必要時先載入)，會話期間該名稱不會被卸載；返回解析後的名稱"""
+        name = self.resolve_name(name)
+        while True:
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    entry.sessions += 1
+                    return name
+            # 未載入 (或極少數情況下載入後立即被淘汰): 在背景線程載入後重新檢查
+            await asyncio.to_thread(self.load, name)
+
+    def unpin(self, name: str):
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                entry.sessions = max(entry.sessions - 1, 0)
+                entry.last_used = time.monotonic()
+
+    # --- 熱替換 ---
+    def _swap_sync(self, name: str, path: str, compute_type: str | None):
+        size_mb = estimate_model_size_mb(path)
+        rss_before = process_rss_mb()
+        logger.info(f"Hot-swap: loading '{path}' (compute type: {compute_type or 'default'}) for model '{name}'...")
+        new_model = self._loader(path, compute_type)
+        with self._lock:
+            old = self._loaded.get(name)
+            new_entry = _LoadedModel(model=new_model, size_mb=size_mb, path=path, compute_type=compute_type)
+            if old is not None:
+                new_entry.sessions = old.sessions # 會話綁定的是名稱，直接轉移到新模型
+                if old.in_use > 0:
+                    self._draining.append(old)
+            self._loaded[name] = new_entry
+            self._loaded.move_to_end(name)
+            self.model_paths[name] = path
+            self.loads += 1
+            draining = old is not None and old.in_use > 0
+            self.swap_status.update({
+                "state": "draining" if draining else "done",
+                "swapped_at": time.time(),
+                "rss_mb_before_load": rss_before,
+                "rss_mb_after_load": process_rss_mb(),
+                "old_model_in_flight": old.in_use if old is not None else 0,
+            })
+        logger.info(f"Hot-swap: model '{name}' now served by '{path}'. "
+                    f"{'Old model draining.' if draining else 'Old model released.'} RSS: {process_rss_mb() or 0:.0f} MB")
+        return new_model
+
+    def _update_swap_after_drain(self):
+        if self.swap_status.get("state") == "draining" and not self._draining:
+            self.swap_status.update({"state": "done", "drained_at": time.time(), "rss_mb_after_drain": process_rss_mb()})
+
+    async def swap(self, name: str | None, path: str, compute_type: str | None = None) -> Any:
+        """
+        在背景線程載入新模型後原子地替換 name 對應的模型 (零停機)。
+        載入期間所有請求繼續使用舊模型；替換後新片段使用新模型，
+        已在解碼中的片段在舊模型上完成，舊模型在最後一個工作結束後釋放。
+        """
+        name = self.resolve_name(name)
+        self.swap_status = {"state": "loading", "model": name, "path": path, "compute_type": compute_type,
+                            "started_at": time.time(), "rss_mb_at_start": process_rss_mb()}
+        try:
+            return await asyncio.to_thread(self._swap_sync, name, path, compute_type)
+        except Exception as e:
+            logger.error(f"Hot-swap of model '{name}' to '{path}' failed: {e}", exc_info=True)
+            self.swap_status.update({"state": "failed", "error": str(e)})
+            raise
+
+    def start_swap(self, name: str | None, path: str, compute_type: str | None = None,
+                   on_swapped: Callable[[str, Any], None] | None = None) -> Dict[str, Any]:
+        """在背景開始熱替換並立即返回狀態；已有替換在載入中時拋出 RuntimeError"""
+        if self._swap_task is not None and not self._swap_task.done():
+            raise RuntimeError("A model swap is already in progress.")
+        name = self.resolve_name(name)
+
+        async def run():
+            try:
+                model = await self.swap(name, path, compute_type)
+            except Exception:
+                return
+            if on_swapped is not None:
+                on_swapped(name, model)
+
+        self._swap_task = asyncio.create_task(run())
+        return {"state": "loading", "model": name, "path": path, "compute_type": compute_type}
+
+    def unload_idle(self):
+        """卸載閒置超時且未被使用的模型 (默認模型除外)"""
+        if self.idle_timeout_sec <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for name, entry in list(self._loaded.items()):
+                if name != self.default_name and entry.in_use == 0 and entry.sessions == 0 and now - entry.last_used > self.idle_timeout_sec:
+                    self._unload(name, reason=f"idle for {now - entry.last_used:.0f}s")
+
+    async def _reap_idle_loop(self):
+        interval = max(min(self.idle_timeout_sec / 2, 60.0), 1.0)
+        while True:
+            await asyncio.sleep(interval)
+            self.unload_idle()
+
+    def start_idle_reaper(self):
+        if self.idle_timeout_sec > 0 and self._reaper_task is None:
+            self._reaper_task = asyncio.create_task(self._reap_idle_loop())
+
+    async def stop_idle_reaper(self):
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            try:
+                await self._reaper_task
+            except asyncio.CancelledError:
+                pass
+            self._reaper_task = None
+
+    def unload_all(self):
+        with self._lock:
+            for name in list(self._loaded):
+                self._unload(name, reason="shutdown")
+            self._draining.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default_model": self.default_name,
+            "available_models": list(self.model_paths),
+            "loaded_models": {
+                name: {"path": entry.path, "size_mb": round(entry.size_mb, 1), "in_use": entry.in_use, "sessions": entry.sessions,
+                       "idle_sec": round(time.monotonic() - entry.last_used, 1)}
+                for name, entry in self._loaded.items()
+            },
+            "draining_models": [{"path": entry.path, "size_mb": round(entry.size_mb, 1), "in_use": entry.in_use} for entry in self._draining],
+            "memory_used_mb": round(self._used_mb(), 1),
+            "process_rss_mb": process_rss_mb(),
+            "memory_budget_mb": self.memory_budget_mb,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "swap": self.swap_status,
+        }
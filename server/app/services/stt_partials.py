@@ -0,0 +1,77 @@
+import re
+from typing import Any, Dict, List
+
+# 中日韓文字逐字切分，其他文字按空白切分
+_CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_UNIT_PATTERN = re.compile(rf"[{_CJK_CHARS}]|[^\s{_CJK_CHARS}]+")
+_CJK_PATTERN = re.compile(rf"[{_CJK_CHARS}]")
+
+
+def split_units(text: str) -> List[str]:
+    """將轉錄文本切成比較單位 (英文等按詞，中日韓按字)"""
+    return _UNIT_PATTERN.findall(text)
+
+
+def join_units(units: List[str]) -> str:
+    """split_units 的逆操作: 只有兩個非中日韓單位之間才插入空格"""
+    parts: List[str] = []
+    for unit in units:
+        if parts and not _CJK_PATTERN.match(unit) and not _CJK_PATTERN.match(parts[-1][-1]):
+            parts.append(" ")
+        parts.append(unit)
+    return "".join(parts)
+
+
+def _common_prefix_length(a: List[str], b: List[str]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def strip_seam_overlap(previous_tail: List[str], text: str) -> str:
+    """
+    強制切分的片段之間有一小段重疊音訊，兩側的轉錄可能重複相同的詞。
+    找出 previous_tail 的後綴與 text 的前綴最長的重合部分並將其從 text 中移除。
+    """
+    units = split_units(text)
+    for size in range(min(len(previous_tail), len(units)), 0, -1):
+        if previous_tail[-size:] == units[:size]:
+            return join_units(units[size:])
+    return text
+
+
+class LocalAgreement:
+    """
+    中間結果的穩定前綴策略 (LocalAgreement-2)。
+
+    每次對不斷增長的語音緩衝重新解碼得到一個假設，與上一次的假設取最長公共前綴，
+    兩次都同意的部分才被提交 (committed)。已提交的單位不會再被修改或撤回，
+    因此客戶端看到的穩定文本不會閃爍；其餘部分作為不穩定尾巴一併發送。
+    """
+
+    def __init__(self):
+        self.committed: List[str] = []
+        self._previous: List[str] = []
+
+    def update(self, hypothesis: str) -> Dict[str, Any]:
+        units = split_units(hypothesis)
+        agreed = _common_prefix_length(self._previous, units)
+        if agreed > len(self.committed) and units[:len(self.committed)] == self.committed:
+            self.committed = units[:agreed]
+        self._previous = units
+
+        # 新假設與已提交部分不一致時，只在已提交文本之後顯示與其不衝突的尾巴
+        overlap = _common_prefix_length(self.committed, units)
+        unstable = units[overlap:] if overlap == len(self.committed) else []
+        return {
+            "stable_text": join_units(self.committed),
+            "unstable_text": join_units(unstable),
+            "text": join_units(self.committed + unstable),
+        }
+
+    def reset(self):
+        self.committed = []
+        self._previous = []
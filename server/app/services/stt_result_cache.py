@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 緩存值: (全文, 片段列表, 資訊)，與 transcribe_audio_array 的返回值相同
+CachedResult = Tuple[str, list, Dict[str, Any]]
+
+
+def compute_cache_key(audio_np: np.ndarray, model_identity: str, language: str | None, prompt: str | None) -> str:
+    """
+    以解碼後的音訊內容加上模型、語言與提示計算緩存鍵。
+    對解碼後的樣本而非上傳字節做雜湊，因此同一錄音以不同容器/編碼重新匯出時只要解碼結果相同也能命中。
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([model_identity, language, prompt]).encode("utf-8"))
+    digest.update(memoryview(np.ascontiguousarray(audio_np)).cast("B"))
+    return digest.hexdigest()
+
+
+class TranscriptionResultCache:
+    """
+    內容定址的轉錄結果緩存 (兩層)。
+
+    - 記憶體層: 最多 memory_items 個結果的 LRU；
+    - 磁碟層: 每個結果一個 JSON 文件，總大小超過 disk_budget_mb 時按最近使用時間 (mtime) 淘汰。
+    磁碟層命中的結果會被提升到記憶體層。不同 response_format 共用同一份片段結果。
+    """
+
+    def __init__(self, memory_items: int, directory: str | None, disk_budget_mb: float):
+        self.memory_items = max(memory_items, 0)
+        self.directory = directory if directory and disk_budget_mb > 0 else None
+        self.disk_budget_bytes = int(disk_budget_mb * 1024 * 1024)
+        self._memory: "OrderedDict[str, CachedResult]" = OrderedDict()
+        self._disk_lock = threading.Lock()
+        self._disk_bytes: int | None = None # 首次訪問磁碟層時才掃描
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.disk_evictions = 0
+
+    # --- 記憶體層 ---
+    def _remember(self, key: str, value: CachedResult):
+        if self.memory_items == 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # --- 磁碟層 (在背景線程中執行) ---
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _ensure_disk_scanned(self):
+        if self._disk_bytes is not None:
+            return
+        total = 0
+        os.makedirs(self.directory, exist_ok=True)
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith(".json"):
+                    total += os.path.getsize(os.path.join(root, filename))
+        self._disk_bytes = total
+
+    def _disk_get(self, key: str) -> CachedResult | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path) # 更新最近使用時間，供 LRU 淘汰
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            return None
+        return data["text"], data["segments"], data["info"]
+
+    def _disk_put(self, key: str, value: CachedResult):
+        text, segments, info = value
+        payload = json.dumps({"text": text, "segments": segments, "info": info}, ensure_ascii=False).encode("utf-8")
+        if len(payload) > self.disk_budget_bytes:
+            return
+        with self._disk_lock:
+            self._ensure_disk_scanned()
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            self._disk_bytes += len(payload) - previous
+            if self._disk_bytes > self.disk_budget_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                if filename.endswith(".json"):
+                    path = os.path.join(root, filename)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        for _, size, path in entries:
+            if self._disk_bytes <= self.disk_budget_bytes * 0.9: # 多清出一些空間，避免每次寫入都觸發掃描
+                break
+            try:
+                os.remove(path)
+                self._disk_bytes -= size
+                self.disk_evictions += 1
+            except FileNotFoundError:
+                pass
+
+    # --- 公共接口 ---
+    async def get(self, key: str) -> CachedResult | None:
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return value
+        if self.directory is not None:
+            value = await asyncio.to_thread(self._disk_get, key)
+            if value is not None:
+                self.disk_hits += 1
+                self._remember(key, value)
+                return value
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, value: CachedResult):
+        self.stores += 1
+        self._remember(key, value)
+        if self.directory is not None:
+            try:
+                await asyncio.to_thread(self._disk_put, key, value)
+            except OSError as e:
+                logger.warning(f"Failed to write transcription result to disk cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "stores": self.stores,
+            "memory_items": len(self._memory),
+            "disk_bytes": self._disk_bytes,
+            "disk_evictions": self.disk_evictions,
+        }
+
+
+# --- 全局結果緩存 ---
+result_cache = TranscriptionResultCache(
+    memory_items=settings.stt_result_cache_memory_items,
+    directory=settings.stt_result_cache_dir,
+    disk_budget_mb=settings.stt_result_cache_disk_mb,
+)
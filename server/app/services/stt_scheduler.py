@@ -0,0 +1,266 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .stt_executor import stt_executor
+from .stt_backends import DecodedSegment, stt_backend, to_decoded
+from .metrics import STT_DECODE_SECONDS, STT_QUEUE_WAIT_SECONDS, STT_REAL_TIME_FACTOR
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+# 後處理函數: (已解碼片段, info) -> 最終結果，與解碼一起在背景線程中執行
+Postprocess = Callable[[Iterable["DecodedSegment"], Any], Any]
+
+
+@dataclass
+class _PendingSegment:
+    """排隊等待批次解碼的單個語音片段"""
+    model: Any
+    audio: np.ndarray
+    options: Dict[str, Any]
+    future: asyncio.Future
+    postprocess: Postprocess | None = None
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def batch_key(self) -> Tuple[int, Tuple[Tuple[str, Any], ...]]:
+        # 只有相同模型、相同選項的片段才能放進同一批次
+        return id(self.model), tuple(sorted(self.options.items()))
+
+
+class _DetectedLanguageInfo(NamedTuple):
+    """批次前逐個片段檢測的語言 (後端以指定語言批次解碼，其 info 的語言概率不反映檢測結果)"""
+    language: str
+    language_probability: float
+    duration: float
+
+
+def _finish(segments: Iterable[DecodedSegment], info: Any, postprocess: Postprocess | None) -> Any:
+    if postprocess is None:
+        return list(segments), info
+    return postprocess(segments, info)
+
+
+def _decode_solo(model, audio: np.ndarray, options: Dict[str, Any], postprocess: Postprocess | None = None) -> Any:
+    """單獨解碼一個片段，並在背景線程中消耗完後端的惰性生成器 (後處理可提前停止迭代以跳過剩餘解碼)"""
+    segments_generator, info = stt_backend.transcribe(model, audio, **options)
+    return _finish((to_decoded(segment) for segment in segments_generator), info, postprocess)
+
+
+def _decode_batch(model, audios: List[np.ndarray], options: Dict[str, Any], postprocesses: List[Postprocess | None]) -> List[Any]:
+    """
+    將多個會話的片段交給後端一次批次解碼 (faster-whisper 後端使用 BatchedInferencePipeline)，
+    每個片段的後處理也在此 (背景線程) 完成。
+    不論批次大小都加上後端的 batch_consistent_options，解碼結果 (以及其後的過濾) 不隨服務負載改變。
+    """
+    options = {**options, **stt_backend.batch_consistent_options}
+    if len(audios) == 1:
+        return [_decode_solo(model, audios[0], options, postprocesses[0])]
+    if "language" not in options:
+        return _decode_batch_by_language(model, audios, options, postprocesses)
+    decoded = stt_backend.transcribe_batch(model, audios, options)
+    return [_finish(segments, info, postprocess) for (segments, info), postprocess in zip(decoded, postprocesses)]
+
+
+def _decode_batch_by_language(model, audios: List[np.ndarray], options: Dict[str, Any], postprocesses: List[Postprocess | None]) -> List[Any]:
+    """
+    未指定語言的片段: 批次解碼只對整批做一次語言檢測，因此先逐個片段檢測語言 (只需編碼器前向)，
+    再按檢測到的語言分組批次解碼。結果中的語言與概率為各片段自己的檢測結果 (供自動語言鎖定使用)。
+    """
+    detected = [stt_backend.detect_language(model, audio) for audio in audios]
+    results: List[Any] = [None] * len(audios)
+    by_language: Dict[str, List[int]] = defaultdict(list)
+    for index, (language, _) in enumerate(detected):
+        if language is None: # 後端無法檢測，單獨解碼
+            results[index] = _decode_solo(model, audios[index], options, postprocesses[index])
+        else:
+            by_language[language].append(index)
+
+    for language, indices in by_language.items():
+        decoded = stt_backend.transcribe_batch(model, [audios[index] for index in indices], {**options, "language": language})
+        for index, (segments, info) in zip(indices, decoded):
+            info = _DetectedLanguageInfo(language, detected[index][1], len(audios[index]) / SAMPLE_RATE)
+            results[index] = _finish(segments, info, postprocesses[index])
+    return results
+
+
+def _timed_decode_batch(model, audios: List[np.ndarray], options: Dict[str, Any], postprocesses: List[Postprocess | None]) -> List[Any]:
+    """在背景線程中計時的 _decode_batch (不含執行引擎排隊時間)，記錄解碼耗時與 RTF"""
+    started_at = time.perf_counter()
+    results = _decode_batch(model, audios, options, postprocesses)
+    elapsed = time.perf_counter() - started_at
+    audio_sec = sum(len(audio) for audio in audios) / SAMPLE_RATE
+    STT_DECODE_SECONDS.observe(elapsed, source="stream")
+    if audio_sec > 0:
+        STT_REAL_TIME_FACTOR.observe(elapsed / audio_sec, source="stream")
+    return results
+
+
+class InferenceScheduler:
+    """
+    跨會話的批次推理排程器。
+
+    所有 WebSocket 會話經 VAD 確定的語音片段都送到同一個隊列，排程器在
+    `window_ms` 的收集窗口內 (或達到 `max_batch_size`) 將它們湊成一批，
+    一次交給模型解碼，再把每個結果送回對應會話的 Future。
+    """
+
+    def __init__(self, window_ms: float, max_batch_size: int):
+        self.window_sec = max(window_ms, 0.0) / 1000.0
+        self.max_batch_size = max(max_batch_size, 1)
+        self._queue: asyncio.Queue[_PendingSegment] | None = None
+        self._worker_task: asyncio.Task | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+        # 統計數據，用於在吞吐量與額外延遲之間調參
+        self.batches_dispatched = 0
+        self.segments_dispatched = 0
+        self.last_batch_size = 0
+        self.max_batch_size_seen = 0
+        self.total_queue_wait_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+        self.segments_cancelled = 0 # 解碼開始前被取消 (確實省下計算) 的片段
+        self.results_discarded = 0 # 解碼完成時請求者已取消的片段
+
+    def _ensure_started(self):
+        if self._worker_task is None or self._worker_task.done():
+            self._queue = asyncio.Queue()
+            self._worker_task = asyncio.create_task(self._collect_loop())
+            logger.info(f"Inference scheduler started (window: {self.window_sec * 1000:.0f} ms, max batch size: {self.max_batch_size})")
+
+    async def transcribe(self, model, audio: np.ndarray, options: Dict[str, Any], postprocess: Postprocess | None = None) -> Any:
+        """
+        提交一個片段並等待其結果。
+        未提供 postprocess 時返回 (已解碼片段列表, info)；否則返回 postprocess 的結果。
+        """
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingSegment(model=model, audio=audio, options=options, future=future, postprocess=postprocess))
+        return await future
+
+    async def _collect_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window_sec
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            groups: Dict[Any, List[_PendingSegment]] = defaultdict(list)
+            for pending in batch:
+                if pending.future.cancelled():
+                    # 請求者已取消 (例如客戶端斷開)，不再解碼
+                    self.segments_cancelled += 1
+                    continue
+                groups[pending.batch_key].append(pending)
+
+            for group in groups.values():
+                self._dispatch(group)
+
+    def _dispatch(self, group: List[_PendingSegment]):
+        task = asyncio.create_task(self._run_group(group))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _run_group(self, group: List[_PendingSegment]):
+        dispatched_at = time.perf_counter()
+        waits_ms = [(dispatched_at - pending.enqueued_at) * 1000 for pending in group]
+        self._record_batch(len(group), waits_ms)
+        for wait_ms in waits_ms:
+            STT_QUEUE_WAIT_SECONDS.observe(wait_ms / 1000)
+        logger.info(f"Dispatching inference batch: size={len(group)}, queue wait avg={sum(waits_ms) / len(waits_ms):.1f} ms, max={max(waits_ms):.1f} ms")
+
+        job = stt_executor.submit(
+            _timed_decode_batch,
+            group[0].model,
+            [pending.audio for pending in group],
+            group[0].options,
+            [pending.postprocess for pending in group],
+        )
+        abandoned = False
+
+        def cancel_if_abandoned(_):
+            # 整批的請求者都已取消時，撤回尚在執行引擎隊列中的工作。
+            # 已開始執行的無法中斷 (cancel() 返回 False)，其結果解碼完成後計入 results_discarded
+            nonlocal abandoned
+            if not abandoned and all(pending.future.cancelled() for pending in group) and job.cancel():
+                abandoned = True
+                self.segments_cancelled += len(group)
+                logger.info(f"Inference batch of {len(group)} abandoned by its requesters before decoding.")
+
+        for pending in group:
+            pending.future.add_done_callback(cancel_if_abandoned)
+
+        try:
+            results = await asyncio.wrap_future(job)
+        except asyncio.CancelledError:
+            if abandoned:
+                return
+            raise
+        except Exception as e:
+            for pending in group:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+
+        for pending, result in zip(group, results):
+            if pending.future.cancelled():
+                self.results_discarded += 1 # 已解碼但請求者已離開的片段 (浪費的計算)
+            elif not pending.future.done():
+                pending.future.set_result(result)
+
+    def _record_batch(self, size: int, waits_ms: List[float]):
+        self.batches_dispatched += 1
+        self.segments_dispatched += size
+        self.last_batch_size = size
+        self.max_batch_size_seen = max(self.max_batch_size_seen, size)
+        self.total_queue_wait_ms += sum(waits_ms)
+        self.max_queue_wait_ms = max(self.max_queue_wait_ms, max(waits_ms))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_sec * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches_dispatched": self.batches_dispatched,
+            "segments_dispatched": self.segments_dispatched,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size_seen": self.max_batch_size_seen,
+            "avg_batch_size": (self.segments_dispatched / self.batches_dispatched) if self.batches_dispatched else 0.0,
+            "avg_queue_wait_ms": (self.total_queue_wait_ms / self.segments_dispatched) if self.segments_dispatched else 0.0,
+            "max_queue_wait_ms": self.max_queue_wait_ms,
+            "segments_cancelled": self.segments_cancelled,
+            "results_discarded": self.results_discarded,
+        }
+
+    async def shutdown(self):
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+            self._worker_task = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        logger.info(f"Inference scheduler stopped. Stats: {self.stats()}")
+
+
+# --- 全局排程器實例 (所有 WebSocket 會話共用) ---
+inference_scheduler = InferenceScheduler(
+    window_ms=settings.stt_batch_window_ms,
+    max_batch_size=settings.stt_batch_max_size,
+)
@@ -1,16 +1,30 @@
-from faster_whisper import WhisperModel
+# 推理庫 (faster_whisper 及 CTranslate2) 導入很慢，由 STT 後端延遲到實際載入模型時才導入，讓服務啟動後立即可以回應存活檢查
 # from pydub import AudioSegment # 非流式時使用 pydub，流式時處理原始 bytes 更高效
 import numpy as np # faster-whisper 可以接受 numpy array
-import webrtcvad
 import os
-import tempfile
-import io
 import logging
 import asyncio
-from typing import BinaryIO, Tuple, Dict, Any, AsyncGenerator, List
-from collections import deque # 用於緩衝音訊幀
+import functools
+import threading
+import time
+from typing import TYPE_CHECKING, BinaryIO, Tuple, Dict, Any, AsyncGenerator, List, Iterable, Iterator
+from collections import deque
+from dataclasses import dataclass, field
 
 from ..core.config import settings
+from .stt_scheduler import inference_scheduler
+from .stt_executor import stt_executor
+from .audio_buffers import FrameRingBuffer, SpeechSegmentBuffer
+from .stt_partials import LocalAgreement, split_units, strip_seam_overlap
+from .stt_hallucination import PhraseMatcher, RepetitionDetector
+from .metrics import STT_DECODE_SECONDS, STT_FILTERED_SEGMENTS, STT_REAL_TIME_FACTOR
+from .vad_engine import create_vad_engine
+from .audio_decode import AudioDecodeError, decode_audio_to_float32
+from .stt_model_registry import ModelRegistry, UnknownModelError, parse_model_paths
+from .stt_backends import stt_backend
+
+if TYPE_CHECKING:
+    from .stt_backends import STTModel
 
 # 設定日誌記錄器
 logging.basicConfig(level=logging.INFO)
@@ -18,7 +32,7 @@ logger = logging.getLogger(__name__)
 
 # --- 全局變數存儲加載的模型 ---
 # 我們將在 FastAPI 的 lifespan 事件中加載模型，避免每次請求都加載
-stt_model: WhisperModel | None = None
+stt_model: "STTModel | None" = None
 
 
 # --- 可以在類別或函數開頭定義這些常數，方便調整 ---
@@ -37,24 +51,43 @@ COMMON_HALLUCINATIONS = [
     "Please subscribe",
     "...", # 避免單純的點點點
 ]
+# 所有幻覺詞編譯成一個自動機，每個片段只需掃描一遍
+HALLUCINATION_MATCHER = PhraseMatcher(COMMON_HALLUCINATIONS)
+
+
+def create_repetition_detector() -> RepetitionDetector:
+    """按配置建立重複循環檢測器 (每次解碼一個)"""
+    return RepetitionDetector(
+        max_ngram=settings.stt_repetition_max_ngram,
+        min_repeats=settings.stt_repetition_min_repeats,
+        min_tokens=settings.stt_repetition_min_tokens,
+    )
+
+# --- 多模型登記表 ---
+# 默認模型 (STT_MODEL_PATH) 以其目錄名登記，"whisper-1" 或未指定時也使用它；
+# STT_MODELS 中的其他模型在首次請求時才載入
+DEFAULT_MODEL_NAME = os.path.basename(os.path.normpath(settings.stt_model_path))
+model_registry = ModelRegistry(
+    model_paths={DEFAULT_MODEL_NAME: settings.stt_model_path, **parse_model_paths(settings.stt_models)},
+    default_name=DEFAULT_MODEL_NAME,
+    loader=stt_backend.load_model,
+    memory_budget_mb=settings.stt_model_memory_budget_mb,
+    idle_timeout_sec=settings.stt_model_idle_timeout_sec,
+    identity_prefix=stt_backend.identity_prefix,
+)
+
 
 def load_stt_model():
     global stt_model # 聲明修改全局變數
     if stt_model is None:
-        logger.info(f"Loading STT model '{settings.stt_model_path}' on device '{settings.stt_device}' with compute type '{settings.stt_compute_type}'...")
+        logger.info(f"Loading STT model '{settings.stt_model_path}' with backend '{stt_backend.name}' on device '{settings.stt_device}' with compute type '{settings.stt_compute_type}'...")
         try:
-            if not os.path.exists(settings.stt_model_path):
-                 logger.error(f"STT model path not found: {settings.stt_model_path}")
-                 stt_model = None # 確保路徑不存在時為 None
-                 return stt_model # <--- 如果路徑錯誤，返回 None
-
             # --- 賦值 ---
-            stt_model = WhisperModel(
-                settings.stt_model_path,
-                device=settings.stt_device,
-                compute_type=settings.stt_compute_type
-            )
+            stt_model = model_registry.load(DEFAULT_MODEL_NAME)
             logger.info("STT model loaded successfully.") # <--- 成功日志
+        except FileNotFoundError as e:
+            logger.error(str(e))
+            stt_model = None # 確保路徑不存在時為 None
         except Exception as e:
             logger.error(f"Error loading STT model: {e}", exc_info=True)
             stt_model = None # 確保異常時為 None
@@ -62,7 +95,7 @@ def load_stt_model():
     return stt_model # <--- **新增**: 返回最終的 stt_model (可能是對象或 None)
 
 def unload_stt_model():
-    """卸載模型並清理資源 (如果需要)"""
+    """卸載所有模型並清理資源 (如果需要)"""
     global stt_model
     if stt_model is not None:
         logger.info("Unloading STT model...")
@@ -76,52 +109,405 @@ def unload_stt_model():
         # import torch
         # if settings.stt_device == "cuda":
         #     torch.cuda.empty_cache()
-        logger.info("STT model unloaded.")
+    model_registry.unload_all()
+    logger.info("STT model unloaded.")
+
+
+def start_stt_model_swap(model_path: str, compute_type: str | None = None, name: str | None = None) -> Dict[str, Any]:
+    """
+    在背景熱替換模型 (默認替換默認模型)，立即返回。
+    替換默認模型時同時更新全局 stt_model，讓未指定模型的調用者也使用新模型。
+    """
+    stt_backend.check_model_path(model_path)
+
+    def on_swapped(swapped_name: str, model: "STTModel"):
+        global stt_model
+        if swapped_name == DEFAULT_MODEL_NAME:
+            stt_model = model
+
+    return model_registry.start_swap(name, model_path, compute_type, on_swapped=on_swapped)
+
+
+# --- 模型預熱 ---
+def _synthetic_warmup_audio(duration_sec: float, seed: int = 0) -> np.ndarray:
+    """
+    生成確定性的合成音訊 (16 kHz float32)：帶音節狀包絡的諧波音調加低電平噪音。
+    純靜音會讓解碼器很快結束，無法覆蓋真實請求會走到的解碼路徑。
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration_sec * 16000), dtype=np.float32) / 16000
+    pitch = 140.0 + 40.0 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / 16000
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = np.clip(np.sin(2 * np.pi * 3.0 * t), 0.0, None) # 約每秒三個 "音節"
+    audio = 0.3 * envelope * voiced + 0.01 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def _timed_warmup_decode(model: "STTModel", audio: np.ndarray) -> float:
+    """完整解碼一次 (消耗完惰性生成器)，返回耗時秒數"""
+    started_at = time.perf_counter()
+    segments_generator, _ = stt_backend.transcribe(model, audio)
+    for _ in segments_generator:
+        pass
+    return time.perf_counter() - started_at
+
+
+async def warmup_stt_model(model: "STTModel", durations_sec: List[float]) -> Dict[str, Any]:
+    """
+    以數種代表性長度的合成音訊預熱模型與 VAD，讓 CTranslate2 的緩衝區分配與內核選擇
+    在就緒之前完成，而不是落在第一個真實請求上。返回各階段耗時 (秒)。
+    第一個長度在最後會再解碼一次，與首次解碼的耗時對比即為冷/熱差距。
+    """
+    started_at = time.perf_counter()
+    timings: Dict[str, Any] = {}
+
+    # VAD: 對一段合成音訊做一次整塊判斷 (Silero 引擎會在此載入 ONNX 模型)
+    vad = create_vad_engine()
+    pcm = (_synthetic_warmup_audio(1.0) * 32767).astype(np.int16)
+    frame_samples = AudioTranscriptionStreamer.SAMPLES_PER_FRAME
+    frames = pcm[:len(pcm) // frame_samples * frame_samples].reshape(-1, frame_samples)
+    vad_started_at = time.perf_counter()
+    await vad.classify(frames)
+    vad.close()
+    timings["vad_sec"] = round(time.perf_counter() - vad_started_at, 4)
+
+    decode_timings: Dict[str, float] = {}
+    for index, duration in enumerate(durations_sec):
+        elapsed = await stt_executor.run(_timed_warmup_decode, model, _synthetic_warmup_audio(duration, seed=index))
+        decode_timings[f"{duration:g}s"] = round(elapsed, 4)
+        logger.info(f"Warmup decode of {duration:g}s synthetic audio took {elapsed:.3f}s")
+    timings["decode_sec"] = decode_timings
+
+    if durations_sec:
+        warm = await stt_executor.run(_timed_warmup_decode, model, _synthetic_warmup_audio(durations_sec[0], seed=0))
+        timings["cold_first_decode_sec"] = decode_timings[f"{durations_sec[0]:g}s"]
+        timings["warm_repeat_decode_sec"] = round(warm, 4)
+
+    timings["total_sec"] = round(time.perf_counter() - started_at, 4)
+    logger.info(f"STT warmup finished in {timings['total_sec']:.2f}s: {timings}")
+    return timings
+
+
+# --- 非流式轉錄函數 ---
+def iter_transcription(audio_np: np.ndarray, language: str | None = None, initial_prompt: str | None = None,
+                       model: "STTModel | None" = None, log_prefix: str = "") -> Tuple[Iterator[Dict[str, Any]], Dict[str, Any]]:
+    """
+    開始轉錄一段已解碼的 16 kHz 單聲道 float32 音訊，返回 (片段生成器, 資訊)。
+    片段是惰性產生的：每迭代一次才解碼下一段，因此必須在背景線程中迭代。
+    片段時間戳相對於 audio_np 的開頭。
+    檢測到重複循環時停止消耗當前生成器，從觸發片段的結尾處重新開始解碼 (不再以循環文本為條件)，
+    循環次數與因此丟棄的片段數在迭代完成後寫入資訊的 repetition_loops / repetition_segments_dropped。
+    model: 由模型登記表取得的模型，未指定時使用默認模型。
+    """
+    model = model if model is not None else stt_model
+    if model is None:
+        logger.error("STT model is not loaded. Cannot transcribe.")
+        raise ValueError("STT model is not available.")
+    transcribe_options = {
+        "language": language, "initial_prompt": initial_prompt,
+        "word_timestamps": False, "vad_filter": True,
+        "vad_parameters": {"min_silence_duration_ms": 500}
+    }
+    transcribe_options = {k: v for k, v in transcribe_options.items() if v is not None}
+    logger.info(f"{log_prefix}Starting transcription (non-streaming) with options: {transcribe_options}")
+    started_at = time.perf_counter()
+    segments_generator, info = stt_backend.transcribe(model, audio_np, **transcribe_options)
+    info_dict = {"language": info.language, "language_probability": info.language_probability, "duration": info.duration,
+                 "repetition_loops": 0, "repetition_segments_dropped": 0}
+
+    def guarded_segments() -> Iterator[Dict[str, Any]]:
+        # 檢測到循環時，觸發片段之前的重複片段也要丟棄 (與流式的過濾一致)，
+        # 因此可能屬於循環的最近片段先暫存，確定不會被丟棄後才交給調用者
+        generator, offset = segments_generator, 0.0
+        while True:
+            repetition = create_repetition_detector()
+            held: deque = deque() # (片段在重複檢測單位序列中的起點, 片段)
+            resume_at = None
+            for segment in generator:
+                text = segment.text.strip()
+                item = {"start": offset + segment.start, "end": offset + segment.end, "text": text}
+                unit_start = len(repetition.units)
+                loop = repetition.feed(text)
+                if loop is not None:
+                    ngram, repeats = loop
+                    repeat_start = len(repetition.units) - (repeats - 1) * ngram
+                    # 保留循環的第一次出現，丟棄完全落在重複部分中的片段
+                    while held and held[-1][0] >= repeat_start:
+                        held.pop()
+                        info_dict["repetition_segments_dropped"] += 1
+                    if unit_start < repeat_start: # 觸發片段本身包含第一次出現
+                        held.append((unit_start, item))
+                    else:
+                        info_dict["repetition_segments_dropped"] += 1
+                    resume_at = offset + segment.end
+                    break
+                held.append((unit_start, item))
+                while held and held[0][0] <= len(repetition.units) - repetition.lookback_units:
+                    yield held.popleft()[1]
+            for _, item in held:
+                yield item
+            if resume_at is None:
+                return
+            info_dict["repetition_loops"] += 1
+            if resume_at <= offset or resume_at >= info.duration - 0.5:
+                logger.warning(f"{log_prefix}Repetition loop detected at {resume_at:.2f}s; nothing left to decode.")
+                return
+            logger.warning(f"{log_prefix}Repetition loop detected at {resume_at:.2f}s; restarting decoding from there.")
+            if hasattr(generator, "close"):
+                generator.close() # 立即結束循環中的解碼，而不是等待垃圾回收
+            restart_options = {**transcribe_options, "language": info.language}
+            restart_options.pop("initial_prompt", None)
+            generator, _ = stt_backend.transcribe(model, audio_np[int(resume_at * 16000):], **restart_options)
+            offset = resume_at
+
+    def timed_segments() -> Iterator[Dict[str, Any]]:
+        # 只有完整迭代 (未被消費者提前停止) 時才記錄解碼耗時與 RTF
+        yield from guarded_segments()
+        elapsed = time.perf_counter() - started_at
+        STT_DECODE_SECONDS.observe(elapsed, source="file")
+        if info.duration > 0:
+            STT_REAL_TIME_FACTOR.observe(elapsed / info.duration, source="file")
+
+    return timed_segments(), info_dict
+
+
+def transcribe_audio_array(audio_np: np.ndarray, language: str | None = None, initial_prompt: str | None = None,
+                           model: "STTModel | None" = None, log_prefix: str = "") -> Tuple[str, list, Dict[str, Any]]:
+    """
+    轉錄一段已解碼的 16 kHz 單聲道 float32 音訊 (非流式)，返回 (全文, 片段列表, 資訊)。
+    片段時間戳相對於 audio_np 的開頭。
+    """
+    segments_generator, info_dict = iter_transcription(audio_np, language, initial_prompt, model, log_prefix)
+    segments_list = list(segments_generator)
+    full_text = " ".join(segment["text"] for segment in segments_list)
+    logger.info(f"{log_prefix}Transcription finished (non-streaming). Detected language: {info_dict['language']}")
+    return full_text, segments_list, info_dict
 
 
-# --- 非流式轉錄函數 (保持不變，以防未來仍需使用) ---
-def transcribe_audio_file(file: BinaryIO, language: str | None = None, initial_prompt: str | None = None) -> Tuple[str, list, Dict[str, Any]]:
+async def stream_transcription(audio_np: np.ndarray, language: str | None = None, initial_prompt: str | None = None,
+                               model: "STTModel | None" = None) -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    在 STT 執行引擎中逐段解碼，每解碼出一段就交給事件循環，依序產生:
+    {"type": "info", ...} (語言與時長，解碼開始前即可得知)，之後每段一個 {"type": "segment", ...}。
+    消費者提前停止 (例如客戶端斷開) 時，背景線程在當前片段之後停止解碼。
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def produce():
+        try:
+            segments, info_dict = iter_transcription(audio_np, language, initial_prompt, model)
+            put({"type": "info", **info_dict})
+            for segment in segments:
+                if stop.is_set():
+                    logger.info("Streaming transcription stopped early by consumer.")
+                    break
+                put({"type": "segment", **segment})
+        except Exception as e:
+            put(e)
+        finally:
+            put(done)
+
+    job = asyncio.ensure_future(stt_executor.run(produce))
+    try:
+        while True:
+            item = await queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        if not job.done():
+            job.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+
+def transcribe_audio_file(file: BinaryIO, language: str | None = None, initial_prompt: str | None = None,
+                          model: "STTModel | None" = None) -> Tuple[str, list, Dict[str, Any]]:
     """
     轉錄完整的音訊檔案 (非流式)。
-    注意: 此函數使用了 pydub 和臨時文件，與流式處理不同。
+    上傳內容以 PyAV 在記憶體中直接解碼為 16 kHz 單聲道 float32 陣列後交給模型，不經臨時文件。
+    model: 由模型登記表取得的模型，未指定時使用默認模型。
     """
-    if stt_model is None:
+    if (model if model is not None else stt_model) is None:
         logger.error("STT model is not loaded. Cannot transcribe.")
         raise ValueError("STT model is not available.")
     try:
-        from pydub import AudioSegment # 局部導入
-        logger.info("Reading audio file (non-streaming)...")
-        file.seek(0)
-        audio_data = io.BytesIO(file.read())
-        audio = AudioSegment.from_file(audio_data)
-        logger.info("Converting audio format (non-streaming)...")
-        audio = audio.set_frame_rate(16000).set_channels(1).set_sample_width(2)
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=True) as tmp_audio_file:
-            audio.export(tmp_audio_file.name, format="wav")
-            logger.info(f"Temporary WAV file created: {tmp_audio_file.name}")
-            transcribe_options = {
-                "language": language, "initial_prompt": initial_prompt,
-                "word_timestamps": False, "vad_filter": True,
-                "vad_parameters": {"min_silence_duration_ms": 500}
-            }
-            transcribe_options = {k: v for k, v in transcribe_options.items() if v is not None}
-            logger.info(f"Starting transcription (non-streaming) with options: {transcribe_options}")
-            segments_generator, info = stt_model.transcribe(tmp_audio_file.name, **transcribe_options)
-            segments_list = []
-            full_text_list = []
-            for segment in segments_generator:
-                segments_list.append({"start": segment.start, "end": segment.end, "text": segment.text.strip()})
-                full_text_list.append(segment.text.strip())
-            full_text = " ".join(full_text_list)
-            info_dict = {"language": info.language, "language_probability": info.language_probability, "duration": info.duration}
-            logger.info(f"Transcription finished (non-streaming). Detected language: {info.language}")
-            return full_text, segments_list, info_dict
+        logger.info("Decoding audio file (non-streaming)...")
+        decode_started_at = time.perf_counter()
+        audio_np = decode_audio_to_float32(file)
+        logger.info(f"Decoded {len(audio_np) / 16000:.1f}s of audio in {time.perf_counter() - decode_started_at:.2f}s")
+        return transcribe_audio_array(audio_np, language, initial_prompt, model)
+    except AudioDecodeError as e:
+        logger.error(f"Could not decode uploaded audio: {e}")
+        raise
     except Exception as e:
         logger.error(f"Error during non-streaming transcription: {e}", exc_info=True)
         raise
 
+def _record_filtered_segments(no_speech: int, low_logprob: int, hallucination: int, repetition: int):
+    for reason, count in (("no_speech", no_speech), ("low_logprob", low_logprob),
+                          ("hallucination", hallucination), ("repetition", repetition)):
+        if count:
+            STT_FILTERED_SEGMENTS.inc(count, reason=reason)
+
+
+def filter_segment_transcription(segments: Iterable[Any], info: Any, start_time: float, verbose: bool = True,
+                                 audio_duration: float | None = None) -> Dict[str, Any] | None:
+    """
+    消耗解碼結果並應用過濾 (no_speech / avg_logprob / 幻覺詞檢查)，返回完整的 final 消息。
+    此函數在背景線程中執行：faster-whisper 的 segments 是惰性生成器，真正的解碼發生在迭代時，
+    因此迭代與過濾必須與 transcribe 調用一起離開事件循環。沒有有效文本時返回 None。
+    檢測到重複循環時立即停止迭代 (剩餘部分不再解碼)，並丟棄循環中重複出現的片段；
+    audio_duration (本片段音訊長度) 用於計算因此跳過的音訊。批次解碼時整批已在迭代前解碼完成，只省下後處理。
+    verbose=False 時 (中間結果) 過濾日誌降為 debug 級別。
+    """
+    log = logger.info if verbose else logger.debug
+    # --- 處理並過濾轉錄結果 ---
+    segment_text_parts: List[str] = []
+    accepted_logprobs: List[float] = []
+    last_end_time = start_time # 初始化為片段開始時間
+    low_confidence_segments_skipped = 0
+    no_speech_segments_skipped = 0
+    hallucination_warnings = 0
+    total_segments_processed = 0
+    repetition = create_repetition_detector()
+    accepted_unit_starts: List[int] = [] # 每個已接受片段在重複檢測單位序列中的起點
+    accepted_end_times: List[float] = []
+    repetition_loop: Dict[str, Any] | None = None
+
+    for segment in segments:
+        total_segments_processed += 1
+        absolute_start = start_time + segment.start
+        absolute_end = start_time + segment.end
+        text = segment.text.strip() if segment.text else ""
+
+        # 1. 過濾高 "無語音" 概率的片段
+        if segment.no_speech_prob > FILTER_NO_SPEECH_PROB_THRESHOLD:
+            log(f"Segment [{absolute_start:.2f}s -> {absolute_end:.2f}s] skipped (no_speech_prob: {segment.no_speech_prob:.2f} > {FILTER_NO_SPEECH_PROB_THRESHOLD}) Text: '{text}'")
+            no_speech_segments_skipped += 1
+            continue
+
+        # 2. 過濾低平均對數概率的片段 (可能為幻覺或低質量識別)
+        if segment.avg_logprob < FILTER_AVG_LOGPROB_THRESHOLD:
+            log(f"Segment [{absolute_start:.2f}s -> {absolute_end:.2f}s] skipped (avg_logprob: {segment.avg_logprob:.2f} < {FILTER_AVG_LOGPROB_THRESHOLD}) Text: '{text}'")
+            low_confidence_segments_skipped += 1
+            continue
+
+        # 3. 檢查是否包含常見幻覺詞 (不區分大小寫，自動機一次掃描；僅發出警告)
+        for hallucination in HALLUCINATION_MATCHER.find(text):
+            logger.warning(f"Segment [{absolute_start:.2f}s -> {absolute_end:.2f}s] potentially contains hallucination phrase '{hallucination}'. Text: '{text}'")
+            hallucination_warnings += 1
+
+        # 4. 重複循環檢測: 一旦發現就停止消耗生成器，剩餘音訊不再解碼
+        unit_start = len(repetition.units)
+        loop = repetition.feed(text)
+        if loop is not None:
+            ngram, repeats = loop
+            repeat_start = len(repetition.units) - (repeats - 1) * ngram
+            # 保留循環的第一次出現，丟棄完全落在重複部分中的已接受片段
+            segments_dropped = 0
+            while accepted_unit_starts and accepted_unit_starts[-1] >= repeat_start:
+                accepted_unit_starts.pop()
+                accepted_end_times.pop()
+                segment_text_parts.pop()
+                accepted_logprobs.pop()
+                segments_dropped += 1
+            if unit_start < repeat_start and text: # 本片段本身包含第一次出現
+                segment_text_parts.append(text)
+                accepted_logprobs.append(segment.avg_logprob)
+                accepted_end_times.append(absolute_end)
+            else:
+                segments_dropped += 1
+            last_end_time = accepted_end_times[-1] if accepted_end_times else start_time
+            repetition_loop = {
+                "ngram": ngram,
+                "repeats": repeats,
+                "segments_dropped": segments_dropped,
+                "aborted_at_sec": absolute_end,
+                # 因提前停止而未解碼的音訊長度 (即節省的計算量)
+                "skipped_audio_sec": round(max(audio_duration - segment.end, 0.0), 3) if audio_duration is not None else None,
+            }
+            logger.warning(f"Repetition loop detected at {absolute_end:.2f}s ({ngram}-gram x{repeats}); stopped decoding, "
+                           f"dropped {segments_dropped} repeated segments, skipped {repetition_loop['skipped_audio_sec']}s of audio. Text: '{text}'")
+            break
+
+        # --- 如果片段通過所有過濾 ---
+        if text: # 確保文本不為空
+            segment_text_parts.append(text)
+            accepted_logprobs.append(segment.avg_logprob)
+            accepted_unit_starts.append(unit_start)
+            accepted_end_times.append(absolute_end)
+            last_end_time = absolute_end # 更新最後有效文本的結束時間
+        # logger.debug(f"Valid segment accepted: [{absolute_start:.2f}s -> {absolute_end:.2f}s] {text}")
+
+    if verbose: # 中間結果會反覆解碼同一段音訊，只統計 final
+        _record_filtered_segments(no_speech_segments_skipped, low_confidence_segments_skipped, hallucination_warnings,
+                                  repetition_loop["segments_dropped"] if repetition_loop else 0)
+
+    # --- 組合最終文本並產生結果 ---
+    full_text = " ".join(segment_text_parts)
+
+    # 僅在實際有文本輸出時才產生結果
+    if full_text:
+        confidence_score = None # faster-whisper 的 info 可能不直接提供整體置信度, 但可以基於過濾情況判斷
+        log(f"Segment transcription complete: [{start_time:.2f}s -> {last_end_time:.2f}s] Text: '{full_text}' "
+                    f"(Processed: {total_segments_processed}, Skipped_NoSpeech: {no_speech_segments_skipped}, Skipped_LowConf: {low_confidence_segments_skipped}, HallucinationWarn: {hallucination_warnings})")
+        return {
+            "type": "final",
+            "start": start_time,
+            "end": last_end_time, # 使用最後有效片段的結束時間
+            "text": full_text,
+            "language": info.language,
+            "language_probability": info.language_probability,
+            # 提供一些過濾的統計信息，供上層參考
+            "confidence_info": {
+                 "total_segments_processed": total_segments_processed,
+                 "no_speech_segments_skipped": no_speech_segments_skipped,
+                 "low_confidence_segments_skipped": low_confidence_segments_skipped,
+                 "hallucination_warnings": hallucination_warnings,
+                 "repetition_loop": repetition_loop, # 未檢測到循環時為 None
+                 "mean_avg_logprob": sum(accepted_logprobs) / len(accepted_logprobs),
+                 "avg_logprob_threshold": FILTER_AVG_LOGPROB_THRESHOLD,
+                 "no_speech_prob_threshold": FILTER_NO_SPEECH_PROB_THRESHOLD
+            }
+        }
+    else:
+        log(f"Segment transcription complete but no text output after filtering: [{start_time:.2f}s -> {last_end_time:.2f}s] "
+                    f"(Processed: {total_segments_processed}, Skipped_NoSpeech: {no_speech_segments_skipped}, Skipped_LowConf: {low_confidence_segments_skipped}, HallucinationWarn: {hallucination_warnings}, RepetitionLoop: {repetition_loop is not None})")
+        return None
+
+
+@dataclass
+class SegmentJob:
+    """VAD 階段切出、等待推理階段轉錄的一個片段 (音訊是獨立的副本，不受之後的緩衝寫入影響)"""
+    kind: str # "final" 或 "partial"
+    audio: np.ndarray
+    start_time: float
+    end_time: float
+    segment_id: int # 每段語音開始 (以及每次強制切分) 時遞增，用於丟棄過時的中間結果
+    forced_split: bool = False
+    merged_segments: int = 1 # 過載時被合併成此片段的原始片段數
+    created_at: float = field(default_factory=time.perf_counter) # VAD 切出片段 (語音結束) 的時刻
+
+    @property
+    def duration(self) -> float:
+        return len(self.audio) / 16000
+
+
 class AudioTranscriptionStreamer:
-    """處理單個 WebSocket 連接的音訊流"""
+    """
+    處理單個 WebSocket 連接的音訊流，分為兩個階段:
+    segment_audio_chunk (接收的音訊 -> VAD -> SegmentJob) 與 transcribe_job (SegmentJob -> 轉錄結果)，
+    兩者可以在不同的任務中執行 (見 stt_stream_pipeline)，推理期間不會阻塞音訊的接收與 VAD。
+    """
 
     # VAD 接受 10, 20, 30 ms 的幀
     # Whisper 使用 16kHz 採樣率, 16-bit PCM
@@ -136,22 +522,33 @@ class AudioTranscriptionStreamer:
     # 這有助於處理語句中的短暫停頓
     SILENCE_THRESHOLD_SEC = 0.5 # 半秒靜音觸發轉錄
 
-    def __init__(self, language: str | None = None, initial_prompt: str | None = None):
-        if stt_model is None:
+    def __init__(self, language: str | None = None, initial_prompt: str | None = None,
+                 partial_interval_sec: float = settings.stt_partial_interval_sec,
+                 model_name: str | None = None):
+        # 會話只綁定模型名稱 (由調用者 pin)，每個片段解碼時才取得該名稱目前對應的模型，
+        # 因此模型熱替換後新片段立即使用新模型
+        self.model_name = model_registry.resolve_name(model_name)
+        if model_registry.get_loaded(self.model_name) is None:
             raise ValueError("STT model is not loaded.")
-        self.stt_model = stt_model # 使用加載好的全局模型
         self.language = language
         self.initial_prompt = initial_prompt
 
-        # 初始化 VAD
-        self.vad = webrtcvad.Vad()
-        # 設置 VAD 敏感度 (0-3, 3 最敏感)
-        self.vad.set_mode(1) # 模式 1 或 2 通常比較平衡
+        # 語言鎖定: 客戶端指定語言時直接使用；否則在前 N 個片段的檢測結果一致且置信度足夠時自動鎖定，
+        # 之後不再對每個片段做語言檢測 (省去一次額外的 encoder 計算)
+        self._pinned_language: str | None = language
+        self._pinned_language_confidence: float | None = 1.0 if language else None
+        self._language_detections: deque = deque(maxlen=max(settings.stt_language_pin_segments, 1))
+        self._redetect_language = False # 鎖定後解碼質量下降時，下一個片段重新檢測
 
-        # 音訊緩衝區
-        self._buffer = deque()
+        # 初始化 VAD 引擎 (webrtcvad + 能量門限，或跨會話批次的 Silero)
+        self.vad = create_vad_engine()
+        self._closed = False
+
+        # 音訊緩衝區 (預分配的環形緩衝區，按 VAD 幀長度零複製切幀)
+        self._buffer = FrameRingBuffer(self.BYTES_PER_FRAME)
         self._frames_processed = 0 # 已處理的幀數 (用於計算時間戳)
-        self._speech_frames = deque() # 累積檢測到的語音幀
+        # 累積檢測到的語音幀 (預分配 int16 陣列，初始容量 30 秒)
+        self._speech_buffer = SpeechSegmentBuffer(initial_samples=16000 * 30)
         self._current_speech_start_time = 0.0 # 當前語音片段開始時間
         self._silence_frames_after_speech = 0 # 檢測到語音後的連續靜音幀數
         self._is_speaking = False # 當前是否處於語音活動狀態
@@ -159,154 +556,260 @@ class AudioTranscriptionStreamer:
         # 計算觸發轉錄所需的靜音幀數
         self._silence_frames_needed = int(self.SILENCE_THRESHOLD_SEC * 1000 / self.MS_PER_FRAME)
 
+        # 中間結果 (partial): 說話期間每隔 partial_interval_sec 重新解碼一次增長中的緩衝
+        self._partial_interval_frames = int(partial_interval_sec * 1000 / self.MS_PER_FRAME) if partial_interval_sec > 0 else 0
+        self._partial_min_samples = int(settings.stt_partial_min_audio_sec * 16000)
+        self._last_partial_frame = 0
+        self._agreement = LocalAgreement()
+        self._segment_id = 0 # VAD 階段: 目前語音片段的編號
+        self._agreement_segment_id = 0 # 推理階段: LocalAgreement 目前對應的片段編號
+        self._finalized_segment_id = -1 # 推理階段: 已產生 final 的最新片段編號 (更早的中間結果已過時)
+        self._skipped_bytes_remainder = 0
+
+        # 片段長度上限: 持續沒有靜音時在能量最低點強制切分，相鄰片段保留少量重疊
+        max_segment_sec = min(settings.stt_max_segment_sec, 30.0 - settings.stt_split_overlap_sec)
+        self._max_segment_samples = int(max_segment_sec * 16000)
+        self._split_search_samples = int(min(settings.stt_split_search_sec, max_segment_sec / 2) * 16000)
+        self._split_overlap_samples = int(settings.stt_split_overlap_sec * 16000)
+        self._seam_units: List[str] = [] # 上一個強制切分片段結尾的文字單位，用於接縫去重
+
         logger.info(f"AudioTranscriptionStreamer initialized. Silence threshold: {self.SILENCE_THRESHOLD_SEC}s ({self._silence_frames_needed} frames)")
 
-    async def _transcribe_segment(self, audio_data: bytes) -> AsyncGenerator[Dict[str, Any], None]:
+    def _transcribe_options(self) -> Dict[str, Any]:
+        # --- 設定轉錄選項 ---
+        # *** 修改點：移除所有不被接受的參數 ***
+        transcribe_options = {
+            "language": None if self._redetect_language else self._pinned_language, # 已鎖定的語言 (客戶端指定或自動鎖定)
+            # "initial_prompt": self.initial_prompt, # 已移除
+            # "temperature": DEFAULT_TEMPERATURE, # <--- 移除
+            # "no_speech_threshold": DEFAULT_NO_SPEECH_THRESHOLD, # <--- 移除
+            # "log_prob_threshold": DEFAULT_LOG_PROB_THRESHOLD, # <--- 移除
+            # "word_timestamps": False, # 已移除
+            # "vad_filter": False,      # 已移除
+        }
+        # 移除字典中值為 None 的項目 (現在主要影響 language)
+        return {k: v for k, v in transcribe_options.items() if v is not None}
+
+    def _update_language_pin(self, result: Dict[str, Any], detected: bool):
+        """根據 final 結果更新自動語言鎖定狀態 (客戶端指定語言時不變)"""
+        if self.language:
+            return
+
+        threshold = settings.stt_language_pin_threshold
+        if detected:
+            self._redetect_language = False
+            language, probability = result["language"], result["language_probability"]
+            if self._pinned_language is not None:
+                # 這是鎖定後的重新檢測
+                if language == self._pinned_language and probability >= threshold:
+                    self._pinned_language_confidence = probability
+                    return
+                logger.info(f"Language re-detection returned '{language}' ({probability:.2f}). Unpinning '{self._pinned_language}'.")
+                self._pinned_language = None
+                self._pinned_language_confidence = None
+                self._language_detections.clear()
+
+            self._language_detections.append((language, probability))
+            if (len(self._language_detections) == self._language_detections.maxlen
+                    and len({lang for lang, _ in self._language_detections}) == 1
+                    and all(prob >= threshold for _, prob in self._language_detections)):
+                self._pinned_language = language
+                self._pinned_language_confidence = sum(prob for _, prob in self._language_detections) / len(self._language_detections)
+                logger.info(f"Language pinned to '{language}' (confidence {self._pinned_language_confidence:.2f}) after {len(self._language_detections)} segments.")
+        elif result["confidence_info"]["mean_avg_logprob"] < settings.stt_language_redetect_logprob:
+            # 鎖定語言下解碼置信度明顯下降，可能換了說話語言
+            logger.info(f"Decoding confidence dropped under pinned language '{self._pinned_language}'. Re-detecting on next segment.")
+            self._redetect_language = True
+
+    def _partial_due(self) -> bool:
+        return (
+            self._partial_interval_frames > 0
+            and self._is_speaking
+            and len(self._speech_buffer) >= self._partial_min_samples
+            and self._frames_processed - self._last_partial_frame >= self._partial_interval_frames
+        )
+
+    def _reset_partial_state(self):
+        """開始新的語音片段 (或強制切分之後): 之後的中間結果屬於新的片段編號"""
+        self._last_partial_frame = self._frames_processed
+        self._segment_id += 1
+
+    async def _decode(self, audio_np: np.ndarray, options: Dict[str, Any], postprocess) -> Dict[str, Any] | None:
+        """以會話模型名稱目前對應的模型解碼一個片段 (解碼期間該模型對象被標記為使用中)"""
+        model = await model_registry.checkout(self.model_name)
+        try:
+            return await inference_scheduler.transcribe(model, audio_np, options, postprocess=postprocess)
+        finally:
+            model_registry.release(model)
+
+    async def _transcribe_partial(self, job: SegmentJob) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        對仍在增長的語音緩衝 (的快照) 重新解碼，產生 partial 消息。
+        已提交 (stable_text) 的部分由 LocalAgreement 保證不會改變。
+        """
+        if job.segment_id <= self._finalized_segment_id:
+            return # 該片段已經產生 final，中間結果已過時
+        if job.segment_id != self._agreement_segment_id:
+            self._agreement.reset()
+            self._agreement_segment_id = job.segment_id
+        try:
+            result = await self._decode(
+                job.audio,
+                self._transcribe_options(),
+                functools.partial(filter_segment_transcription, start_time=job.start_time, verbose=False,
+                                  audio_duration=job.duration)
+            )
+        except Exception as e:
+            # 中間結果失敗不影響最終結果，只記錄警告
+            logger.warning(f"Partial transcription failed for segment at {job.start_time:.2f}s: {e}")
+            return
+
+        if result is None:
+            return
+        yield {
+            "type": "partial",
+            "start": job.start_time,
+            "end": job.end_time,
+            **self._agreement.update(result["text"]),
+        }
+
+    def _find_split_point(self) -> int:
+        """在片段上限之前的搜尋範圍內，找出能量最低的幀，返回其中點的樣本位置"""
+        pcm = self._speech_buffer.pcm()
+        frame = self.SAMPLES_PER_FRAME
+        end = min(len(pcm), self._max_segment_samples) // frame * frame
+        begin = max(end - self._split_search_samples, frame) // frame * frame
+        frames = pcm[begin:end].reshape(-1, frame).astype(np.float32)
+        energies = np.einsum("ij,ij->i", frames, frames)
+        return begin + int(np.argmin(energies)) * frame + frame // 2
+
+    def _force_split(self) -> SegmentJob:
+        """片段達到長度上限時強制切分，返回前半部分的 final 任務，重疊部分留作下一片段的開頭"""
+        split = self._find_split_point()
+        logger.info(f"Segment reached max length ({len(self._speech_buffer) / 16000:.2f}s) without silence. Forcing split at {self._current_speech_start_time + split / 16000:.2f}s.")
+        job = SegmentJob("final", self._speech_buffer.copy_float32(split), self._current_speech_start_time,
+                         self._current_speech_start_time + split / 16000, self._segment_id, forced_split=True)
+
+        keep_from = max(split - self._split_overlap_samples, 0)
+        self._speech_buffer.keep_tail(keep_from)
+        self._current_speech_start_time += keep_from / 16000
+        self._reset_partial_state()
+        return job
+
+    def _final_job(self) -> SegmentJob:
+        """以目前的語音緩衝建立 final 任務"""
+        return SegmentJob("final", self._speech_buffer.copy_float32(), self._current_speech_start_time,
+                          self._frames_processed * self.MS_PER_FRAME / 1000.0, self._segment_id)
+
+    async def _transcribe_segment(self, audio_np: np.ndarray, start_time: float, forced_split: bool = False) -> AsyncGenerator[Dict[str, Any], None]:
         """
         在背景執行單個語音片段的轉錄，並應用過濾減少幻覺。
+        解碼與過濾作為同一個工作單元在背景線程完成，事件循環只等待最終結果。
+        緊接在強制切分之後的片段會去除接縫處重複的文字。
         """
-        if not audio_data:
+        if len(audio_np) == 0:
             logger.info("Skipping transcription for empty audio data.")
             return
 
-        start_time = self._current_speech_start_time # 假設 self._current_speech_start_time 在 process_audio_chunk 中被設置
         logger.info(f"Transcribing segment starting at {start_time:.2f}s...")
 
         try:
-            # 將 bytes 轉換為 float32 numpy array (Whisper 需要這個格式)
-            audio_np = np.frombuffer(audio_data, dtype=np.int16).astype(np.float32) / 32768.0
-
-            # --- 設定轉錄選項 ---
-            # *** 修改點：移除所有不被接受的參數 ***
-            transcribe_options = {
-                # "language": self.language, # 語言提示通常是支持的
-                # "initial_prompt": self.initial_prompt, # 已移除
-                # "temperature": DEFAULT_TEMPERATURE, # <--- 移除
-                # "no_speech_threshold": DEFAULT_NO_SPEECH_THRESHOLD, # <--- 移除
-                # "log_prob_threshold": DEFAULT_LOG_PROB_THRESHOLD, # <--- 移除
-                # "word_timestamps": False, # 已移除
-                # "vad_filter": False,      # 已移除
-            }
-            # 移除字典中值為 None 的項目 (現在主要影響 language)
-            transcribe_options = {k: v for k, v in transcribe_options.items() if v is not None}
-
+            transcribe_options = self._transcribe_options()
             logger.info(f"Starting transcription for segment at {start_time:.2f}s with options: {transcribe_options}")
 
-            # 使用 run_in_executor 在背景線程執行轉錄
-            loop = asyncio.get_running_loop()
-            # 確保 self.stt_model 存在且已加載
-            if self.stt_model is None:
-                 logger.error("STT model is not loaded inside streamer.")
-                 raise ValueError("STT model not loaded")
-
-            segments_generator, info = await loop.run_in_executor(
-                None, # 使用默認線程池
-                self.stt_model.transcribe, # 調用模型的 transcribe
-                audio_np,                 # 傳遞 numpy array
-                **transcribe_options
+            # 交給跨會話排程器，與其他會話的片段合併成批次後在背景線程解碼並過濾
+            result = await self._decode(
+                audio_np,
+                transcribe_options,
+                functools.partial(filter_segment_transcription, start_time=start_time, audio_duration=len(audio_np) / 16000)
             )
 
-            # --- 處理並過濾轉錄結果 ---
-            segment_text_parts: List[str] = []
-            last_end_time = start_time # 初始化為片段開始時間
-            low_confidence_segments_skipped = 0
-            no_speech_segments_skipped = 0
-            hallucination_warnings = 0
-            total_segments_processed = 0
-
-            for segment in segments_generator:
-                total_segments_processed += 1
-                absolute_start = start_time + segment.start
-                absolute_end = start_time + segment.end
-                text = segment.text.strip() if segment.text else ""
-
-                # 1. 過濾高 "無語音" 概率的片段
-                if segment.no_speech_prob > FILTER_NO_SPEECH_PROB_THRESHOLD:
-                    logger.info(f"Segment [{absolute_start:.2f}s -> {absolute_end:.2f}s] skipped (no_speech_prob: {segment.no_speech_prob:.2f} > {FILTER_NO_SPEECH_PROB_THRESHOLD}) Text: '{text}'")
-                    no_speech_segments_skipped += 1
-                    continue
-
-                # 2. 過濾低平均對數概率的片段 (可能為幻覺或低質量識別)
-                if segment.avg_logprob < FILTER_AVG_LOGPROB_THRESHOLD:
-                    logger.info(f"Segment [{absolute_start:.2f}s -> {absolute_end:.2f}s] skipped (avg_logprob: {segment.avg_logprob:.2f} < {FILTER_AVG_LOGPROB_THRESHOLD}) Text: '{text}'")
-                    low_confidence_segments_skipped += 1
-                    continue
-
-                # 3. 檢查是否包含常見幻覺詞 (僅發出警告，除非您想完全跳過)
-                contains_hallucination = False
-                for hallucination in COMMON_HALLUCINATIONS:
-                    # 進行不區分大小寫的檢查，並確保不是被包含在正常詞語中 (例如 "thanks" vs "Thanks for watching")
-                    # 這裡用簡單的 in 檢查，更複雜的匹配可能需要正則表達式
-                    if hallucination.lower() in text.lower():
-                        logger.warning(f"Segment [{absolute_start:.2f}s -> {absolute_end:.2f}s] potentially contains hallucination phrase '{hallucination}'. Text: '{text}'")
-                        hallucination_warnings += 1
-                        contains_hallucination = True
-                        # break # 如果找到一個就足夠發警告
-                # 如果決定要因為幻覺詞而跳過，可以在這裡加 continue
-                # if contains_hallucination:
-                #    continue
-
-                # --- 如果片段通過所有過濾 ---
-                if text: # 確保文本不為空
-                    segment_text_parts.append(text)
-                    last_end_time = absolute_end # 更新最後有效文本的結束時間
-                # logger.debug(f"Valid segment accepted: [{absolute_start:.2f}s -> {absolute_end:.2f}s] {text}")
-
-            # --- 組合最終文本並產生結果 ---
-            full_text = " ".join(segment_text_parts)
+            if result is not None:
+                self._update_language_pin(result, detected="language" not in transcribe_options)
+                result["language_pinned"] = self._pinned_language is not None
+                result["pinned_language"] = self._pinned_language
+                result["pinned_language_confidence"] = self._pinned_language_confidence
+
+            # 去除與上一個強制切分片段重疊的文字
+            seam_units, self._seam_units = self._seam_units, []
+            if result is not None and seam_units:
+                result["text"] = strip_seam_overlap(seam_units, result["text"])
+                if not result["text"]:
+                    result = None
+            if result is not None and forced_split:
+                result["forced_split"] = True
+                self._seam_units = split_units(result["text"])[-16:]
 
             # 僅在實際有文本輸出時才產生結果
-            if full_text:
-                confidence_score = None # faster-whisper 的 info 可能不直接提供整體置信度, 但可以基於過濾情況判斷
-                logger.info(f"Segment transcription complete: [{start_time:.2f}s -> {last_end_time:.2f}s] Text: '{full_text}' "
-                            f"(Processed: {total_segments_processed}, Skipped_NoSpeech: {no_speech_segments_skipped}, Skipped_LowConf: {low_confidence_segments_skipped}, HallucinationWarn: {hallucination_warnings})")
-                yield {
-                    "type": "final",
-                    "start": start_time,
-                    "end": last_end_time, # 使用最後有效片段的結束時間
-                    "text": full_text,
-                    "language": info.language,
-                    "language_probability": info.language_probability,
-                    # 提供一些過濾的統計信息，供上層參考
-                    "confidence_info": {
-                         "total_segments_processed": total_segments_processed,
-                         "no_speech_segments_skipped": no_speech_segments_skipped,
-                         "low_confidence_segments_skipped": low_confidence_segments_skipped,
-                         "hallucination_warnings": hallucination_warnings,
-                         "avg_logprob_threshold": FILTER_AVG_LOGPROB_THRESHOLD,
-                         "no_speech_prob_threshold": FILTER_NO_SPEECH_PROB_THRESHOLD
-                    }
-                }
-            else:
-                logger.info(f"Segment transcription complete but no text output after filtering: [{start_time:.2f}s -> {last_end_time:.2f}s] "
-                            f"(Processed: {total_segments_processed}, Skipped_NoSpeech: {no_speech_segments_skipped}, Skipped_LowConf: {low_confidence_segments_skipped}, HallucinationWarn: {hallucination_warnings})")
-                # 可以選擇性地發送一個空的 final 消息或 info 消息
+            if result is not None:
+                yield result
+                # 可以選擇性地在無文本時發送一個空的 final 消息或 info 消息
                 # yield {"type": "info", "message": "No speech detected or filtered out in segment"}
 
         except Exception as e:
             logger.error(f"Error during segment transcription starting at {start_time:.2f}s: {e}", exc_info=True)
             yield {"type": "error", "message": f"Transcription error: {e}"}
 
-    async def process_audio_chunk(self, chunk: bytes) -> AsyncGenerator[Dict[str, Any], None]:
-        """處理從 WebSocket 傳來的一個音訊塊"""
-        self._buffer.append(chunk)
-        accumulated_bytes = b"".join(self._buffer)
+    async def transcribe_job(self, job: SegmentJob) -> AsyncGenerator[Dict[str, Any], None]:
+        """推理階段: 轉錄 VAD 階段切出的一個片段 (同一會話的片段必須按順序調用)"""
+        if job.kind == "partial":
+            async for result in self._transcribe_partial(job):
+                yield result
+            return
+        self._finalized_segment_id = max(self._finalized_segment_id, job.segment_id)
+        async for result in self._transcribe_segment(job.audio, job.start_time, forced_split=job.forced_split):
+            if job.merged_segments > 1 and result.get("type") == "final":
+                # 合併的片段之間的靜音沒有送入模型，結束時間以最後一個原始片段為準
+                result["end"] = job.end_time
+                result["merged_segments"] = job.merged_segments
+            yield result
+
+    def _skip_frames(self, skipped_bytes: int) -> SegmentJob | None:
+        """
+        推進被丟棄的靜音 (drop_silence 過載策略) 所佔的時間，使之後的時間戳保持正確。
+        說話期間被丟棄的靜音計入結尾靜音，達到閾值時結束當前片段並返回其 final 任務。
+        """
+        skipped_bytes += self._skipped_bytes_remainder
+        frames, self._skipped_bytes_remainder = divmod(skipped_bytes, self.BYTES_PER_FRAME)
+        if frames == 0:
+            return None
+        self._frames_processed += frames
+        if not self._is_speaking:
+            return None
+        self._silence_frames_after_speech += frames
+        if self._silence_frames_after_speech < self._silence_frames_needed:
+            return None
+        self._is_speaking = False
+        self._silence_frames_after_speech = 0
+        job = self._final_job()
+        self._speech_buffer.clear()
+        self._reset_partial_state()
+        return job
+
+    async def segment_audio_chunk(self, chunk: bytes, skipped_bytes: int = 0,
+                                  partials: bool = True) -> AsyncGenerator[Dict[str, Any] | SegmentJob, None]:
+        """
+        VAD 階段: 處理從 WebSocket 傳來的一個音訊塊，產生要立即發送的消息 (dict) 與待轉錄的片段 (SegmentJob)。
+        skipped_bytes: 在此音訊塊之前被丟棄的靜音字節數；partials=False 時 (會話落後) 不產生中間結果任務。
+        """
+        if skipped_bytes:
+            job = self._skip_frames(skipped_bytes)
+            if job is not None:
+                yield job
+                yield {"type": "info", "message": "Silence detected"}
+
+        self._buffer.write(chunk)
 
-        # 檢查是否有足夠的數據組成一個 VAD 幀
-        while len(accumulated_bytes) >= self.BYTES_PER_FRAME:
-            frame = accumulated_bytes[:self.BYTES_PER_FRAME]
-            accumulated_bytes = accumulated_bytes[self.BYTES_PER_FRAME:]
+        # 一次取出所有完整的 VAD 幀 (不足一幀的數據保留在緩衝區中)，整塊交給 VAD 引擎判斷
+        frames = self._buffer.drain_frames()
+        if len(frames) == 0:
+            return
+        speech_flags = await self.vad.classify(frames)
 
+        for frame, is_speech in zip(frames, speech_flags):
             self._frames_processed += 1
             frame_start_time = (self._frames_processed - 1) * self.MS_PER_FRAME / 1000.0
 
-            try:
-                is_speech = self.vad.is_speech(frame, 16000)
-            except Exception as e:
-                # VAD 可能對異常幀拋出錯誤
-                logger.warning(f"VAD error on frame: {e}")
-                is_speech = False # 當作靜音處理
-
             if is_speech:
                 #logger.debug(f"Frame {self._frames_processed}: Speech detected")
                 if not self._is_speaking:
@@ -315,53 +818,70 @@ class AudioTranscriptionStreamer:
                     self._current_speech_start_time = frame_start_time
                     logger.info(f"Speech segment started at {self._current_speech_start_time:.2f}s")
                     # 清空之前的語音幀並添加當前幀
-                    self._speech_frames.clear()
-                    self._speech_frames.append(frame)
+                    self._speech_buffer.clear()
+                    self._speech_buffer.append(frame)
                     self._silence_frames_after_speech = 0 # 重置靜音計數
+                    self._reset_partial_state()
                     yield {"type": "info", "message": "Speech detected"}
                 else:
                     # 持續語音 -> 添加幀到緩衝
-                    self._speech_frames.append(frame)
+                    self._speech_buffer.append(frame)
                     self._silence_frames_after_speech = 0 # 重置靜音計數
-
             else: # is not speech
                 #logger.debug(f"Frame {self._frames_processed}: Silence detected")
                 if self._is_speaking:
                     # 從語音變為靜音
                     self._silence_frames_after_speech += 1
                     # 添加靜音幀到緩衝，以便 Whisper 能處理結尾的靜音
-                    self._speech_frames.append(frame)
+                    self._speech_buffer.append(frame)
 
                     if self._silence_frames_after_speech >= self._silence_frames_needed:
-                        # 連續靜音達到閾值 -> 語音片段結束，觸發轉錄
+                        # 連續靜音達到閾值 -> 語音片段結束，交給推理階段轉錄
                         logger.info(f"Silence threshold reached after speech at frame {self._frames_processed}. Triggering transcription.")
-                        segment_data = b"".join(self._speech_frames)
-                        self._speech_frames.clear()
                         self._is_speaking = False
                         self._silence_frames_after_speech = 0
 
-                        # 異步執行轉錄並產生結果
-                        async for result in self._transcribe_segment(segment_data):
-                             yield result
+                        yield self._final_job()
+                        self._speech_buffer.clear()
+                        self._reset_partial_state()
 
                         yield {"type": "info", "message": "Silence detected"}
                 else:
                     # 持續靜音 -> 不處理，等待語音
                     pass
 
-        # 將剩餘不足一幀的數據放回緩衝區
-        self._buffer.clear()
-        if accumulated_bytes:
-            self._buffer.append(accumulated_bytes)
+            # 片段達到長度上限 (例如背景音樂或連續說話) -> 強制切分
+            if self._is_speaking and len(self._speech_buffer) >= self._max_segment_samples:
+                yield self._force_split()
+
+            # 說話期間按設定的節奏產生中間結果 (會話落後時跳過)
+            if self._partial_due():
+                self._last_partial_frame = self._frames_processed
+                if partials:
+                    yield SegmentJob("partial", self._speech_buffer.copy_float32(), self._current_speech_start_time,
+                                     self._frames_processed * self.MS_PER_FRAME / 1000.0, self._segment_id)
 
-    async def stream_complete(self) -> AsyncGenerator[Dict[str, Any], None]:
-        """處理音訊流結束時可能剩餘的語音數據"""
+    def finish_segments(self) -> SegmentJob | None:
+        """音訊流結束: 返回剩餘語音數據的 final 任務 (沒有時返回 None)，並釋放 VAD 資源"""
         logger.info("Audio stream complete. Processing remaining speech data...")
-        if self._is_speaking and self._speech_frames:
-             logger.info("Transcribing final segment...")
-             segment_data = b"".join(self._speech_frames)
-             self._speech_frames.clear()
-             self._is_speaking = False
-             async for result in self._transcribe_segment(segment_data):
-                 yield result
-        logger.info("Streamer cleanup complete.")
\ No newline at end of file
+        job = None
+        if self._is_speaking and len(self._speech_buffer):
+            logger.info("Transcribing final segment...")
+            self._is_speaking = False
+            job = self._final_job()
+            self._speech_buffer.clear()
+        self.close()
+        return job
+
+    def buffered_speech_sec(self) -> float:
+        """尚未切成片段的語音長度 (秒)"""
+        return len(self._speech_buffer) / 16000 if self._is_speaking else 0.0
+
+    def close(self):
+        """釋放 VAD 資源 (會話被取消時直接調用，不再產生剩餘片段)；可重複調用"""
+        if self._closed:
+            return
+        self._closed = True
+        self.vad.close()
+        logger.info("Streamer cleanup complete.")
+
@@ -0,0 +1,458 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Set, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .metrics import STT_END_OF_SPEECH_TO_FINAL_SECONDS
+from .stt_service import AudioTranscriptionStreamer, SegmentJob
+from .vad_engine import frame_energy_dbfs
+
+if TYPE_CHECKING:
+    from fastapi import WebSocket
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_POLICIES = ("buffer", "drop_silence", "merge")
+BYTES_PER_SECOND = 16000 * 2 # 16 kHz, 16-bit PCM
+
+_END = object() # 隊列結束標記
+
+
+def is_silent_chunk(chunk: bytes, threshold_dbfs: float) -> bool:
+    """整個音訊塊的 RMS 能量是否低於門限"""
+    pcm = np.frombuffer(chunk, dtype=np.int16, count=len(chunk) // 2)
+    if len(pcm) == 0:
+        return True
+    return bool(frame_energy_dbfs(pcm.reshape(1, -1))[0] < threshold_dbfs)
+
+
+class SegmentQueue:
+    """
+    VAD 與推理階段之間的有界片段隊列 (單一生產者、單一消費者)。
+    與 asyncio.Queue 不同，它允許查看與改寫隊尾: final 片段入隊時移除同一片段已過時的中間結果，
+    merge 策略下可把新片段併入隊尾的片段。
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(maxsize, 1)
+        self._items: deque = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def full(self) -> bool:
+        return len(self._items) >= self.maxsize
+
+    def backlog_sec(self) -> float:
+        return sum(item.duration for item in self._items if isinstance(item, SegmentJob) and item.kind == "final")
+
+    def _drop_stale_partials(self, segment_id: int):
+        """移除 segment_id (含) 之前的片段的中間結果: 它們的 final 已經在路上了"""
+        self._items = deque(
+            queued for queued in self._items
+            if not (isinstance(queued, SegmentJob) and queued.kind == "partial" and queued.segment_id <= segment_id)
+        )
+
+    def _append(self, item: Any):
+        if isinstance(item, SegmentJob) and item.kind == "final":
+            self._drop_stale_partials(item.segment_id)
+        self._items.append(item)
+        self._not_empty.set()
+
+    async def put(self, item: Any):
+        if isinstance(item, SegmentJob) and item.kind == "final":
+            self._drop_stale_partials(item.segment_id) # 先騰出空位，避免 final 排在過時的中間結果之後
+        while self.full() and item is not _END:
+            self._not_full.clear()
+            await self._not_full.wait()
+        self._append(item)
+
+    def put_nowait(self, item: Any) -> bool:
+        if self.full():
+            return False
+        self._append(item)
+        return True
+
+    def try_merge(self, job: SegmentJob, max_samples: int) -> bool:
+        """將 final 片段併入隊尾的 final 片段 (兩者都不是強制切分且合併後不超過 max_samples)"""
+        if not self._items:
+            return False
+        last = self._items[-1]
+        if (not isinstance(last, SegmentJob) or last.kind != "final" or last.forced_split or job.forced_split
+                or len(last.audio) + len(job.audio) > max_samples):
+            return False
+        self._items[-1] = SegmentJob(
+            "final", np.concatenate([last.audio, job.audio]), last.start_time, job.end_time, job.segment_id,
+            merged_segments=last.merged_segments + job.merged_segments,
+            created_at=last.created_at, # 延遲從最早結束的那段語音算起
+        )
+        return True
+
+    def drain(self) -> List[SegmentJob]:
+        """取出所有排隊中的片段 (會話取消時使用)"""
+        items = [item for item in self._items if isinstance(item, SegmentJob)]
+        self._items.clear()
+        self._not_full.set()
+        return items
+
+    async def get(self) -> Any:
+        while not self._items:
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        item = self._items.popleft()
+        self._not_full.set()
+        return item
+
+
+class SessionDisconnected(Exception):
+    """客戶端斷開且未在寬限期內重新連接"""
+
+
+# --- 全局流式會話統計 (浪費的計算) ---
+stream_stats: Dict[str, Any] = {
+    "sessions_started": 0,
+    "disconnects": 0, # 客戶端在 STREAM_END 之前斷開
+    "reconnects": 0, # 在寬限期內以 session_id 重新連接
+    "reconnect_expired": 0, # 寬限期內未重新連接而被取消的會話
+    "cancelled_segments": 0, # 斷開時被丟棄的排隊片段 (含中間結果)
+    "cancelled_audio_sec": 0.0, # 斷開時尚未轉錄而被丟棄的音訊
+    "cancelled_inflight_decodes": 0, # 斷開時正在解碼 (或在排程器中等待) 而被取消的片段
+    "cancelled_translations": 0, # 被取消的翻譯請求
+}
+_active_sessions: Set["StreamingSessionPipeline"] = set()
+_detached_sessions: Dict[str, "StreamingSessionPipeline"] = {}
+
+
+def get_detached_session(session_id: str) -> "StreamingSessionPipeline | None":
+    """返回正在等待重新連接的會話"""
+    return _detached_sessions.get(session_id)
+
+
+def streaming_stats() -> Dict[str, Any]:
+    return {
+        "sessions_active": len(_active_sessions),
+        "sessions_awaiting_reconnect": len(_detached_sessions),
+        **stream_stats,
+        "cancelled_audio_sec": round(stream_stats["cancelled_audio_sec"], 2),
+    }
+
+
+class StreamingSessionPipeline:
+    """
+    單個 WebSocket 會話的三段式流水線: 接收 -> VAD/切段 -> 推理，另有一個發送任務。
+
+    各階段以有界隊列連接，推理期間仍持續接收音訊與執行 VAD。會話積壓的未轉錄音訊
+    (兩個隊列中的音訊加上正在轉錄的片段) 超過 throttle_sec 時發送 {"type": "throttle", "active": true}，
+    並暫停產生中間結果；隊列滿時按 policy 處理:
+    - buffer: 接收階段阻塞，不再讀取 WebSocket，由 TCP 將反壓傳回客戶端；
+    - drop_silence: 丟棄靜音音訊塊 (只記錄其時長以保持時間戳)，語音塊仍然阻塞等待；
+    - merge: 將新的片段併入隊尾的片段，多個短句合併為一次解碼。
+
+    客戶端在 STREAM_END 之前斷開時，排隊中與執行中的轉錄和翻譯全部取消；
+    reconnect_grace_sec > 0 時先保留會話，客戶端可在寬限期內帶上 session_id 重新連接 (見 attach)。
+    """
+
+    # 正常結束 (STREAM_END) 時等待未完成翻譯的最長時間
+    TRANSLATION_DRAIN_TIMEOUT_SEC = 10.0
+
+    def __init__(self, websocket: "WebSocket", streamer: AudioTranscriptionStreamer,
+                 on_final: Callable[[Dict[str, Any]], None] | None = None,
+                 policy: str = settings.stt_stream_overload_policy,
+                 audio_queue_size: int = settings.stt_stream_audio_queue_size,
+                 segment_queue_size: int = settings.stt_stream_segment_queue_size,
+                 throttle_sec: float = settings.stt_stream_throttle_sec,
+                 reconnect_grace_sec: float = settings.stt_stream_reconnect_grace_sec):
+        if policy not in OVERLOAD_POLICIES:
+            logger.error(f"Unknown stream overload policy '{policy}'. Falling back to 'buffer'.")
+            policy = "buffer"
+        self.session_id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.streamer = streamer
+        self.on_final = on_final
+        self.policy = policy
+        self.throttle_sec = throttle_sec
+        self.reconnect_grace_sec = max(reconnect_grace_sec, 0.0)
+        self._audio_queue: asyncio.Queue = asyncio.Queue(maxsize=max(audio_queue_size, 1))
+        self._segments = SegmentQueue(segment_queue_size)
+        self._outbound: asyncio.Queue = asyncio.Queue()
+        self._queued_audio_bytes = 0
+        self._inflight_sec = 0.0
+        self._pending_skip_bytes = 0
+        self._max_merge_samples = int(min(settings.stt_max_segment_sec, 30.0 - settings.stt_split_overlap_sec) * 16000)
+        self._translations: Set[asyncio.Task] = set()
+        self._connected = asyncio.Event()
+        self._connected.set()
+        self._reattached = asyncio.Event()
+        self._released: asyncio.Future | None = None # 重新連接的 WebSocket 處理協程在 attach() 中等待此 Future
+        self.throttled = False
+        self.disconnected = False
+        self.stats: Dict[str, Any] = {
+            "throttle_events": 0,
+            "dropped_silence_sec": 0.0,
+            "merged_segments": 0,
+            "skipped_partials": 0,
+        }
+
+    # --- 發送 ---
+    def send(self, message: Dict[str, Any]):
+        """將消息交給發送任務 (所有 WebSocket 寫入都經由同一個任務，保證順序且不會並發寫入)"""
+        self._outbound.put_nowait(message)
+
+    async def _send_loop(self):
+        while True:
+            message = await self._outbound.get()
+            if message is _END:
+                return
+            # 斷開期間消息保留在隊列中，重新連接後依序送出
+            while True:
+                await self._connected.wait()
+                websocket = self.websocket
+                try:
+                    await websocket.send_json(message)
+                    break
+                except Exception as e:
+                    logger.warning(f"Could not send message to client, connection closed: {e}")
+                    self._mark_disconnected(websocket)
+
+    # --- 翻譯任務 ---
+    def start_translation(self, coro):
+        """在會話範圍內啟動翻譯任務，斷開時會被取消"""
+        task = asyncio.create_task(coro)
+        self._translations.add(task)
+        task.add_done_callback(self._translations.discard)
+
+    async def _drain_translations(self):
+        if not self._translations:
+            return
+        _, pending = await asyncio.wait(set(self._translations), timeout=self.TRANSLATION_DRAIN_TIMEOUT_SEC)
+        if pending:
+            logger.warning(f"{len(pending)} translations still running {self.TRANSLATION_DRAIN_TIMEOUT_SEC:g}s after stream end. Cancelling.")
+            self._cancel_translations()
+
+    def _cancel_translations(self):
+        for task in list(self._translations):
+            if not task.done():
+                task.cancel()
+                stream_stats["cancelled_translations"] += 1
+
+    # --- 積壓與反壓 ---
+    def backlog_sec(self) -> float:
+        """尚未轉錄的音訊秒數 (會話落後於實時的程度)"""
+        return self._queued_audio_bytes / BYTES_PER_SECOND + self._segments.backlog_sec() + self._inflight_sec
+
+    def _update_throttle(self):
+        backlog = self.backlog_sec()
+        if not self.throttled and backlog > self.throttle_sec:
+            self.throttled = True
+            self.stats["throttle_events"] += 1
+            logger.warning(f"Session is {backlog:.1f}s behind real time. Throttling client (policy: {self.policy}).")
+            self.send({"type": "throttle", "active": True, "backlog_sec": round(backlog, 2), "policy": self.policy})
+        elif self.throttled and backlog < self.throttle_sec / 2:
+            self.throttled = False
+            logger.info(f"Session caught up ({backlog:.1f}s backlog). Throttle released.")
+            self.send({"type": "throttle", "active": False, "backlog_sec": round(backlog, 2), "policy": self.policy})
+
+    # --- 連接管理 ---
+    def _mark_disconnected(self, websocket: "WebSocket"):
+        if websocket is not self.websocket or self.disconnected:
+            return
+        self.disconnected = True
+        self._connected.clear()
+        if self._released is not None and not self._released.done():
+            self._released.set_result(None)
+
+    async def _wait_for_reconnect(self) -> bool:
+        """斷開後在寬限期內等待 attach()，期間已排隊的工作照常進行"""
+        if self.reconnect_grace_sec <= 0:
+            return False
+        logger.info(f"Session {self.session_id} detached. Waiting up to {self.reconnect_grace_sec:g}s for reconnection.")
+        self._reattached.clear()
+        _detached_sessions[self.session_id] = self
+        try:
+            await asyncio.wait_for(self._reattached.wait(), timeout=self.reconnect_grace_sec)
+            return True
+        except asyncio.TimeoutError:
+            stream_stats["reconnect_expired"] += 1
+            logger.info(f"Session {self.session_id} was not resumed within {self.reconnect_grace_sec:g}s.")
+            return False
+        finally:
+            _detached_sessions.pop(self.session_id, None)
+
+    async def attach(self, websocket: "WebSocket"):
+        """客戶端以 session_id 重新連接: 之後的接收與發送改用新的 WebSocket，直到會話結束或再次斷開"""
+        self.websocket = websocket
+        self._released = asyncio.get_running_loop().create_future()
+        self.disconnected = False
+        self._reattached.set()
+        self._connected.set()
+        stream_stats["reconnects"] += 1
+        logger.info(f"Session {self.session_id} resumed.")
+        self.send({"type": "session", "session_id": self.session_id, "resumed": True})
+        await self._released
+
+    # --- 階段 1: 接收 ---
+    async def _receive_until_end(self) -> bool:
+        """從目前的 WebSocket 接收音訊，收到 STREAM_END 時返回 True，斷開時返回 False"""
+        websocket = self.websocket
+        while True:
+            try:
+                data = await websocket.receive()
+            except Exception as e:
+                logger.info(f"WebSocket receive failed: {e}")
+                data = {"type": "websocket.disconnect"}
+            if data.get("type") == "websocket.disconnect":
+                logger.info(f"WebSocket of session {self.session_id} disconnected by client.")
+                self._mark_disconnected(websocket)
+                return False
+            if data.get("bytes") is not None:
+                chunk = data["bytes"]
+                if self._audio_queue.full():
+                    self._update_throttle()
+                    if self.policy == "drop_silence" and is_silent_chunk(chunk, settings.stt_stream_drop_silence_dbfs):
+                        self._pending_skip_bytes += len(chunk)
+                        self.stats["dropped_silence_sec"] += len(chunk) / BYTES_PER_SECOND
+                        continue
+                item: Tuple[int, bytes] = (self._pending_skip_bytes, chunk)
+                self._pending_skip_bytes = 0
+                await self._audio_queue.put(item)
+                self._queued_audio_bytes += len(chunk)
+                self._update_throttle()
+            elif data.get("text") is not None:
+                message = data["text"]
+                logger.info(f"Received text message: {message}")
+                if message == "STREAM_END":
+                    logger.info("Received stream end signal.")
+                    return True
+                self.send({"type": "info", "message": f"Received unknown text message: {message}"})
+
+    async def _receive_loop(self):
+        while not await self._receive_until_end():
+            stream_stats["disconnects"] += 1
+            if not await self._wait_for_reconnect():
+                raise SessionDisconnected()
+        # 出錯或斷開時不會到這裡: run() 會直接取消其他階段
+        await self._audio_queue.put(_END)
+
+    # --- 階段 2: VAD 與切段 ---
+    async def _enqueue_job(self, job: SegmentJob):
+        if job.kind == "partial":
+            # 中間結果只在有空位時入隊，永不阻塞 VAD
+            if self.throttled or not self._segments.put_nowait(job):
+                self.stats["skipped_partials"] += 1
+            return
+        if self._segments.full():
+            self._update_throttle()
+            if self.policy == "merge" and self._segments.try_merge(job, self._max_merge_samples):
+                self.stats["merged_segments"] += 1
+                return
+        await self._segments.put(job)
+        self._update_throttle()
+
+    async def _vad_loop(self):
+        try:
+            while True:
+                item = await self._audio_queue.get()
+                if item is _END:
+                    break
+                skipped_bytes, chunk = item
+                self._queued_audio_bytes -= len(chunk)
+                async for event in self.streamer.segment_audio_chunk(chunk, skipped_bytes, partials=not self.throttled):
+                    if isinstance(event, SegmentJob):
+                        await self._enqueue_job(event)
+                    else:
+                        self.send(event)
+            job = self.streamer.finish_segments()
+            if job is not None:
+                await self._enqueue_job(job)
+        finally:
+            await self._segments.put(_END)
+
+    # --- 階段 3: 推理 ---
+    async def _inference_loop(self):
+        while True:
+            job = await self._segments.get()
+            if job is _END:
+                return
+            self._inflight_sec = job.duration if job.kind == "final" else 0.0
+            try:
+                async for result in self.streamer.transcribe_job(job):
+                    self.send(result)
+                    if result.get("type") == "final":
+                        if job.kind == "final":
+                            STT_END_OF_SPEECH_TO_FINAL_SECONDS.observe(time.perf_counter() - job.created_at)
+                        if self.on_final is not None:
+                            self.on_final(result)
+            except asyncio.CancelledError:
+                stream_stats["cancelled_inflight_decodes"] += 1
+                stream_stats["cancelled_audio_sec"] += self._inflight_sec
+                raise
+            finally:
+                self._inflight_sec = 0.0
+            self._update_throttle()
+
+    def _cancel_queued_work(self):
+        """斷開: 丟棄尚未轉錄的音訊與片段並記錄浪費的工作量"""
+        queued_jobs = self._segments.drain()
+        audio_sec = (self._queued_audio_bytes / BYTES_PER_SECOND
+                     + sum(job.duration for job in queued_jobs if job.kind == "final")
+                     + self.streamer.buffered_speech_sec())
+        stream_stats["cancelled_segments"] += len(queued_jobs)
+        stream_stats["cancelled_audio_sec"] += audio_sec
+        self._queued_audio_bytes = 0
+        self._cancel_translations()
+        self.streamer.close()
+        logger.info(f"Session {self.session_id} cancelled after disconnect: dropped {len(queued_jobs)} queued segments "
+                    f"and {audio_sec:.1f}s of untranscribed audio.")
+
+    async def run(self):
+        """執行直到客戶端發送 STREAM_END (處理完所有已排隊的片段後關閉連接) 或斷開 (取消所有未完成的工作)"""
+        stream_stats["sessions_started"] += 1
+        _active_sessions.add(self)
+        if self.reconnect_grace_sec > 0:
+            self.send({"type": "session", "session_id": self.session_id, "reconnect_grace_sec": self.reconnect_grace_sec})
+        sender = asyncio.create_task(self._send_loop())
+        stages = [
+            asyncio.create_task(self._receive_loop()),
+            asyncio.create_task(self._vad_loop()),
+            asyncio.create_task(self._inference_loop()),
+        ]
+        try:
+            await asyncio.gather(*stages)
+            await self._drain_translations()
+        except SessionDisconnected:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            self._cancel_queued_work()
+        finally:
+            # 每條結束路徑 (包括未預期的錯誤與取消) 都移出活躍會話、釋放 VAD 資源並停止剩餘的階段與翻譯
+            _active_sessions.discard(self)
+            self.streamer.close()
+            self._cancel_translations()
+            for stage in stages:
+                stage.cancel()
+            if self.disconnected:
+                sender.cancel()
+            else:
+                self._outbound.put_nowait(_END)
+            await asyncio.gather(*stages, sender, return_exceptions=True)
+            if any(self.stats.values()):
+                logger.info(f"Streaming session pipeline stats: {self.stats}")
+
+    async def close(self, code: int = 1000, reason: str | None = None):
+        """關閉目前的 WebSocket (仍連接時)，並讓重新連接的處理協程返回"""
+        if not self.disconnected:
+            try:
+                await self.websocket.close(code=code, reason=reason)
+            except Exception:
+                pass
+            self.disconnected = True
+        if self._released is not None and not self._released.done():
+            self._released.set_result(None)
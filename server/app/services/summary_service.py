@@ -1,25 +1,49 @@
+import asyncio
 import logging
 import re
-from openai import AsyncOpenAI, OpenAIError # <--- 導入 OpenAIError
+import threading
+import time
 from typing import Dict, Any, Optional
 import httpx # <-- 添加導入 httpx 以便在代理函數中使用
 
 from ..core.config import settings
+from .metrics import TRANSLATION_LATENCY_SECONDS
 
 logger = logging.getLogger(__name__)
 
-# --- 初始化 OpenAI 客戶端 ---
-# 確保設置 base_url 指向本地 LLM
-# 如果本地 LLM 不需要 API Key，api_key 可以設為一個非 None 的假值或根據庫的要求調整
-try:
-    client = AsyncOpenAI(
-        base_url=settings.local_llm_api_base,
-        api_key=settings.local_llm_api_key or "DUMMY_KEY" # 提供默認假值
-    )
-    logger.info(f"OpenAI client initialized for base_url: {settings.local_llm_api_base}")
-except Exception as e:
-    logger.error(f"Failed to initialize OpenAI client: {e}", exc_info=True)
-    client = None # 初始化失敗
+# --- OpenAI 客戶端 (啟動時在背景線程中初始化) ---
+# openai 庫導入較慢 (約一秒)，導入與創建都在線程中進行，不拖慢服務啟動，也不阻塞事件循環
+client = None
+_client_init_failed = False
+_client_lock = threading.Lock()
+
+def _init_client():
+    """
+    創建共享的 AsyncOpenAI 客戶端 (同步，在背景線程中調用)。
+    確保設置 base_url 指向本地 LLM；
+    如果本地 LLM 不需要 API Key，api_key 可以設為一個非 None 的假值或根據庫的要求調整。
+    初始化失敗時不再重試。
+    """
+    global client, _client_init_failed
+    with _client_lock:
+        if client is not None or _client_init_failed:
+            return
+        try:
+            from openai import AsyncOpenAI # 局部導入
+            client = AsyncOpenAI(
+                base_url=settings.local_llm_api_base,
+                api_key=settings.local_llm_api_key or "DUMMY_KEY" # 提供默認假值
+            )
+            logger.info(f"OpenAI client initialized for base_url: {settings.local_llm_api_base}")
+        except Exception as e:
+            logger.error(f"Failed to initialize OpenAI client: {e}", exc_info=True)
+            _client_init_failed = True # 初始化失敗
+
+async def get_client():
+    """返回共享的 AsyncOpenAI 客戶端 (初始化失敗時為 None)；尚未初始化時在線程中創建"""
+    if client is None and not _client_init_failed:
+        await asyncio.to_thread(_init_client)
+    return client
 
 async def get_summary_from_llm(text: str) -> str | None:
     """
@@ -31,6 +55,7 @@ async def get_summary_from_llm(text: str) -> str | None:
     Returns:
         摘要文本，如果出錯則返回 None。
     """
+    client = await get_client()
     if client is None:
         logger.error("OpenAI client is not initialized. Cannot get summary.")
         return None
@@ -82,6 +107,7 @@ async def get_translation_from_llm(text: str, source_lang: str, target_lang: str
     Returns:
         翻譯後的文本（已移除 <think> 內容），如果出錯則返回 None。
     """
+    client = await get_client()
     if client is None:
         logger.error("OpenAI client is not initialized. Cannot get translation.")
         return None
@@ -122,15 +148,21 @@ Target Language: [Specify the target language here, e.g., English, Japanese, Fre
 
     logger.info(f"Requesting translation from '{source_lang}' to '{target_lang}'. Text length: {len(text)}")
 
+    started_at = time.perf_counter()
     try:
-        response = await client.chat.completions.create(
-            model=settings.local_llm_model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.2,
-        )
+        try:
+            response = await client.chat.completions.create(
+                model=settings.local_llm_model_name,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                temperature=0.2,
+            )
+        except Exception:
+            TRANSLATION_LATENCY_SECONDS.observe(time.perf_counter() - started_at, outcome="error")
+            raise
+        TRANSLATION_LATENCY_SECONDS.observe(time.perf_counter() - started_at, outcome="ok")
 
         if response.choices and response.choices[0].message and response.choices[0].message.content:
             raw_translation = response.choices[0].message.content.strip()
@@ -173,11 +205,6 @@ async def proxy_chat_request(payload: Dict[str, Any]) -> Optional[httpx.Response
     Returns:
         httpx.Response 對象如果成功，否則返回 None。
     """
-    if client is None: # 雖然我們直接用 httpx，但可以保留對 client 初始化狀態的檢查
-        logger.error("OpenAI client (config check) is not initialized. Cannot proxy chat.")
-        # return None # 或者即使 client 用於其他地方，這裡仍然可以嘗試用 httpx
-        pass # 繼續嘗試用 httpx
-
     # 目標 URL 指向 LLM 的 chat/completions 端點
     target_url = f"{settings.local_llm_api_base}/chat/completions"
     logger.info(f"Proxying Chat request to: {target_url}")
@@ -1,8 +1,10 @@
 import logging
+import time
 import httpx # 確保 httpx 已安裝 (之前 LLM 已安裝)
 from typing import Dict, Any, Optional
 
 from ..core.config import settings
+from .metrics import TTS_TIME_TO_FIRST_BYTE_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -43,8 +45,10 @@ async def proxy_tts_request(payload: Dict[str, Any]) -> Optional[httpx.Response]
         req = client.build_request(
             "POST", target_url, json=payload, headers=headers
         )
-        # 2. 發送請求，明確 stream=True
+        # 2. 發送請求，明確 stream=True (返回時已收到響應頭，即首字節延遲)
+        started_at = time.perf_counter()
         response = await client.send(req, stream=True)
+        TTS_TIME_TO_FIRST_BYTE_SECONDS.observe(time.perf_counter() - started_at)
         logger.info(f"Initial response from TTS service: Status {response.status_code}")
 
         # 3. 檢查初始錯誤狀態 (但不關閉流)
@@ -0,0 +1,240 @@
+import asyncio
+from abc import ABC, abstractmethod
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import List
+
+import numpy as np
+import webrtcvad
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+
+
+class VADEngine(ABC):
+    """
+    VAD 引擎接口。每個會話一個實例，一次對一整塊音訊的所有幀做判斷。
+
+    frames: 形狀為 (幀數, 每幀樣本數) 的 int16 陣列 (30 ms 幀)。
+    返回與幀一一對應的布林陣列 (True = 語音)。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    async def classify(self, frames: np.ndarray) -> np.ndarray:
+        """判斷每一幀是否為語音"""
+
+    def close(self):
+        """釋放會話相關資源 (默認無操作)"""
+
+
+def frame_energy_dbfs(frames: np.ndarray) -> np.ndarray:
+    """以 NumPy 一次計算所有幀的 RMS 能量 (dBFS)"""
+    as_float = frames.astype(np.float32)
+    mean_square = np.einsum("ij,ij->i", as_float, as_float) / max(frames.shape[1], 1)
+    return 10.0 * np.log10(mean_square / (32768.0 ** 2) + 1e-12)
+
+
+class WebRTCVADEngine(VADEngine):
+    """
+    webrtcvad + 能量門限預過濾。
+
+    先用 NumPy 對整塊音訊計算每幀能量，低於 `energy_gate_dbfs` 的幀直接判為靜音，
+    只有可能是語音的幀才逐幀交給 webrtcvad，大幅減少靜音期間的 Python 級調用。
+    """
+
+    name = "webrtc"
+
+    def __init__(self, mode: int = 1, energy_gate_dbfs: float = settings.stt_vad_energy_gate_dbfs):
+        self.vad = webrtcvad.Vad()
+        # 設置 VAD 敏感度 (0-3, 3 最敏感)
+        self.vad.set_mode(mode) # 模式 1 或 2 通常比較平衡
+        self.energy_gate_dbfs = energy_gate_dbfs
+        self.frames_gated = 0 # 被能量門限直接判為靜音的幀數
+
+    async def classify(self, frames: np.ndarray) -> np.ndarray:
+        decisions = np.zeros(len(frames), dtype=bool)
+        if len(frames) == 0:
+            return decisions
+
+        candidates = np.flatnonzero(frame_energy_dbfs(frames) >= self.energy_gate_dbfs)
+        self.frames_gated += len(frames) - len(candidates)
+        for index in candidates:
+            try:
+                decisions[index] = self.vad.is_speech(memoryview(frames[index]).cast("B"), SAMPLE_RATE)
+            except Exception as e:
+                # VAD 可能對異常幀拋出錯誤
+                logger.warning(f"VAD error on frame: {e}")
+                decisions[index] = False # 當作靜音處理
+        return decisions
+
+
+@dataclass
+class _SileroSessionState:
+    """單個會話的 Silero 遞歸狀態"""
+    state: np.ndarray = field(default_factory=lambda: np.zeros((2, 1, 128), dtype=np.float32))
+    context: np.ndarray = field(default_factory=lambda: np.zeros(SileroVADBatcher.CONTEXT_SAMPLES, dtype=np.float32))
+    carry: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32)) # 不足一個窗口的剩餘樣本
+    last_prob: float = 0.0
+
+
+@dataclass
+class _SileroRequest:
+    session: _SileroSessionState
+    windows: np.ndarray # (窗口數, WINDOW_SAMPLES)
+    future: asyncio.Future
+
+
+class SileroVADBatcher:
+    """
+    跨會話的 Silero VAD (ONNX) 批次評分器。
+
+    所有會話在同一個 tick 內提交的窗口合併為一次 onnxruntime 調用 (第 k 步處理每個會話的
+    第 k 個窗口)，遞歸狀態按會話分別保存。推理在單獨的線程中執行，不阻塞事件循環。
+    需要官方 silero-vad v5 ONNX 模型 (輸入 input / state / sr)。
+    """
+
+    WINDOW_SAMPLES = 512 # Silero v5 在 16 kHz 下的固定窗口
+    CONTEXT_SAMPLES = 64
+
+    def __init__(self, model_path: str, tick_ms: float):
+        self.model_path = model_path
+        self.tick_sec = max(tick_ms, 0.0) / 1000.0
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="silero-vad")
+        self._pending: List[_SileroRequest] = []
+        self._flush_scheduled = False
+        self.calls = 0
+        self.windows_scored = 0
+
+    def _ensure_session(self):
+        if self._session is None:
+            import onnxruntime # 局部導入，僅在使用 Silero 引擎時需要
+            options = onnxruntime.SessionOptions()
+            options.inter_op_num_threads = 1
+            options.intra_op_num_threads = 1
+            self._session = onnxruntime.InferenceSession(self.model_path, sess_options=options, providers=["CPUExecutionProvider"])
+            logger.info(f"Silero VAD model loaded from {self.model_path}")
+        return self._session
+
+    async def score(self, session: _SileroSessionState, windows: np.ndarray) -> np.ndarray:
+        """提交一個會話的窗口，在下一個 tick 與其他會話一起評分，返回每個窗口的語音概率"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(_SileroRequest(session=session, windows=windows, future=future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_later(self.tick_sec, lambda: asyncio.ensure_future(self._flush()))
+        return await future
+
+    async def _flush(self):
+        requests, self._pending = self._pending, []
+        self._flush_scheduled = False
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self._run, requests)
+        except Exception as e:
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        for request, probs in zip(requests, results):
+            if not request.future.done():
+                request.future.set_result(probs)
+
+    def _run(self, requests: List[_SileroRequest]) -> List[np.ndarray]:
+        onnx_session = self._ensure_session()
+        results = [np.zeros(len(request.windows), dtype=np.float32) for request in requests]
+        steps = max((len(request.windows) for request in requests), default=0)
+        sample_rate = np.array(SAMPLE_RATE, dtype=np.int64)
+
+        for step in range(steps):
+            active = [i for i, request in enumerate(requests) if step < len(request.windows)]
+            batch_input = np.stack([
+                np.concatenate((requests[i].session.context, requests[i].windows[step])) for i in active
+            ])
+            batch_state = np.concatenate([requests[i].session.state for i in active], axis=1)
+            output, new_state = onnx_session.run(None, {"input": batch_input, "state": batch_state, "sr": sample_rate})
+            self.calls += 1
+            self.windows_scored += len(active)
+
+            for row, i in enumerate(active):
+                session = requests[i].session
+                session.state = new_state[:, row:row + 1, :]
+                session.context = batch_input[row, -self.CONTEXT_SAMPLES:]
+                results[i][step] = output[row, 0]
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SileroVADEngine(VADEngine):
+    """
+    使用共享 SileroVADBatcher 的會話級 VAD 引擎。
+
+    Silero 以 512 樣本為窗口，與 30 ms (480 樣本) 的幀不對齊：每幀採用覆蓋其最後一個樣本的
+    窗口的概率，窗口尚未湊滿時沿用最近一次的概率。
+    """
+
+    name = "silero"
+
+    def __init__(self, batcher: "SileroVADBatcher", threshold: float = settings.stt_silero_vad_threshold):
+        self.batcher = batcher
+        self.threshold = threshold
+        self._session = _SileroSessionState()
+
+    async def classify(self, frames: np.ndarray) -> np.ndarray:
+        if len(frames) == 0:
+            return np.zeros(0, dtype=bool)
+
+        session = self._session
+        carried = len(session.carry)
+        samples = np.concatenate((session.carry, frames.reshape(-1).astype(np.float32) / 32768.0))
+        window_count = len(samples) // SileroVADBatcher.WINDOW_SAMPLES
+        windows = samples[:window_count * SileroVADBatcher.WINDOW_SAMPLES].reshape(window_count, SileroVADBatcher.WINDOW_SAMPLES)
+        session.carry = samples[window_count * SileroVADBatcher.WINDOW_SAMPLES:].copy()
+
+        previous_prob = session.last_prob
+        probs = await self.batcher.score(session, windows) if window_count else np.zeros(0, dtype=np.float32)
+        if window_count:
+            session.last_prob = float(probs[-1])
+
+        # 每幀最後一個樣本所在的窗口序號 (-1 表示該窗口尚未完整)
+        frame_ends = carried + (np.arange(len(frames)) + 1) * frames.shape[1] - 1
+        window_index = frame_ends // SileroVADBatcher.WINDOW_SAMPLES
+        frame_probs = np.where(
+            window_index < window_count,
+            probs[np.minimum(window_index, max(window_count - 1, 0))] if window_count else previous_prob,
+            session.last_prob,
+        )
+        return frame_probs >= self.threshold
+
+
+# --- 共享的 Silero 批次評分器 (僅在選用 silero 引擎時創建) ---
+_silero_batcher: SileroVADBatcher | None = None
+
+
+def create_vad_engine(engine: str = settings.stt_vad_engine) -> VADEngine:
+    """根據配置為新會話創建 VAD 引擎；Silero 模型不可用時退回 webrtcvad"""
+    global _silero_batcher
+    if engine == "silero":
+        if os.path.exists(settings.stt_silero_vad_model_path):
+            if _silero_batcher is None:
+                _silero_batcher = SileroVADBatcher(settings.stt_silero_vad_model_path, settings.stt_silero_vad_tick_ms)
+            return SileroVADEngine(_silero_batcher)
+        logger.error(f"Silero VAD model not found at {settings.stt_silero_vad_model_path}. Falling back to webrtcvad.")
+    elif engine != "webrtc":
+        logger.error(f"Unknown VAD engine '{engine}'. Falling back to webrtcvad.")
+    return WebRTCVADEngine()
+
+
+def shutdown_vad_engines():
+    if _silero_batcher is not None:
+        _silero_batcher.shutdown()
@@ -0,0 +1,124 @@
+"""
+上傳文件解碼基準測試: 比較舊路徑 (pydub + 臨時 WAV + faster-whisper 再解碼) 與
+PyAV 記憶體內解碼 (decode_audio_to_float32) 得到模型輸入陣列的端到端耗時與峰值 RSS。
+
+每種方式在獨立的子進程中執行，峰值 RSS 互不影響。不含模型推理 (兩條路徑的推理部分相同)。
+舊路徑需要 pydub、系統 ffmpeg 與 faster-whisper，缺少時會被跳過。
+
+用法 (在 server 目錄下):
+    python -m benchmarks.bench_decode                    # 生成 1 小時的合成 MP3 後測試
+    python -m benchmarks.bench_decode --input talk.m4a   # 使用現有文件
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def generate_mp3(path: str, minutes: float, rate: int = 44100):
+    """以 PyAV 編碼一段立體聲合成音訊 (逐塊生成，不在記憶體中保留整段)"""
+    import av
+
+    frame_size = 1152
+    total = int(minutes * 60 * rate)
+    with av.open(path, "w", format="mp3") as container:
+        stream = container.add_stream("mp3", rate=rate)
+        stream.layout = "stereo"
+        for start in range(0, total, frame_size):
+            t = (np.arange(start, min(start + frame_size, total)) / rate).astype(np.float32)
+            tone = 0.2 * np.sin(2 * np.pi * (180 + 40 * np.sin(2 * np.pi * 0.3 * t)) * t) * (np.sin(2 * np.pi * 0.5 * t) > 0)
+            frame = av.AudioFrame.from_ndarray(np.ascontiguousarray(np.stack([tone, tone]), dtype=np.float32), format="fltp", layout="stereo")
+            frame.sample_rate = rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+        for packet in stream.encode(None):
+            container.mux(packet)
+
+
+def decode_legacy(path: str) -> np.ndarray:
+    """舊實現: 整個上傳讀入 BytesIO -> pydub (ffmpeg 子進程) -> 匯出臨時 WAV -> faster-whisper 解碼"""
+    from pydub import AudioSegment
+    from faster_whisper.audio import decode_audio
+
+    with open(path, "rb") as file:
+        audio = AudioSegment.from_file(io.BytesIO(file.read()))
+    audio = audio.set_frame_rate(SAMPLE_RATE).set_channels(1).set_sample_width(2)
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=True) as tmp_audio_file:
+        audio.export(tmp_audio_file.name, format="wav")
+        del audio
+        return decode_audio(tmp_audio_file.name, sampling_rate=SAMPLE_RATE)
+
+
+def decode_pyav(path: str) -> np.ndarray:
+    from app.services.audio_decode import decode_audio_to_float32
+
+    with open(path, "rb") as file:
+        return decode_audio_to_float32(file)
+
+
+def run_worker(method: str, path: str):
+    """子進程: 執行一次解碼並以 JSON 輸出耗時與峰值 RSS"""
+    baseline_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    started_at = time.perf_counter()
+    audio = {"legacy": decode_legacy, "pyav": decode_pyav}[method](path)
+    elapsed = time.perf_counter() - started_at
+    print(json.dumps({
+        "method": method,
+        "seconds": round(elapsed, 3),
+        "audio_sec": round(len(audio) / SAMPLE_RATE, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "baseline_rss_mb": round(baseline_mb, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", type=str, default=None, help="要解碼的音訊文件 (不提供則生成合成 MP3)")
+    parser.add_argument("--minutes", type=float, default=60.0, help="合成音訊長度 (分鐘)")
+    parser.add_argument("--methods", type=str, default="legacy,pyav", help="要測試的方式，逗號分隔")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.input)
+        return
+
+    path = args.input
+    generated = None
+    if path is None:
+        generated = tempfile.NamedTemporaryFile(suffix=".mp3", delete=False)
+        generated.close()
+        path = generated.name
+        print(f"Generating {args.minutes:g} min synthetic MP3 at {path}...")
+        generate_mp3(path, args.minutes)
+    print(f"Input: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+
+    try:
+        print(f"{'method':<8} {'seconds':>9} {'audio_sec':>10} {'peak_rss_mb':>12}")
+        for method in args.methods.split(","):
+            result = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_decode", "--worker", method, "--input", path],
+                capture_output=True, text=True,
+            )
+            if result.returncode != 0:
+                reason = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+                print(f"{method:<8} skipped: {reason}")
+                continue
+            stats = json.loads(result.stdout.strip().splitlines()[-1])
+            print(f"{method:<8} {stats['seconds']:>9.2f} {stats['audio_sec']:>10.1f} {stats['peak_rss_mb']:>12.1f}")
+    finally:
+        if generated is not None:
+            os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+VAD 切幀微基準測試: 比較舊的 join/slice 方式與 FrameRingBuffer.drain_frames (流式會話實際使用的路徑)
+在不同音訊塊大小下的開銷。
+
+用法 (在 server 目錄下):
+    python -m benchmarks.bench_frame_buffer
+"""
+import argparse
+import time
+
+from app.services.audio_buffers import FrameRingBuffer
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+MS_PER_FRAME = 30
+BYTES_PER_FRAME = SAMPLE_RATE * MS_PER_FRAME // 1000 * BYTES_PER_SAMPLE
+CHUNK_SIZES_MS = [30, 100, 250, 500, 1000]
+
+
+def legacy_framing(chunks):
+    """舊實現: 每個塊都 join 一次，每幀都 slice 一次剩餘數據"""
+    buffer = []
+    frames = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        accumulated = b"".join(buffer)
+        while len(accumulated) >= BYTES_PER_FRAME:
+            frame = accumulated[:BYTES_PER_FRAME]
+            accumulated = accumulated[BYTES_PER_FRAME:]
+            frames += 1
+        buffer.clear()
+        if accumulated:
+            buffer.append(accumulated)
+    return frames
+
+
+def ring_framing(chunks):
+    ring = FrameRingBuffer(BYTES_PER_FRAME)
+    frames = 0
+    for chunk in chunks:
+        ring.write(chunk)
+        frames += len(ring.drain_frames())
+    return frames
+
+
+def bench(func, chunks, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(chunks)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=int, default=60, help="每種塊大小模擬的音訊總長度 (秒)")
+    parser.add_argument("--repeat", type=int, default=5, help="重複次數 (取最佳值)")
+    args = parser.parse_args()
+
+    print(f"{'chunk':>8} | {'legacy us/chunk':>16} | {'ring us/chunk':>14} | {'legacy ns/byte':>15} | {'ring ns/byte':>13}")
+    for chunk_ms in CHUNK_SIZES_MS:
+        # 加一個字節的偏移，讓塊邊界與幀邊界錯開，模擬真實客戶端
+        chunk_bytes = SAMPLE_RATE * chunk_ms // 1000 * BYTES_PER_SAMPLE + 2
+        total_chunks = max(args.seconds * 1000 // chunk_ms, 1)
+        chunks = [bytes(chunk_bytes)] * total_chunks
+        total_bytes = chunk_bytes * total_chunks
+
+        legacy = bench(legacy_framing, chunks, args.repeat)
+        ring = bench(ring_framing, chunks, args.repeat)
+        print(f"{chunk_ms:>6}ms | {legacy / total_chunks * 1e6:>16.1f} | {ring / total_chunks * 1e6:>14.1f} | "
+              f"{legacy / total_bytes * 1e9:>15.2f} | {ring / total_bytes * 1e9:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+VAD 引擎基準測試: 模擬 N 個並發流，比較 webrtc (能量門限) 與 silero (跨會話批次 ONNX) 的每流 CPU 開銷。
+
+用法 (在 server 目錄下):
+    python -m benchmarks.bench_vad --streams 50 --seconds 20
+    python -m benchmarks.bench_vad --silero-model /path/to/silero_vad.onnx
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+from app.services.vad_engine import SileroVADBatcher, SileroVADEngine, WebRTCVADEngine
+
+SAMPLE_RATE = 16000
+SAMPLES_PER_FRAME = 480 # 30 ms
+CHUNK_FRAMES = 4 # 客戶端每次發送 120 ms
+
+
+def synthetic_audio(seconds: int, seed: int) -> np.ndarray:
+    """交替的 "語音" (調幅諧波 + 噪聲) 與靜音，各約佔一半"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    voiced = np.sin(2 * np.pi * 180 * t) + 0.5 * np.sin(2 * np.pi * 360 * t)
+    envelope = (np.sin(2 * np.pi * 0.25 * t + seed) > 0).astype(np.float32)
+    audio = voiced * envelope * 6000 + rng.normal(0, 30, len(t))
+    return audio.astype(np.int16)
+
+
+async def run_streams(engines, audio_per_stream) -> float:
+    """以每塊 CHUNK_FRAMES 幀的節奏驅動所有流，返回消耗的 CPU 秒數"""
+    frames_per_stream = [
+        audio[:len(audio) // SAMPLES_PER_FRAME * SAMPLES_PER_FRAME].reshape(-1, SAMPLES_PER_FRAME)
+        for audio in audio_per_stream
+    ]
+    total_frames = len(frames_per_stream[0])
+    cpu_start = time.process_time()
+    for offset in range(0, total_frames, CHUNK_FRAMES):
+        await asyncio.gather(*[
+            engine.classify(frames[offset:offset + CHUNK_FRAMES])
+            for engine, frames in zip(engines, frames_per_stream)
+        ])
+    return time.process_time() - cpu_start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=50, help="並發流數量")
+    parser.add_argument("--seconds", type=int, default=20, help="每個流的音訊長度 (秒)")
+    parser.add_argument("--silero-model", type=str, default=None, help="silero-vad v5 ONNX 模型路徑 (不提供則只測 webrtc)")
+    args = parser.parse_args()
+
+    audio = [synthetic_audio(args.seconds, seed) for seed in range(args.streams)]
+    stream_seconds = args.streams * args.seconds
+
+    results = {}
+    results["webrtc (no gate)"] = asyncio.run(run_streams([WebRTCVADEngine(energy_gate_dbfs=-200.0) for _ in audio], audio))
+    results["webrtc + energy gate"] = asyncio.run(run_streams([WebRTCVADEngine() for _ in audio], audio))
+    if args.silero_model:
+        batcher = SileroVADBatcher(args.silero_model, tick_ms=0)
+        results["silero (batched)"] = asyncio.run(run_streams([SileroVADEngine(batcher) for _ in audio], audio))
+        print(f"silero: {batcher.calls} ONNX calls for {batcher.windows_scored} windows")
+        batcher.shutdown()
+
+    print(f"{args.streams} streams x {args.seconds}s audio")
+    print(f"{'engine':>22} | {'CPU s':>8} | {'CPU ms per stream-second':>25} | {'est. % of one core per stream':>30}")
+    for name, cpu in results.items():
+        per_stream_second = cpu / stream_seconds
+        print(f"{name:>22} | {cpu:>8.3f} | {per_stream_second * 1000:>25.3f} | {per_stream_second * 100:>30.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# 測試以確定性的模擬後端運行 (不需要模型與 GPU)，必須在導入 app 之前設定
+os.environ.setdefault("STT_BACKEND", "stub")
+os.environ.setdefault("STT_DEVICE", "cpu")
+os.environ.setdefault("STT_VAD_ENGINE", "webrtc")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
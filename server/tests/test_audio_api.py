@@ -0,0 +1,87 @@
+import io
+import json
+import wave
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import audio
+from app.core.config import settings
+from app.services.stt_backends import SAMPLE_RATE
+from app.services.stt_result_cache import TranscriptionResultCache
+
+
+def _wav_bytes(seconds: float) -> bytes:
+    samples = np.random.default_rng(0).uniform(-0.5, 0.5, int(SAMPLE_RATE * seconds))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((samples * 32767).astype(np.int16).tobytes())
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(audio, "result_cache", TranscriptionResultCache(memory_items=8, directory=None, disk_budget_mb=0))
+    app = FastAPI()
+    app.include_router(audio.router)
+    app.state.stt_model_loaded = True
+    return TestClient(app)
+
+
+def _stream(client, upload: bytes):
+    response = client.post("/v1/audio/transcriptions", files={"file": ("speech.wav", upload, "audio/wav")},
+                           data={"stream": "true"})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines() if line]
+
+
+def test_stream_replays_cached_result(client):
+    upload = _wav_bytes(12.0)
+
+    first = _stream(client, upload)
+    second = _stream(client, upload)
+
+    assert [event["type"] for event in first] == [event["type"] for event in second]
+    assert (first[0]["cached"], second[0]["cached"]) == (False, True)
+    assert [event["text"] for event in first if event["type"] == "segment"] == \
+           [event["text"] for event in second if event["type"] == "segment"]
+
+
+def test_stream_skips_cache_beyond_segment_limit(client, monkeypatch):
+    monkeypatch.setattr(settings, "stt_result_cache_stream_max_segments", 1)
+    upload = _wav_bytes(12.0)
+
+    first = _stream(client, upload)
+    second = _stream(client, upload)
+
+    assert sum(event["type"] == "segment" for event in first) > 1
+    assert (first[0]["cached"], second[0]["cached"]) == (False, False)
+
+
+def test_decode_clamps_preallocation_and_grows(monkeypatch):
+    from app.services import audio_decode
+
+    allocations = []
+
+    class RecordingNumpy:
+        """只記錄 audio_decode 自己的 np.empty (PyAV 內部的分配不經過這裡)"""
+
+        def __getattr__(self, name):
+            return getattr(np, name)
+
+        def empty(self, shape, *args, **kwargs):
+            allocations.append(shape)
+            return np.empty(shape, *args, **kwargs)
+
+    monkeypatch.setattr(audio_decode, "MAX_PREALLOCATED_SEC", 1)
+    monkeypatch.setattr(audio_decode, "np", RecordingNumpy())
+
+    decoded = audio_decode.decode_audio_to_float32(io.BytesIO(_wav_bytes(5.0)))
+
+    assert allocations[0] == 2 * SAMPLE_RATE # 聲明 5 秒，只預分配上限 + 1 秒
+    assert len(decoded) == 5 * SAMPLE_RATE
@@ -0,0 +1,15 @@
+import pytest
+
+from app.services.metrics import Counter, _Metric
+
+
+def test_metric_requires_samples():
+    class IncompleteMetric(_Metric):
+        kind = "gauge"
+
+    with pytest.raises(TypeError):
+        IncompleteMetric("incomplete", "Missing samples.")
+
+    counter = Counter("requests_total", "Requests.")
+    counter.inc()
+    assert counter.render().endswith("kaudio_requests_total 1")
@@ -0,0 +1,139 @@
+import asyncio
+import sys
+import types
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+
+from app.services.stt_backends import SAMPLE_RATE, FasterWhisperBackend, STTBackend, StubModel
+from app.services.stt_long_audio import transcribe_long_audio
+
+
+@dataclass
+class _Segment:
+    start: float
+    end: float
+    text: str
+    no_speech_prob: float = 0.01
+    avg_logprob: float = -0.2
+
+
+class _FakeBatchedInferencePipeline:
+    """與 faster-whisper 1.1 相同: clip_timestamps 為樣本位置，直接用於切片"""
+    calls = []
+    created = 0
+
+    def __init__(self, model):
+        self.model = model
+        type(self).created += 1
+
+    def transcribe(self, audio, clip_timestamps, vad_filter, batch_size, **options):
+        type(self).calls.append(clip_timestamps)
+        type(self).options = options
+        segments = []
+        for index, clip in enumerate(clip_timestamps):
+            chunk = audio[clip["start"]:clip["end"]] # 浮點數邊界會拋出 TypeError
+            start = clip["start"] / SAMPLE_RATE
+            segments.append(_Segment(start, start + len(chunk) / SAMPLE_RATE, f"clip {index}"))
+        return iter(segments), {"language": options.get("language")}
+
+
+class _FakeWhisperModel:
+    """記錄單獨解碼收到的選項"""
+
+    def __init__(self):
+        self.options = None
+
+    def transcribe(self, audio, **options):
+        self.options = options
+        return iter([_Segment(0.0, len(audio) / SAMPLE_RATE, "solo")]), types.SimpleNamespace(language="en", language_probability=1.0)
+
+
+@pytest.fixture
+def fake_faster_whisper(monkeypatch):
+    fake_module = types.ModuleType("faster_whisper")
+    fake_module.BatchedInferencePipeline = _FakeBatchedInferencePipeline
+    monkeypatch.setitem(sys.modules, "faster_whisper", fake_module)
+    _FakeBatchedInferencePipeline.calls = []
+    _FakeBatchedInferencePipeline.created = 0
+
+
+def test_transcribe_batch_uses_sample_clip_timestamps(fake_faster_whisper):
+    audios = [np.zeros(SAMPLE_RATE * 2, dtype=np.float32), np.zeros(SAMPLE_RATE // 2, dtype=np.float32),
+              np.zeros(SAMPLE_RATE * 3, dtype=np.float32)]
+    results = FasterWhisperBackend().transcribe_batch(_FakeWhisperModel(), audios, {"language": "en"})
+
+    clips = _FakeBatchedInferencePipeline.calls[0]
+    assert clips == [{"start": 0, "end": 32000}, {"start": 32000, "end": 40000}, {"start": 40000, "end": 88000}]
+    assert all(isinstance(value, int) for clip in clips for value in clip.values())
+
+    assert [[segment.text for segment in segments] for segments, _ in results] == [["clip 0"], ["clip 1"], ["clip 2"]]
+    # 時間戳轉回各片段內的相對時間
+    assert [(segments[0].start, segments[0].end) for segments, _ in results] == [(0.0, 2.0), (0.0, 0.5), (0.0, 3.0)]
+
+
+def test_scheduler_decodes_solo_and_batched_with_same_options(fake_faster_whisper, monkeypatch):
+    from app.services import stt_scheduler
+
+    backend = FasterWhisperBackend()
+    monkeypatch.setattr(stt_scheduler, "stt_backend", backend)
+    model = _FakeWhisperModel()
+    audio = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+    stt_scheduler._decode_batch(model, [audio], {"language": "en"}, [None])
+    stt_scheduler._decode_batch(model, [audio, audio], {"language": "en"}, [None, None])
+    stt_scheduler._decode_batch(model, [audio, audio, audio], {"language": "en"}, [None, None, None])
+
+    # BatchedInferencePipeline 默認 without_timestamps=True 且沒有溫度回退: 兩條路徑都明確使用相同的選項
+    expected = {"language": "en", "without_timestamps": False, "temperature": 0.0}
+    assert model.options == expected
+    assert _FakeBatchedInferencePipeline.options == expected
+    # 批次推理管線每個模型只創建一次
+    assert _FakeBatchedInferencePipeline.created == 1
+    backend.transcribe_batch(_FakeWhisperModel(), [audio, audio], {"language": "en"})
+    assert _FakeBatchedInferencePipeline.created == 2
+
+
+def test_backend_requires_load_model():
+    class IncompleteBackend(STTBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteBackend()
+
+
+class _RecordingStubModel(StubModel):
+    """記錄每次 transcribe 收到的語言選項"""
+
+    def __init__(self):
+        super().__init__("stub", latency_ms=0.0, rtf=0.0, segment_sec=5.0)
+        self.languages = []
+
+    def transcribe(self, audio, language=None, **options):
+        self.languages.append(language)
+        return super().transcribe(audio, language=language, **options)
+
+
+def test_long_audio_detects_language_through_backend():
+    model = _RecordingStubModel()
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, SAMPLE_RATE * 9).astype(np.float32)
+
+    _, segments, info = asyncio.run(transcribe_long_audio(audio, model=model, chunk_sec=3.0, parallelism=2))
+
+    assert info["chunks"] > 1
+    assert (info["language"], info["language_probability"]) == ("en", 1.0)
+    # 第一次調用是語言檢測，之後每個區塊都以檢測到的語言解碼
+    assert model.languages == [None] + ["en"] * info["chunks"]
+    assert segments
+
+
+def test_long_audio_default_parallelism_reserves_a_worker(monkeypatch):
+    from app.services.stt_executor import stt_executor
+
+    monkeypatch.setattr(stt_executor, "max_workers", 4)
+    audio = np.random.default_rng(0).uniform(-0.5, 0.5, SAMPLE_RATE * 9).astype(np.float32)
+
+    _, _, info = asyncio.run(transcribe_long_audio(audio, model=_RecordingStubModel(), chunk_sec=3.0, parallelism=0))
+
+    assert info["parallelism"] == 3
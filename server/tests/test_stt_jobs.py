@@ -0,0 +1,49 @@
+import asyncio
+import io
+import wave
+
+import numpy as np
+
+from app.services import stt_jobs
+from app.services.stt_backends import SAMPLE_RATE
+from app.services.stt_jobs import JOB_COMPLETED, JobManager
+from app.services.stt_result_cache import TranscriptionResultCache
+from app.services.stt_service import DEFAULT_MODEL_NAME
+
+
+def _wav_file(seconds: float) -> io.BytesIO:
+    samples = np.random.default_rng(0).uniform(-0.5, 0.5, int(SAMPLE_RATE * seconds))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((samples * 32767).astype(np.int16).tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+def test_cached_job_records_duration(tmp_path, monkeypatch):
+    monkeypatch.setattr(stt_jobs, "result_cache", TranscriptionResultCache(memory_items=8, directory=None, disk_budget_mb=0))
+    manager = JobManager(str(tmp_path), concurrency=1, retention_sec=3600)
+
+    async def run_job():
+        job = await manager.submit(_wav_file(6.0), "speech.wav", DEFAULT_MODEL_NAME, None, None)
+        for _ in range(500):
+            status = manager.status(job["id"])
+            if status["status"] == JOB_COMPLETED:
+                return status, manager.result(job["id"])
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"job did not complete: {status}")
+
+    async def run():
+        manager.start()
+        try:
+            return await run_job(), await run_job()
+        finally:
+            await manager.shutdown()
+
+    (first_status, first_result), (second_status, second_result) = asyncio.run(run())
+
+    assert (first_result["info"]["cached"], second_result["info"]["cached"]) == (False, True)
+    assert second_status["duration"] == first_status["duration"] == 6.0
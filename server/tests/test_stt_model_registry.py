@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+from app.services.stt_model_registry import ModelRegistry
+
+
+class _GatedLoader:
+    """"slow" 模型的載入在 release 之前一直阻塞，其他模型立即載入"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, path, compute_type):
+        self.calls.append(path)
+        if path == "/models/slow":
+            self.release.wait(5)
+        return object()
+
+
+def test_loading_a_model_does_not_block_other_models_on_the_event_loop():
+    loader = _GatedLoader()
+    registry = ModelRegistry({"default": "/models/default", "slow": "/models/slow"}, "default", loader)
+    registry.load("default")
+
+    async def run():
+        slow_loads = [asyncio.create_task(registry.acquire("slow")) for _ in range(3)]
+        await asyncio.sleep(0.05) # 載入已在背景線程中開始
+        started_at = time.perf_counter()
+        model = await asyncio.wait_for(registry.checkout("default"), timeout=1)
+        registry.release(model)
+        elapsed = time.perf_counter() - started_at
+        assert not any(task.done() for task in slow_loads)
+        loader.release.set()
+        slow_models = await asyncio.gather(*slow_loads)
+        return elapsed, slow_models
+
+    elapsed, slow_models = asyncio.run(run())
+
+    assert elapsed < 0.1
+    # 同名模型的並發載入只執行一次，所有請求者取得同一個模型並都被計入使用中
+    assert loader.calls.count("/models/slow") == 1
+    assert len({id(model) for model in slow_models}) == 1
+    assert registry.stats()["loaded_models"]["slow"]["in_use"] == 3
+
+
+def test_failed_load_is_raised_to_every_waiter_and_can_be_retried():
+    attempts = []
+
+    def loader(path, compute_type):
+        attempts.append(path)
+        if len(attempts) == 1:
+            time.sleep(0.05)
+            raise RuntimeError("corrupt model")
+        return object()
+
+    registry = ModelRegistry({"default": "/models/default"}, "default", loader)
+
+    async def run():
+        return await asyncio.gather(registry.acquire(), registry.acquire(), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert registry.load() is not None
+    assert len(attempts) == 2
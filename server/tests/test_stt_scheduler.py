@@ -0,0 +1,110 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from app.services.stt_backends import SAMPLE_RATE, StubBackend
+from app.services.stt_executor import STTExecutor
+from app.services.stt_scheduler import InferenceScheduler
+
+
+class _LanguageStubBackend(StubBackend):
+    """以音訊長度決定語言的模擬後端，記錄每次批次解碼的片段數與語言"""
+
+    def __init__(self):
+        super().__init__(latency_ms=0.0, rtf=0.0, segment_sec=5.0)
+        self.batches = []
+
+    def detect_language(self, model, audio, **options):
+        return ("de", 0.9) if len(audio) > SAMPLE_RATE else ("en", 0.8)
+
+    def transcribe_batch(self, model, audios, options):
+        self.batches.append((len(audios), options.get("language")))
+        return super().transcribe_batch(model, audios, options)
+
+
+def _speech(seconds: float, seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+
+def test_segments_without_language_are_batched_by_detected_language(monkeypatch):
+    backend = _LanguageStubBackend()
+    monkeypatch.setattr("app.services.stt_scheduler.stt_backend", backend)
+    model = backend.load_model("stub")
+
+    async def run():
+        scheduler = InferenceScheduler(window_ms=50, max_batch_size=8)
+        try:
+            clips = [_speech(0.5, 1), _speech(2.0, 2), _speech(0.8, 3), _speech(1.5, 4)]
+            return await asyncio.gather(*(scheduler.transcribe(model, clip, {"beam_size": 1}) for clip in clips)), scheduler.stats()
+        finally:
+            await scheduler.shutdown()
+
+    results, stats = asyncio.run(run())
+
+    assert stats["batches_dispatched"] == 1 and stats["last_batch_size"] == 4
+    assert sorted(backend.batches) == [(2, "de"), (2, "en")]
+    assert [(info.language, info.language_probability) for _, info in results] == [("en", 0.8), ("de", 0.9), ("en", 0.8), ("de", 0.9)]
+    assert all(segments and segments[0].text for segments, _ in results)
+
+
+class _GatedStubBackend(StubBackend):
+    """解碼開始時通知 started，並阻塞到 gate 打開"""
+
+    def __init__(self):
+        super().__init__(latency_ms=0.0, rtf=0.0, segment_sec=5.0)
+        self.started = threading.Event()
+        self.gate = threading.Event()
+
+    def transcribe(self, model, audio, **options):
+        self.started.set()
+        self.gate.wait(5)
+        return super().transcribe(model, audio, **options)
+
+
+async def _wait_until(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_abandoned_batch_is_withdrawn_only_before_decoding(monkeypatch):
+    backend = _GatedStubBackend()
+    executor = STTExecutor(max_workers=1, max_pending=8)
+    monkeypatch.setattr("app.services.stt_scheduler.stt_backend", backend)
+    monkeypatch.setattr("app.services.stt_scheduler.stt_executor", executor)
+    model = backend.load_model("stub")
+
+    async def run():
+        scheduler = InferenceScheduler(window_ms=1, max_batch_size=8)
+        try:
+            # 唯一的工作線程被佔用: 被放棄的片段還在隊列中，撤回並計為省下的解碼
+            blocker = executor.submit(backend.gate.wait, 5)
+            queued = asyncio.create_task(scheduler.transcribe(model, _speech(1.0, 1), {}))
+            await _wait_until(lambda: executor.stats()["in_flight"] == 2)
+            queued.cancel()
+            await _wait_until(lambda: scheduler.stats()["segments_cancelled"] == 1)
+            assert executor.stats()["in_flight"] == 1 and executor.jobs_cancelled == 1
+            backend.gate.set()
+            await asyncio.wrap_future(blocker)
+
+            # 已開始的解碼無法中斷: 不計為省下，佔用的名額直到線程結束才釋放
+            backend.gate.clear()
+            running = asyncio.create_task(scheduler.transcribe(model, _speech(1.0, 2), {}))
+            await asyncio.to_thread(backend.started.wait, 5)
+            running.cancel()
+            await asyncio.sleep(0.05)
+            assert scheduler.stats()["segments_cancelled"] == 1
+            assert executor.stats()["in_flight"] == 1
+            backend.gate.set()
+            await _wait_until(lambda: scheduler.stats()["results_discarded"] == 1)
+            await _wait_until(lambda: executor.stats()["in_flight"] == 0)
+            assert executor.jobs_completed == 2 and executor.jobs_cancelled == 1
+        finally:
+            backend.gate.set()
+            await scheduler.shutdown()
+            executor.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,114 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.stt_backends import SAMPLE_RATE
+from app.services.stt_scheduler import inference_scheduler
+from app.services.stt_service import (DEFAULT_MODEL_NAME, AudioTranscriptionStreamer, model_registry,
+                                      stream_transcription, transcribe_audio_array)
+
+DECODE_LATENCY_SEC = 0.5
+HEARTBEAT_INTERVAL_SEC = 0.01
+MAX_HEARTBEAT_LAG_SEC = 0.1 # 遠小於解碼耗時: 解碼若在事件循環上執行，延遲至少為 DECODE_LATENCY_SEC
+
+
+@pytest.fixture
+def slow_stub_model():
+    """以模擬後端載入默認模型，並將每次解碼的固定延遲調高"""
+    model = model_registry.load(DEFAULT_MODEL_NAME)
+    original_latency, model.latency_sec = model.latency_sec, DECODE_LATENCY_SEC
+    yield model
+    model.latency_sec = original_latency
+
+
+def _speech(seconds: float, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).uniform(-0.5, 0.5, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+
+async def _max_heartbeat_lag(work) -> tuple:
+    """在 work 執行期間每 HEARTBEAT_INTERVAL_SEC 醒來一次，返回 (work 的結果, 最大心跳延遲, work 耗時)"""
+    lags = []
+    finished = asyncio.Event()
+
+    async def heartbeat():
+        while not finished.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(HEARTBEAT_INTERVAL_SEC)
+            lags.append(time.perf_counter() - before - HEARTBEAT_INTERVAL_SEC)
+
+    beat_task = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0) # 讓心跳先開始計時
+    started_at = time.perf_counter()
+    try:
+        result = await work
+    finally:
+        elapsed = time.perf_counter() - started_at
+        finished.set()
+        await beat_task
+    return result, max(lags), elapsed
+
+
+def test_streaming_segment_decode_does_not_block_event_loop(slow_stub_model):
+    async def run():
+        streamer = AudioTranscriptionStreamer()
+        try:
+            async def transcribe():
+                return [message async for message in streamer._transcribe_segment(_speech(2.0), start_time=0.0)]
+            return await _max_heartbeat_lag(transcribe())
+        finally:
+            streamer.close()
+            await inference_scheduler.shutdown()
+
+    messages, max_lag, elapsed = asyncio.run(run())
+
+    assert [message["type"] for message in messages] == ["final"]
+    assert elapsed >= DECODE_LATENCY_SEC
+    assert max_lag < MAX_HEARTBEAT_LAG_SEC
+
+
+def test_file_transcription_does_not_block_event_loop(slow_stub_model):
+    async def run():
+        async def transcribe():
+            return [item async for item in stream_transcription(_speech(3.0), model=slow_stub_model)]
+        return await _max_heartbeat_lag(transcribe())
+
+    items, max_lag, elapsed = asyncio.run(run())
+
+    assert [item["type"] for item in items][:2] == ["info", "segment"]
+    assert elapsed >= DECODE_LATENCY_SEC
+    assert max_lag < MAX_HEARTBEAT_LAG_SEC
+
+
+class _LoopingModel:
+    """第一次解碼陷入 "Thank you." 循環；從循環之後重新解碼時產生正常文本"""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append((len(audio), options))
+        if len(self.calls) == 1:
+            texts = ["Hello world.", "Thank you.", "Thank you.", "Thank you.", "Thank you.", "Never reached."]
+        else:
+            texts = ["Goodbye."]
+        segments = (SimpleNamespace(start=float(index), end=float(index + 1), text=text, no_speech_prob=0.01, avg_logprob=-0.2)
+                    for index, text in enumerate(texts))
+        info = SimpleNamespace(language="en", language_probability=0.99, duration=len(audio) / SAMPLE_RATE)
+        return segments, info
+
+
+def test_file_transcription_drops_repeated_segments_before_the_loop_trigger():
+    model = _LoopingModel()
+    full_text, segments, info = transcribe_audio_array(np.zeros(SAMPLE_RATE * 10, dtype=np.float32), model=model)
+
+    # 第一次出現保留，之後的重複 (包括觸發前已解碼的) 都不在輸出中
+    assert [segment["text"] for segment in segments] == ["Hello world.", "Thank you.", "Goodbye."]
+    assert full_text == "Hello world. Thank you. Goodbye."
+    assert [segment["start"] for segment in segments] == [0.0, 1.0, 4.0]
+    assert info["repetition_loops"] == 1
+    assert info["repetition_segments_dropped"] == 2
+    # 從觸發片段 (第三個 "Thank you.") 的結尾重新解碼
+    assert model.calls[1][0] == SAMPLE_RATE * 6
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from app.services.stt_service import DEFAULT_MODEL_NAME, AudioTranscriptionStreamer, model_registry
+from app.services.stt_stream_pipeline import StreamingSessionPipeline, streaming_stats
+
+
+class _FakeWebSocket:
+    """送出若干音訊塊後一直等待 (客戶端保持連接但不再發送)"""
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self.sent = []
+
+    async def receive(self):
+        if self._chunks:
+            return {"type": "websocket.receive", "bytes": self._chunks.pop(0)}
+        await asyncio.Event().wait()
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+    async def close(self, code=1000, reason=None):
+        pass
+
+
+class _ClosingSpyStreamer(AudioTranscriptionStreamer):
+    def __init__(self):
+        super().__init__()
+        self.close_calls = 0
+
+    def close(self):
+        self.close_calls += 1
+        super().close()
+
+
+@pytest.fixture(autouse=True)
+def stub_model():
+    model_registry.load(DEFAULT_MODEL_NAME)
+
+
+def test_unexpected_stage_error_releases_session_resources():
+    async def run():
+        streamer = _ClosingSpyStreamer()
+
+        async def broken_segment_audio_chunk(*args, **kwargs):
+            raise RuntimeError("VAD failure")
+            yield
+
+        streamer.segment_audio_chunk = broken_segment_audio_chunk
+        pipeline = StreamingSessionPipeline(_FakeWebSocket([b"\x00" * 960]), streamer, reconnect_grace_sec=0)
+        with pytest.raises(RuntimeError, match="VAD failure"):
+            await pipeline.run()
+        return streamer, streaming_stats()
+
+    streamer, stats = asyncio.run(run())
+
+    assert streamer.close_calls >= 1 and streamer._closed
+    assert stats["sessions_active"] == 0
+
+
+def test_cancelled_session_releases_session_resources():
+    async def run():
+        streamer = _ClosingSpyStreamer()
+        pipeline = StreamingSessionPipeline(_FakeWebSocket([b"\x00" * 960] * 4), streamer, reconnect_grace_sec=0)
+        task = asyncio.create_task(pipeline.run())
+        await asyncio.sleep(0.05)
+        assert streaming_stats()["sessions_active"] == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return streamer, streaming_stats()
+
+    streamer, stats = asyncio.run(run())
+
+    assert streamer._closed
+    assert stats["sessions_active"] == 0
@@ -0,0 +1,12 @@
+import pytest
+
+from app.services.vad_engine import VADEngine, WebRTCVADEngine
+
+
+def test_vad_engine_requires_classify():
+    class IncompleteEngine(VADEngine):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteEngine()
+    WebRTCVADEngine().close()